@@ -5,7 +5,7 @@ import logging
 import mimetypes
 import time
 from gettext import NullTranslations, translation
-from typing import Optional, List, Callable
+from typing import Optional, List, Callable, Tuple
 from xmlrpc.server import SimpleXMLRPCServer
 
 import telegram  # lgtm [py/import-and-import-from]
@@ -14,7 +14,7 @@ import telegram.error
 from PIL import Image, WebPImagePlugin
 from pkg_resources import resource_filename
 from ruamel.yaml import YAML
-from telegram import Message, Update
+from telegram import Message, Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import CommandHandler, CallbackQueryHandler, CallbackContext, Filters
 
 import ehforwarderbot  # lgtm [py/import-and-import-from]
@@ -29,13 +29,14 @@ from ehforwarderbot.exceptions import EFBException, EFBOperationNotSupported, EF
     EFBMessageReactionNotPossible
 from ehforwarderbot.status import ReactToMessage
 from ehforwarderbot.types import ModuleID, InstanceID, MessageID
-from . import utils as etm_utils
+from . import utils as etm_utils, msg_log_search
 from .__version__ import __version__
 from .bot_manager import TelegramBotManager
 from .chat_binding import ChatBindingManager
 from .chat_destination_cache import ChatDestinationCache
 from .chat_object_cache import ChatObjectCacheManager
 from .commands import CommandsManager
+from .conversation_store import ConversationStore
 from .db import DatabaseManager
 from .master_message import MasterMessageProcessor
 from .message import ETMMsg
@@ -78,6 +79,7 @@ class TelegramChannel(MasterChannel):
     timeout_count = 0
     last_poll_confliction_time = 0.0
     CONFLICTION_TIMEOUT = 60  # seconds since last confliction warnings received
+    SEARCH_RESULTS_PER_PAGE = 10
 
     # Constants
     config: dict
@@ -125,8 +127,10 @@ class TelegramChannel(MasterChannel):
         self.chat_manager: ChatObjectCacheManager = ChatObjectCacheManager(self)
         self.chat_dest_cache: ChatDestinationCache = ChatDestinationCache(self.flag("send_to_last_chat"))
         self.bot_manager: TelegramBotManager = TelegramBotManager(self)
+        self.conversation_store: ConversationStore = ConversationStore(self)
         self.commands: CommandsManager = CommandsManager(self)
         self.chat_binding: ChatBindingManager = ChatBindingManager(self)
+        self.conversation_store.load()
         self.slave_messages: SlaveMessageProcessor = SlaveMessageProcessor(self)
 
         if not self.flag('auto_locale'):
@@ -142,6 +146,12 @@ class TelegramChannel(MasterChannel):
             CommandHandler("help", self.help, filters=non_edit_filter))
         self.bot_manager.dispatcher.add_handler(
             CommandHandler("info", self.info, filters=non_edit_filter))
+        self.bot_manager.dispatcher.add_handler(
+            CommandHandler("search", self.search, filters=non_edit_filter))
+        self.bot_manager.dispatcher.add_handler(
+            CallbackQueryHandler(self.search_page, pattern=r"^search \d+$"))
+        self.bot_manager.dispatcher.add_handler(
+            CallbackQueryHandler(self.search_jump, pattern=r"^search_jump "))
         self.bot_manager.dispatcher.add_handler(
             CallbackQueryHandler(self.void_callback_handler, pattern="void"))
         self.bot_manager.dispatcher.add_handler(
@@ -355,7 +365,7 @@ class TelegramChannel(MasterChannel):
             return
 
         if not reaction:
-            msg_log_obj: ETMMsg = msg_log.build_etm_msg(self.chat_manager)
+            msg_log_obj: ETMMsg = msg_log.build_etm_msg(self.chat_manager, db=self.db)
             reactors = msg_log_obj.reactions
             if not reactors:
                 message.reply_html(self._("This message has no reactions yet. "
@@ -413,6 +423,96 @@ class TelegramChannel(MasterChannel):
             message.reply_text(prompt)
             return
 
+    def search(self, update: Update, context: CallbackContext):
+        """Search for recorded messages by their text."""
+        message: Message = update.effective_message
+        if not self.db.search_available:
+            message.reply_text(self._("Search is not available with the current database. "
+                                      "It requires the sqlite database backend, and SQLite 3.34 "
+                                      "or later built with FTS5."))
+            return
+        if not context.args:
+            message.reply_html(self._("Send this command followed by words to search for "
+                                      "in recorded messages. "
+                                      "Ex.: <code>/search train ticket</code>."))
+            return
+        text, markup = self.build_search_results(message.chat_id, " ".join(context.args), 0)
+        # Quote the command even in private chats, as pages are built from it
+        message.reply_html(text, reply_markup=markup, disable_web_page_preview=True, quote=True)
+
+    def search_page(self, update: Update, context: CallbackContext):
+        """Show another page of search results.
+
+        The query is read from the command message that the results
+        reply to, so that no state is kept for result messages.
+        """
+        query = update.callback_query
+        command = query.message.reply_to_message
+        args = command and command.text and command.text.split(maxsplit=1)
+        if not args or len(args) < 2:
+            self.bot_manager.session_expired(update, context)
+            return
+        offset = int(query.data.split()[1])
+        text, markup = self.build_search_results(query.message.chat_id, args[1], offset)
+        self.bot_manager.edit_message_text(chat_id=query.message.chat_id, message_id=query.message.message_id,
+                                           text=text, reply_markup=markup, parse_mode="HTML",
+                                           disable_web_page_preview=True)
+        self.bot_manager.answer_callback_query(query.id)
+
+    def search_jump(self, update: Update, context: CallbackContext):
+        """Reply to a message in search results, so that it can be
+        jumped to from the reply.
+        """
+        query = update.callback_query
+        chat_id, message_id = etm_utils.message_id_str_to_id(etm_utils.TgChatMsgIDStr(query.data.split()[1]))
+        try:
+            self.bot_manager.send_message(chat_id, "⤴️", reply_to_message_id=int(message_id))
+        except telegram.error.BadRequest:
+            self.bot_manager.answer_callback_query(query.id, text=self._("This message is no longer available."))
+            return
+        self.bot_manager.answer_callback_query(query.id)
+
+    def build_search_results(self, chat_id: int, query: str, offset: int) -> Tuple[str, InlineKeyboardMarkup]:
+        """Build a page of search results of recorded messages.
+
+        Messages in all chats are searched in private chats with the bot,
+        otherwise only messages in the current chat are searched.
+
+        Returns:
+            Text of the page in HTML, and buttons to jump to results in the
+            current chat and to turn pages.
+        """
+        per_page = self.SEARCH_RESULTS_PER_PAGE
+        master_chat_id = None if chat_id in self.config['admins'] else str(chat_id)
+        results = self.db.search_msg_log(query, master_chat_id=master_chat_id, offset=offset, limit=per_page + 1)
+        if not results:
+            return self._("No recorded message is found with “{query}”.").format(query=html.escape(query)), \
+                InlineKeyboardMarkup([])
+        text = self._("Recorded messages with “{query}”:").format(query=html.escape(query))
+        jump_buttons: List[InlineKeyboardButton] = []
+        for idx, result in enumerate(results[:per_page], start=offset + 1):
+            channel_id, chat_uid, _ = etm_utils.chat_id_str_to_id(result['slave_origin_uid'])
+            chat = self.chat_manager.get_chat(channel_id, chat_uid)
+            chat_name = chat.full_name if chat else chat_uid
+            time_str = result['time'].strftime("%Y-%m-%d %H:%M")
+            if result['link']:
+                time_str = f'<a href="{result["link"]}">{time_str}</a>'
+            excerpt = msg_log_search.excerpt(result['text'], query) or f"[{result['msg_type']}]"
+            text += f"\n\n{idx}. {time_str} · {html.escape(chat_name)}\n{html.escape(excerpt)}"
+            if str(chat_id) == etm_utils.message_id_str_to_id(result['master_msg_id'])[0]:
+                jump_buttons.append(InlineKeyboardButton(str(idx),
+                                                         callback_data=f"search_jump {result['master_msg_id']}"))
+        rows = [jump_buttons[i:i + 5] for i in range(0, len(jump_buttons), 5)]
+        page_row: List[InlineKeyboardButton] = []
+        if offset > 0:
+            page_row.append(InlineKeyboardButton(self._("< Prev"),
+                                                 callback_data=f"search {max(0, offset - per_page)}"))
+        if len(results) > per_page:
+            page_row.append(InlineKeyboardButton(self._("Next >"), callback_data=f"search {offset + per_page}"))
+        if page_row:
+            rows.append(page_row)
+        return text, InlineKeyboardMarkup(rows)
+
     def help(self, update: Update, context: CallbackContext):
         txt = self._("EFB Telegram Master Channel\n"
                      "/link\n"
@@ -434,6 +534,8 @@ class TelegramChannel(MasterChannel):
                      "    Only works in singly linked group where the bot is an admin.\n"
                      "/rm\n"
                      "    Remove the quoted message from its remote chat.\n"
+                     "/search [words]\n"
+                     "    Search for recorded messages by their text.\n"
                      "/help\n"
                      "    Print this command list.")
         self.bot_manager.send_message(update.message.from_user.id, txt)
@@ -509,12 +611,9 @@ class TelegramChannel(MasterChannel):
         except telegram.error.ChatMigrated as e:
             new_id = e.new_chat_id
             old_id = update.message.chat_id
-            count = 0
-            for i in self.db.get_chat_assoc(master_uid=etm_utils.chat_id_to_str(self.channel_id, old_id)):
-                self.logger.debug('Migrating slave chat %s from Telegram chat %s to %s.', i, old_id, new_id)
-                self.db.remove_chat_assoc(slave_uid=i)
-                self.db.add_chat_assoc(master_uid=etm_utils.chat_id_to_str(self.channel_id, new_id), slave_uid=i)
-                count += 1
+            self.logger.debug('Migrating slave chats from Telegram chat %s to %s.', old_id, new_id)
+            count = self.db.migrate_chat_assoc(etm_utils.chat_id_to_str(self.channel_id, old_id),
+                                               etm_utils.chat_id_to_str(self.channel_id, new_id))
             self.bot_manager.send_message(
                 new_id, self.ngettext("Chat migration detected.\n"
                                       "All {count} remote chat are now linked to this new group.",
@@ -551,7 +650,7 @@ class TelegramChannel(MasterChannel):
         msg_log = self.db.get_msg_log(slave_origin_uid=origin_uid,
                                       slave_msg_id=msg_id)
         if msg_log is not None:
-            return msg_log.build_etm_msg(self.chat_manager)
+            return msg_log.build_etm_msg(self.chat_manager, db=self.db)
         else:
             # Message is not found.
             return None
@@ -567,6 +666,8 @@ class TelegramChannel(MasterChannel):
         self.rpc_utilities.shutdown()
         self.bot_manager.graceful_stop()
         self.master_messages.stop_worker()
+        self.conversation_store.stop()
+        self.chat_manager.stop()
         self.db.stop_worker()
         self.logger.debug("%s (%s) gracefully stopped.", self.channel_name, self.channel_id)
 
@@ -1,10 +1,10 @@
 import copy
 import pickle
-import time
+import sys
 from abc import ABC
 from contextlib import suppress
 from datetime import datetime
-from typing import Optional, TYPE_CHECKING, Pattern, List, Dict, Any, Union, TypeVar, overload, MutableSequence
+from typing import Optional, TYPE_CHECKING, Callable, Pattern, List, Dict, Any, Union, TypeVar, overload, MutableSequence
 
 from ehforwarderbot import Middleware, coordinator
 from ehforwarderbot.channel import SlaveChannel
@@ -20,7 +20,7 @@ if TYPE_CHECKING:
 
 __all__ = ['ETMChatMember', 'ETMSelfChatMember', 'ETMSystemChatMember',
            'ETMPrivateChat', 'ETMSystemChat', 'ETMGroupChat',
-           'convert_chat', 'unpickle',
+           'convert_chat', 'unpickle', 'unpickle_member',
            'ETMChatType', 'ETMBaseChatType']
 
 
@@ -61,7 +61,48 @@ class ETMBaseChatMixin(BaseChat, ABC):  # lgtm [py/missing-equals]
         return obj
 
 
+def _store_on_write(method: Callable) -> Callable:
+    def wrapper(self: '_VendorSpecific', *args, **kwargs):
+        result = method(self, *args, **kwargs)
+        if self.member.__dict__.get('vendor_specific') is None:
+            self.member.__dict__['vendor_specific'] = self
+        return result
+    return wrapper
+
+
+class _VendorSpecific(dict):
+    """``vendor_specific`` of a member without vendor specific attributes,
+    only stored in the member once it is modified. Pickled as a plain dict.
+    """
+    __slots__ = ('member',)
+
+    def __init__(self, member: 'ETMChatMember'):
+        super().__init__()
+        self.member = member
+
+    __setitem__ = _store_on_write(dict.__setitem__)
+    __ior__ = _store_on_write(dict.__ior__)
+    setdefault = _store_on_write(dict.setdefault)
+    update = _store_on_write(dict.update)
+
+    def __reduce__(self):
+        return dict, (dict(self),)
+
+
+def _intern(value: Any) -> Any:
+    return sys.intern(value) if type(value) is str else value
+
+
 class ETMChatMember(ETMBaseChatMixin, ChatMember):
+    """Member of an ETM chat.
+
+    As there may be hundreds of thousands of members, only what differs
+    among them is stored per object: the database manager is taken from
+    the chat, module strings are interned, and empty ``vendor_specific``
+    dicts are not kept until they are modified. The framework classes
+    define no ``__slots__``, so attributes are still kept in an instance
+    dict.
+    """
     chat_type_name = "ChatMember"
 
     def __init__(self, db: 'DatabaseManager', chat: 'Chat', *, name: str = "", alias: Optional[str] = None,
@@ -69,6 +110,58 @@ class ETMChatMember(ETMBaseChatMixin, ChatMember):
                  middleware: Optional[Middleware] = None):
         super().__init__(db, chat, name=name, alias=alias, uid=uid, vendor_specific=vendor_specific,
                          description=description, middleware=middleware)
+        self.compact()
+
+    @property  # type: ignore
+    def db(self) -> 'DatabaseManager':
+        """Database manager of the chat of this member."""
+        return self.chat.db
+
+    @db.setter
+    def db(self, value: 'DatabaseManager'):
+        # Members always use the database manager of their chats
+        pass
+
+    @property  # type: ignore
+    def vendor_specific(self) -> Dict[str, Any]:
+        value = self.__dict__.get('vendor_specific')
+        return _VendorSpecific(self) if value is None else value
+
+    @vendor_specific.setter
+    def vendor_specific(self, value: Dict[str, Any]):
+        self.__dict__['vendor_specific'] = value
+
+    def compact(self):
+        """Intern module strings and drop an empty ``vendor_specific``."""
+        self.module_id = _intern(self.module_id)
+        self.module_name = _intern(self.module_name)
+        self.channel_emoji = _intern(self.channel_emoji)
+        value = self.__dict__.get('vendor_specific')
+        if value is not None and not value and type(value) is dict:
+            # Kept as ``None`` rather than deleted, to keep the attribute layout
+            self.__dict__['vendor_specific'] = None
+
+    def __getstate__(self) -> Dict[str, Any]:
+        state = super().__getstate__()
+        if state.get('vendor_specific') is None:
+            state['vendor_specific'] = {}
+        return state
+
+    def __setstate__(self, state: Dict[str, Any]):
+        # ``db`` of pickles from earlier versions is dropped by ``__getstate__``
+        state.pop('db', None)
+        # Set attributes one by one rather than updating ``__dict__``, so
+        # that CPython can keep them in its compact per-class layout.
+        for key, value in state.items():
+            setattr(self, key, value)
+        self.compact()
+
+    @property
+    def pickle(self) -> bytes:
+        """Pickle of this member without the chat it belongs to."""
+        state = self.__getstate__()
+        state.pop('chat', None)
+        return pickle.dumps((type(self), state))
 
 
 class ETMSelfChatMember(ETMChatMember, SelfChatMember):
@@ -92,18 +185,56 @@ class ETMSystemChatMember(ETMChatMember, SystemChatMember):
 
 
 class ETMChatMixin(ETMBaseChatMixin, Chat, ABC):
-    _last_message_time: Optional[datetime] = None
-    _last_message_time_query: float = 0
-    LAST_MESSAGE_QUERY_TIMEOUT_MS: float = 60000  # 60s
-
-    _linked: Optional[List[EFBChannelChatIDStr]] = None
-
     members: MutableSequence[ETMChatMember]  # type: ignore
     self: Optional[ETMSelfChatMember]
 
     chat_type_name = "Chat"
     chat_type_emoji = Emoji.UNKNOWN
 
+    # Index of members by ID, for the list in ``_indexed_members`` when it
+    # has ``_indexed_count`` members. Built on lookup if ``members`` is
+    # replaced or changed elsewhere, and not pickled.
+    _member_index: Optional[Dict[ChatID, ETMChatMember]] = None
+    _indexed_members: Optional[MutableSequence[ETMChatMember]] = None
+    _indexed_count = 0
+
+    def __getstate__(self) -> Dict[str, Any]:
+        state = super().__getstate__()
+        for key in ('_member_index', '_indexed_members', '_indexed_count'):
+            state.pop(key, None)
+        return state
+
+    def rebuild_member_index(self):
+        """Rebuild the index of members on the next lookup.
+
+        Only needed when ID of a member is changed, replacing the list or
+        appending to ``members`` is detected automatically.
+        """
+        self._member_index = None
+
+    def _get_member_index(self) -> Dict[ChatID, ETMChatMember]:
+        members = self.members
+        if self._member_index is None or self._indexed_members is not members or \
+                self._indexed_count != len(members):
+            index: Dict[ChatID, ETMChatMember] = {}
+            for i in members:
+                # Keep the first one among duplicate IDs like a linear scan
+                index.setdefault(i.uid, i)
+            self._member_index = index
+            self._indexed_members = members
+            self._indexed_count = len(members)
+        return self._member_index
+
+    def _append_member(self, member: ETMChatMember):
+        """Append a member, and add it to the index if it is up to date."""
+        up_to_date = self._member_index is not None and self._indexed_members is self.members and \
+            self._indexed_count == len(self.members)
+        self.members.append(member)
+        if up_to_date:
+            assert self._member_index is not None  # for type check
+            self._member_index.setdefault(member.uid, member)
+            self._indexed_count += 1
+
     def match(self, pattern: Union[Pattern, str, None]) -> bool:
         """
         Match the chat against a compiled regex pattern or string
@@ -134,46 +265,47 @@ class ETMChatMixin(ETMBaseChatMixin, Chat, ABC):
         """
         if pattern is None:
             return True
-        mode = []
-        if self.linked:
-            mode.append("Linked")
-        mode_str = ', '.join(mode)
-        entry_string = f"Channel: {self.module_name}\n" \
-                       f"Channel ID: {self.module_id}\n" \
-                       f"Name: {self.name}\n" \
-                       f"Alias: {self.alias}\n" \
-                       f"ID: {self.uid}\n" \
-                       f"Type: {self.chat_type_name}\n" \
-                       f"Mode: {mode_str}\n" \
-                       f"Description: {self.description}\n" \
-                       f"Notification: {self.notification.name}\n" \
-                       f"Other: {self.vendor_specific}"
+        entry_string = self.get_entry_string()
         if isinstance(pattern, str):
             return pattern.lower() in entry_string.lower()
         else:  # pattern is re.Pattern
             return bool(pattern.search(entry_string))
 
+    def get_entry_string(self, linked: Optional[bool] = None) -> str:
+        """String matched against filters in ``match``.
+
+        Args:
+            linked: If the chat is linked, looked up if not provided.
+        """
+        if linked is None:
+            linked = bool(self.linked)
+        mode = []
+        if linked:
+            mode.append("Linked")
+        mode_str = ', '.join(mode)
+        return f"Channel: {self.module_name}\n" \
+               f"Channel ID: {self.module_id}\n" \
+               f"Name: {self.name}\n" \
+               f"Alias: {self.alias}\n" \
+               f"ID: {self.uid}\n" \
+               f"Type: {self.chat_type_name}\n" \
+               f"Mode: {mode_str}\n" \
+               f"Description: {self.description}\n" \
+               f"Notification: {self.notification.name}\n" \
+               f"Other: {self.vendor_specific}"
+
     def unlink(self):
         """ Unlink this chat from any Telegram group."""
         self.db.remove_chat_assoc(slave_uid=utils.chat_id_to_str(self.module_id, self.uid))
-        self._update_linked()
 
     def link(self, channel_id: ModuleID, chat_id: ChatID, multiple_slave: bool):
         self.db.add_chat_assoc(master_uid=utils.chat_id_to_str(channel_id, chat_id),
                                slave_uid=utils.chat_id_to_str(self.module_id, self.uid),
                                multiple_slave=multiple_slave)
-        self._update_linked()
 
     @property
     def linked(self) -> List[EFBChannelChatIDStr]:
-        if self._linked is None:
-            self._update_linked()
-        return self._linked or []
-
-    def _update_linked(self):
-        self._linked = self.db.get_chat_assoc(
-            slave_uid=utils.chat_id_to_str(self.module_id, self.uid)
-        )
+        return self.db.get_chat_assoc(slave_uid=utils.chat_id_to_str(self.module_id, self.uid))
 
     @property
     def full_name(self) -> str:
@@ -208,21 +340,15 @@ class ETMChatMixin(ETMBaseChatMixin, Chat, ABC):
         """Time of the last recorded message from this chat.
         Returns ``datetime.min`` when no recorded message is found.
         """
-        now = time.time()
-        if self._last_message_time is None or \
-                now - self._last_message_time_query < self.LAST_MESSAGE_QUERY_TIMEOUT_MS:
-            msg_log = self.db.get_last_message(slave_chat_id=utils.chat_id_to_str(chat=self))
-            self._last_message_time_query = now
-            if msg_log is None:
-                self._last_message_time = datetime.min
-            else:
-                self._last_message_time = msg_log.time
-        assert self._last_message_time
-        return self._last_message_time
+        return self.db.get_last_message_time(utils.chat_id_to_str(chat=self)) or datetime.min
 
-    def update_to_db(self):
-        """Update this object to database."""
-        self.db.set_slave_chat_info(self)
+    def update_to_db(self, members: bool = True):
+        """Update this object to database.
+
+        Args:
+            members: Also update members of a group chat.
+        """
+        self.db.set_slave_chat_info(self, members)
 
     @property
     def pickle(self) -> bytes:
@@ -230,15 +356,14 @@ class ETMChatMixin(ETMBaseChatMixin, Chat, ABC):
 
     def remove_from_db(self):
         super().remove_from_db()
-        for i in self.members:
-            self.db.delete_slave_chat_info(self.module_id, i.uid, self.uid)
+        self.db.delete_chat_members(self.module_id, self.uid)
 
     def add_self(self) -> ETMSelfChatMember:
         if getattr(self, 'self', None) and isinstance(self.self, ETMSelfChatMember):
             return self.self
         assert not any(isinstance(i, SelfChatMember) for i in self.members)
         s = ETMSelfChatMember(self.db, self)
-        self.members.append(s)
+        self._append_member(s)
         return s
 
     def add_member(self, name: str, uid: ChatID, alias: Optional[str] = None,  # type: ignore
@@ -249,7 +374,7 @@ class ETMChatMixin(ETMBaseChatMixin, Chat, ABC):
         member = ETMChatMember(self.db, self, name=name, alias=alias, uid=uid,
                                vendor_specific=vendor_specific, description=description,
                                middleware=middleware)
-        self.members.append(member)
+        self._append_member(member)
         return member
 
     # type: ignore
@@ -261,7 +386,7 @@ class ETMChatMixin(ETMBaseChatMixin, Chat, ABC):
         member = self.make_system_member(name=name, alias=alias, uid=uid,
                                          vendor_specific=vendor_specific, description=description,
                                          middleware=middleware)
-        self.members.append(member)
+        self._append_member(member)
         return member
 
     def make_system_member(self, name: str = "", alias: Optional[str] = None, id: ChatID = ChatID(""),
@@ -273,7 +398,21 @@ class ETMChatMixin(ETMBaseChatMixin, Chat, ABC):
                                    vendor_specific=vendor_specific, description=description, middleware=middleware)
 
     def get_member(self, member_id: ChatID) -> ETMChatMember:
-        return super().get_member(member_id)  # type: ignore
+        """Find a member of chat by its ID.
+
+        Raises:
+            KeyError: when the ID provided is not found.
+        """
+        member = self._get_member_index().get(member_id)
+        if member is not None and member.uid == member_id:
+            return member
+        if member is not None:
+            # ID of the member is changed after it is indexed
+            self.rebuild_member_index()
+            member = self._get_member_index().get(member_id)
+            if member is not None:
+                return member
+        raise KeyError(member_id)
 
 
 class ETMPrivateChat(ETMChatMixin, PrivateChat):
@@ -328,6 +467,24 @@ class ETMGroupChat(ETMChatMixin, GroupChat):
                          module_id=module_id, name=name, alias=alias, uid=uid, vendor_specific=vendor_specific,
                          description=description, notification=notification, with_self=with_self)
 
+    @property
+    def pickle(self) -> bytes:
+        """Pickle of this chat without its members, which are stored
+        separately in the database by ``DatabaseManager.set_chat_members``.
+        """
+        state = self.__getstate__()
+        state['members'] = []
+        state['self'] = None
+        obj = type(self).__new__(type(self))
+        obj.__dict__.update(state)
+        return pickle.dumps(obj)
+
+    def load_members(self):
+        """Load members of this chat from the database."""
+        self.members = [unpickle_member(i.pickle, self, self.db) for i in
+                        self.db.get_chat_members(self.module_id, self.uid)]
+        self.self = next((i for i in self.members if isinstance(i, SelfChatMember)), None)
+
 
 # Class name alias for type checking
 ETMChatType = ETMChatMixin
@@ -370,6 +527,7 @@ def convert_chat(db: 'DatabaseManager', chat: Chat) -> ETMChatType:
             copy_member(chat.self, etm_chat.self)
         if chat.self is not chat.other and chat.other and etm_chat.other:
             copy_member(chat.other, etm_chat.other)
+        etm_chat.rebuild_member_index()
         return etm_chat
     if isinstance(chat, SystemChat):
         etm_chat = ETMSystemChat(db, module_id=chat.module_id, module_name=chat.module_name,
@@ -381,6 +539,7 @@ def convert_chat(db: 'DatabaseManager', chat: Chat) -> ETMChatType:
             copy_member(chat.self, etm_chat.self)
         if chat.other and etm_chat.other:
             copy_member(chat.other, etm_chat.other)
+        etm_chat.rebuild_member_index()
         return etm_chat
     if isinstance(chat, GroupChat):
         etm_chat = ETMGroupChat(db, module_id=chat.module_id, module_name=chat.module_name,
@@ -390,6 +549,7 @@ def convert_chat(db: 'DatabaseManager', chat: Chat) -> ETMChatType:
         assert isinstance(etm_chat, ETMGroupChat)  # for type check
         for i in chat.members:
             if isinstance(i, ETMChatMember):
+                i.chat = etm_chat
                 etm_chat.members.append(i)
             elif isinstance(i, SystemChatMember):
                 etm_chat.add_system_member(
@@ -422,9 +582,34 @@ def copy_member(source: ChatMember, dest: ETMChatMember):
     dest.module_name = source.module_name
     dest.channel_emoji = source.channel_emoji
     dest.description = source.description
+    dest.compact()
 
 
-def unpickle(data: bytes, db: 'DatabaseManager') -> ETMChatType:
+def unpickle(data: bytes, db: 'DatabaseManager', members: bool = True) -> ETMChatType:
+    """Restore a chat from its pickle.
+
+    Args:
+        data: Pickle of the chat.
+        db: Database manager.
+        members: Load members of a group chat from the database.
+    """
     obj = pickle.loads(data)
     obj.db = db
+    if isinstance(obj, ETMGroupChat):
+        if obj.members:
+            # Pickles saved before members are stored separately contain
+            # all members, move them to the member table, and rewrite the
+            # chat without them so that they are only moved once.
+            db.add_task(db.set_slave_chat_info_bulk, ([obj],), {})
+        elif members:
+            obj.load_members()
+    return obj
+
+
+def unpickle_member(data: bytes, chat: ETMChatType, db: 'DatabaseManager') -> ETMChatMember:
+    """Restore a member pickled with ``ETMChatMember.pickle``."""
+    cls, state = pickle.loads(data)
+    obj = cls.__new__(cls)
+    state['chat'] = chat
+    obj.__setstate__(state)
     return obj
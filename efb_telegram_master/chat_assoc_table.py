@@ -0,0 +1,106 @@
+# coding: utf-8
+"""
+In-memory routing table of chat associations (chat links), mirroring the
+``chatassoc`` table in the database.
+"""
+
+import threading
+from typing import Dict, List, Iterable, Tuple, Optional
+
+from .utils import EFBChannelChatIDStr
+
+# Insertion-ordered sets of counterpart IDs, in the order they are linked.
+LinkSet = Dict[EFBChannelChatIDStr, None]
+
+
+class ChatAssocTable:
+    """Bidirectional map between Telegram chats and slave chats.
+
+    All changes are made under a lock, so that lookups see either the state
+    before or after a change, and never a partially applied one.
+    """
+
+    def __init__(self):
+        self.slaves: Dict[EFBChannelChatIDStr, LinkSet] = {}
+        """Slave chats linked to each Telegram chat."""
+        self.masters: Dict[EFBChannelChatIDStr, LinkSet] = {}
+        """Telegram chats linked to each slave chat."""
+        self.lock = threading.Lock()
+
+    def load(self, links: Iterable[Tuple[EFBChannelChatIDStr, EFBChannelChatIDStr]]):
+        """Replace all links with ``(master_uid, slave_uid)`` pairs."""
+        with self.lock:
+            self.slaves.clear()
+            self.masters.clear()
+            for master_uid, slave_uid in links:
+                self._add(master_uid, slave_uid)
+
+    def get_slaves(self, master_uid: EFBChannelChatIDStr) -> List[EFBChannelChatIDStr]:
+        with self.lock:
+            return list(self.slaves.get(master_uid, ()))
+
+    def get_masters(self, slave_uid: EFBChannelChatIDStr) -> List[EFBChannelChatIDStr]:
+        with self.lock:
+            return list(self.masters.get(slave_uid, ()))
+
+    def get_linked_slaves(self) -> List[EFBChannelChatIDStr]:
+        """All slave chats linked to any Telegram chat."""
+        with self.lock:
+            return list(self.masters)
+
+    def get_singly_linked_slave(self, master_uid: EFBChannelChatIDStr) -> Optional[EFBChannelChatIDStr]:
+        """The only slave chat linked to a Telegram chat, ``None`` if there
+        is none or more than one.
+        """
+        with self.lock:
+            slaves = self.slaves.get(master_uid)
+            if slaves is not None and len(slaves) == 1:
+                return next(iter(slaves))
+            return None
+
+    def link(self, master_uid: EFBChannelChatIDStr, slave_uid: EFBChannelChatIDStr,
+             multiple_slave: bool = False):
+        """Link a slave chat to a Telegram chat, removing other links of the
+        slave chat, and of the Telegram chat unless ``multiple_slave``.
+        """
+        with self.lock:
+            if not multiple_slave:
+                self._remove_master(master_uid)
+            self._remove_slave(slave_uid)
+            self._add(master_uid, slave_uid)
+
+    def unlink(self, master_uid: Optional[EFBChannelChatIDStr] = None,
+               slave_uid: Optional[EFBChannelChatIDStr] = None):
+        """Remove all links of a Telegram chat or a slave chat."""
+        with self.lock:
+            if master_uid:
+                self._remove_master(master_uid)
+            if slave_uid:
+                self._remove_slave(slave_uid)
+
+    def migrate(self, from_master_uid: EFBChannelChatIDStr, to_master_uid: EFBChannelChatIDStr):
+        """Move all links of a Telegram chat to another one."""
+        with self.lock:
+            for slave_uid in list(self.slaves.get(from_master_uid, ())):
+                self._remove_slave(slave_uid)
+                self._add(to_master_uid, slave_uid)
+
+    def _add(self, master_uid: EFBChannelChatIDStr, slave_uid: EFBChannelChatIDStr):
+        self.slaves.setdefault(master_uid, {})[slave_uid] = None
+        self.masters.setdefault(slave_uid, {})[master_uid] = None
+
+    def _remove_master(self, master_uid: EFBChannelChatIDStr):
+        for slave_uid in self.slaves.pop(master_uid, ()):
+            masters = self.masters.get(slave_uid)
+            if masters is not None:
+                masters.pop(master_uid, None)
+                if not masters:
+                    del self.masters[slave_uid]
+
+    def _remove_slave(self, slave_uid: EFBChannelChatIDStr):
+        for master_uid in self.masters.pop(slave_uid, ()):
+            slaves = self.slaves.get(master_uid)
+            if slaves is not None:
+                slaves.pop(slave_uid, None)
+                if not slaves:
+                    del self.slaves[master_uid]
@@ -1,12 +1,14 @@
 # coding=utf-8
 
+import heapq
 import html
 import io
 import logging
 import re
 import urllib.parse
 from contextlib import suppress
-from typing import Tuple, Dict, Optional, List, TYPE_CHECKING, IO, Union, Pattern
+from datetime import datetime
+from typing import Tuple, Dict, Optional, List, TYPE_CHECKING, IO, Union, Pattern, AbstractSet, Iterator
 
 import telegram  # lgtm [py/import-and-import-from]
 from PIL import Image
@@ -32,27 +34,96 @@ from .utils import EFBChannelChatIDStr, TelegramChatID, TelegramMessageID
 if TYPE_CHECKING:
     from . import TelegramChannel
     from .bot_manager import TelegramBotManager
-    from .chat_object_cache import ChatObjectCacheManager
+    from .chat_object_cache import ChatObjectCacheManager, CacheKey
+    from .conversation_store import ConversationStore
     from .db import DatabaseManager
 
 __all__ = ['ChatBindingManager']
 
 
+ChatRank = Tuple[datetime, 'CacheKey']
+"""Sort key of chats in a list: time of last message, and cache key."""
+
+
+class ChatListCursor:
+    """
+    Lazy cursor of chats ordered by time of last message, latest first.
+
+    Each page is picked with a top-k heap selection over a set of chat keys,
+    which is shared by other cursors when it is ``all_keys`` of the chat
+    manager, among the chats ranked below the last one of the previous page.
+    Only the rank of the last chat of each page visited is kept, so later
+    pages are computed only when they are requested.
+
+    Attributes:
+        keys (AbstractSet[CacheKey]): Keys of chats to pick from
+        pattern (Union[str, Pattern, None]): Filter of chats, None to pick all
+        build_dummy (bool): Whether to build dummy objects of chats not found
+        bounds (Dict[int, Optional[ChatRank]]): Rank of the last chat before
+            each page visited, by offset of the page
+    """
+
+    def __init__(self, chat_manager: 'ChatObjectCacheManager', keys: AbstractSet['CacheKey'],
+                 pattern: Union[str, Pattern, None] = None, build_dummy: bool = False):
+        self.chat_manager = chat_manager
+        self.keys = keys
+        self.pattern = pattern
+        self.build_dummy = build_dummy
+        self.bounds: Dict[int, Optional[ChatRank]] = {0: None}
+
+    def rank(self, key: 'CacheKey') -> ChatRank:
+        last_time = self.chat_manager.db.get_last_message_time(utils.chat_id_to_str(key[0], key[1]))
+        return last_time or datetime.min, key
+
+    def ranks_below(self, bound: Optional[ChatRank]) -> Iterator[ChatRank]:
+        if self.pattern is None:
+            candidates = iter(self.keys)
+        else:
+            candidates = (i for i in self.chat_manager.search_keys(self.pattern) if i in self.keys)
+        for key in candidates:
+            rank = self.rank(key)
+            if bound is None or rank < bound:
+                yield rank
+
+    def page(self, offset: int, size: int) -> Tuple[List[ETMChatType], bool]:
+        """Chats in the page starting at ``offset``, and whether there is a next page."""
+        start = max(i for i in self.bounds if i <= offset)
+        while True:
+            ranks = heapq.nlargest(size + 1, self.ranks_below(self.bounds[start]))
+            has_next = len(ranks) > size
+            if has_next:
+                self.bounds[start + size] = ranks[size - 1]
+            if start >= offset or not has_next:
+                break
+            start += size
+        if start != offset:
+            return [], False
+        chats = []
+        for _, (module_id, chat_id) in ranks[:size]:
+            chat = self.chat_manager.get_chat(module_id, chat_id, build_dummy=self.build_dummy)
+            if chat is not None:
+                chats.append(chat)
+        return chats, has_next
+
+
 class ChatListStorage:
     """
     Storage for list of chats displayed in a message as inline buttons.
 
     Attributes:
-        chats (List[ETMChat]): List of chats to display
+        chats (List[ETMChat]): List of chats to display, only the current
+            page of chats when ``cursor`` is set
         channels (Dict[str, SlaveChannel]): List of channels involved
         offset (int): Current offset to display
+        cursor (Optional[ChatListCursor]): Cursor to pick pages of chats from
     """
 
-    def __init__(self, chats: List[ETMChatType], offset: int = 0):
+    def __init__(self, chats: List[ETMChatType], offset: int = 0, cursor: Optional[ChatListCursor] = None):
         self.__chats: List[ETMChatType] = []
         self.channels: Dict[ModuleID, SlaveChannel] = dict()
         self.chats = chats.copy()  # initialize chats with setter.
         self.offset: int = offset
+        self.cursor: Optional[ChatListCursor] = cursor
         self.update: Optional[Update] = None
         self.candidates: Optional[List[EFBChannelChatIDStr]] = None
 
@@ -82,8 +153,6 @@ class ChatBindingManager(LocaleMixin):
     Manages chat bindings (links), generation of chat heads, and chat recipient suggestion.
     """
 
-    # Message storage
-    msg_storage: Dict[Tuple[TelegramChatID, TelegramMessageID], ChatListStorage] = dict()
     logger: logging.Logger = logging.getLogger(__name__)
 
     # Consts
@@ -96,6 +165,8 @@ class ChatBindingManager(LocaleMixin):
         self.bot: 'TelegramBotManager' = channel.bot_manager
         self.db: 'DatabaseManager' = channel.db
         self.chat_manager: 'ChatObjectCacheManager' = channel.chat_manager
+        # Message storage of chat lists, shared with command messages
+        self.msg_storage: 'ConversationStore' = channel.conversation_store
 
         # Link handler
         non_edit_filter = Filters.update.message | Filters.update.channel_post
@@ -113,6 +184,7 @@ class ChatBindingManager(LocaleMixin):
             per_user=False
         )
         self.bot.dispatcher.add_handler(self.link_handler)
+        self.msg_storage.add_handler("link", self.link_handler)
 
         # Chat head handler
         self.bot.dispatcher.add_handler(
@@ -128,6 +200,7 @@ class ChatBindingManager(LocaleMixin):
             per_user=False
         )
         self.bot.dispatcher.add_handler(self.chat_head_handler)
+        self.msg_storage.add_handler("chat_head", self.chat_head_handler)
 
         # Unlink all
         self.bot.dispatcher.add_handler(
@@ -144,6 +217,7 @@ class ChatBindingManager(LocaleMixin):
         )
 
         self.bot.dispatcher.add_handler(self.suggestion_handler)
+        self.msg_storage.add_handler("suggestion", self.suggestion_handler)
 
         # Update group title and profile picture
         self.bot.dispatcher.add_handler(CommandHandler('update_info', self.update_group_info))
@@ -257,7 +331,7 @@ class ChatBindingManager(LocaleMixin):
         Returns:
             Tuple[List[str], List[List[telegram.InlineKeyboardButton]]]:
                 A tuple: legend, chat_btn_list
-                `legend` is the legend of all Emoji headings in the entire list.
+                `legend` is the legend of all Emoji headings in the current page.
                 `chat_btn_list` is a list which can be fit into `telegram.InlineKeyboardMarkup`.
         """
         self.logger.debug("Generating pagination of chats.\nStorage ID: %s; Offset: %s; Filter: %s; Source chats: %s;",
@@ -270,8 +344,8 @@ class ChatBindingManager(LocaleMixin):
 
         chat_list: Optional[ChatListStorage] = self.msg_storage.get(storage_id, None)
 
-        if chat_list is None or chat_list.length == 0:
-            # Generate the full chat list first
+        if chat_list is None or chat_list.cursor is None:
+            # Generate the cursor of chat list first
             re_filter: Union[str, Pattern, None] = None
             if pattern:
                 self.logger.debug("Filter pattern: %s", pattern)
@@ -285,8 +359,9 @@ class ChatBindingManager(LocaleMixin):
                         re_filter = re.compile(pattern, re.DOTALL | re.IGNORECASE)
                     except re.error:
                         re_filter = pattern
-            chats: List[ETMChatType] = []
+            cursor: ChatListCursor
             if source_chats:
+                keys = set()
                 for s_chat in source_chats:
                     channel_id, chat_uid, _ = utils.chat_id_str_to_id(s_chat)
                     with suppress(NameError):
@@ -296,25 +371,26 @@ class ChatBindingManager(LocaleMixin):
                         self.logger.debug("slave_chats_pagination with chat list: Chat %s not found.", s_chat)
                         continue
                     if chat.match(re_filter):
-                        chats.append(chat)
+                        keys.add(self.chat_manager.get_cache_key(chat))
+                cursor = ChatListCursor(self.chat_manager, frozenset(keys),
+                                        build_dummy=not filter_availability)
             else:
-                for etm_chat in self.chat_manager.all_chats:
-                    if etm_chat.match(re_filter):
-                        chats.append(etm_chat)
+                # Share the snapshot of all chat keys, and filter on each page
+                cursor = ChatListCursor(self.chat_manager, self.chat_manager.all_keys, re_filter)
+            chat_list = self.msg_storage[storage_id] = ChatListStorage([], offset, cursor)
 
-            chats.sort(key=lambda a: a.last_message_time, reverse=True)
-            chat_list = self.msg_storage[storage_id] = ChatListStorage(chats, offset)
-
-        # self._db_update_slave_chats_cache(chat_list.chats)
+        # Pick chats of the page only, later pages are picked when requested
+        chats_per_page = self.channel.flag("chats_per_page")
+        assert chat_list.cursor is not None  # for type check
+        chat_list.chats, has_next = chat_list.cursor.page(offset, chats_per_page)
+        chat_list.offset = offset
 
         for ch in chat_list.channels.values():
             legend.append(f"{ch.channel_emoji}: {ch.channel_name}")
 
-        # Build inline button list
+        # Build inline button list, indices of chats are in the current page
         chat_btn_list: List[List[InlineKeyboardButton]] = []
-        chats_per_page = self.channel.flag("chats_per_page")
-        for idx in range(offset, min(offset + chats_per_page, chat_list.length)):
-            chat = chat_list.chats[idx]
+        for idx, chat in enumerate(chat_list.chats):
             if chat.linked:
                 mode = Emoji.LINK
             else:
@@ -333,7 +409,7 @@ class ChatBindingManager(LocaleMixin):
                                                         callback_data=f"offset {offset - chats_per_page}"))
         page_number_row.append(InlineKeyboardButton(self._("Cancel"),
                                                     callback_data=Flags.CANCEL_PROCESS))
-        if offset + chats_per_page < chat_list.length:
+        if has_next:
             page_number_row.append(InlineKeyboardButton(self._("Next >"),
                                                         callback_data=f"offset {offset + chats_per_page}"))
         chat_btn_list.append(page_number_row)
@@ -922,9 +998,7 @@ class ChatBindingManager(LocaleMixin):
     def chat_migration_by_id(self, from_id, to_id):
         from_str = utils.chat_id_to_str(self.channel.channel_id, from_id)
         to_str = utils.chat_id_to_str(self.channel.channel_id, to_id)
-        for i in self.db.get_chat_assoc(master_uid=from_str):
-            self.db.add_chat_assoc(master_uid=to_str, slave_uid=i)
-        self.db.remove_chat_assoc(master_uid=from_str)
+        self.db.migrate_chat_assoc(from_str, to_str)
 
     @staticmethod
     def truncate_ellipsis(text: str, length: int) -> str:
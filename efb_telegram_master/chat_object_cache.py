@@ -1,13 +1,24 @@
+import datetime
 import logging
+import pickle
+import time
+import zlib
+from collections import OrderedDict
 from contextlib import suppress
-from typing import TYPE_CHECKING, Optional, Dict, Tuple, Iterator, overload, cast, MutableSequence, Collection
+from threading import Thread, Timer, RLock
+from typing import TYPE_CHECKING, Optional, Dict, Tuple, Iterator, overload, MutableSequence, Collection, \
+    Set, List, Union, Pattern, FrozenSet
 
 from typing_extensions import Literal
 
-from ehforwarderbot import coordinator
+from ehforwarderbot import coordinator, utils as efb_utils
+from ehforwarderbot.channel import SlaveChannel
 from ehforwarderbot.chat import Chat, ChatMember, BaseChat, SystemChatMember, SelfChatMember
 from ehforwarderbot.exceptions import EFBChatNotFound
 from ehforwarderbot.types import ModuleID, ChatID
+from . import utils
+from .circuit_breaker import CircuitBreaker, CircuitOpen, CallTimeout
+from .chat_search_index import ChatSearchIndex
 from .chat import convert_chat, ETMChatType, ETMChatMember, unpickle, ETMSystemChat
 
 if TYPE_CHECKING:
@@ -16,6 +27,17 @@ if TYPE_CHECKING:
 CacheKey = Tuple[ModuleID, ChatID]
 """Cache storage key: module_id, chat_id"""
 
+SNAPSHOT_VERSION = 1
+"""Version of the format of chat cache snapshot files."""
+SNAPSHOT_INTERVAL = 600
+"""Interval of writing chat cache snapshots in seconds."""
+PIN_ACTIVE_PERIOD = datetime.timedelta(hours=24)
+"""Chats with messages in this period are not evicted from the cache."""
+MISS_TTL = 300.
+"""Seconds to remember chats not found in their slave channels."""
+MISS_CACHE_SIZE = 4096
+"""Maximum number of chats not found to be remembered."""
+
 
 class ChatObjectCacheManager:
     """Maintain and update chat objects from all slave channels and
@@ -27,23 +49,164 @@ class ChatObjectCacheManager:
         self.db = channel.db
         self.logger = logging.getLogger(__name__)
 
-        self.cache: Dict[CacheKey, ETMChatType] = dict()
-
+        self.cache: 'OrderedDict[CacheKey, ETMChatType]' = OrderedDict()
+        """Cached chats, least recently used first."""
+        self.lock = RLock()
+        self.weights: Dict[CacheKey, int] = dict()
+        self.total_weight = 0
+        self.max_weight: int = channel.flag("chat_cache_max_weight")
+        """Maximum total weight of cached chats, ``0`` for no limit."""
+        self.evicted: Set[CacheKey] = set()
+        """Keys of chats evicted from the cache to the database."""
+        self.evicting: Dict[CacheKey, ETMChatType] = dict()
+        """Chats evicted from the cache and not yet written to the database."""
+        self.deleted: Set[CacheKey] = set()
+        """Keys of chats deleted from the cache and not yet from the database."""
+        self.misses: 'OrderedDict[CacheKey, float]' = OrderedDict()
+        """Expiry time of chats recently not found in their slave channels,
+        oldest first."""
+        self.breakers: Dict[ModuleID, CircuitBreaker] = dict()
+        self.search_index: ChatSearchIndex[CacheKey] = ChatSearchIndex()
+        """Index of chats in the cache and evicted from it for filters."""
+        self.keys_snapshot: Optional[FrozenSet[CacheKey]] = None
+        """Keys of ``all_chats``, shared until chats are added or removed."""
+        self.stale: Set[CacheKey] = set()
+        """Keys of chats loaded from the snapshot and not yet checked
+        against their slave channels."""
+
+        self.snapshot_path = efb_utils.get_data_path(channel.channel_id) / "chat_cache.pickle"
+        self.snapshot_timer: Optional[Timer] = None
+
+        if channel.flag("warm_start") and self.load_snapshot():
+            # Check chats from the snapshot against slave channels in the background
+            self.load_slave_chats(None)
+        else:
+            self.load_slave_chats(channel.flag("slave_chats_timeout"))
+        if channel.flag("warm_start"):
+            self._schedule_snapshot()
+
+    def load_slave_chats(self, timeout: Optional[float]):
+        """Load chats from all slave channels concurrently, each in its own
+        thread, and convert them to ETMChat objects.
+
+        Slave channels are waited for up to ``timeout`` seconds. Chats of
+        slave channels not responded by then are enrolled in the background
+        when they respond. If ``timeout`` is ``None``, all chats are loaded
+        in the background.
+        """
         self.logger.debug("Loading chats from slave channels...")
-        # load all chats from all slave channels and convert to ETMChat object
+        threads = []
         for channel_id, module in coordinator.slaves.items():
-            # noinspection PyBroadException
-            try:
-                self.logger.debug("Loading chats from '%s'...", channel_id)
-                chats = module.get_chats()
-            except Exception:
-                self.logger.exception("Error occurred while getting chats from %. "
-                                      "ETM will report no chat from this channel until further noticed.", channel_id)
-                continue
-            self.logger.debug("Found %s chats from '%s'.", len(chats), channel_id)
-            for chat in chats:
-                self.compound_enrol(chat)
-            self.logger.debug("All %s chats from '%s' are enrolled.", len(chats), channel_id)
+            thread = Thread(target=self.load_chats_from, args=(channel_id, module),
+                            name=f"ETM chat loader thread of {channel_id}", daemon=True)
+            thread.start()
+            threads.append(thread)
+        if timeout is None:
+            return
+        deadline = time.monotonic() + timeout
+        for thread in threads:
+            thread.join(max(0., deadline - time.monotonic()))
+        pending = [i.name for i in threads if i.is_alive()]
+        if pending:
+            self.logger.warning("%s slave channels have not responded with their chats in %s seconds, "
+                                "their chats will be loaded in the background: %s",
+                                len(pending), timeout, pending)
+
+    def load_chats_from(self, channel_id: str, module: SlaveChannel):
+        """Load and enrol chats from a slave channel.
+
+        Stale chats of the channel are updated, or removed from the cache and
+        the database if they are no longer listed.
+        """
+        start = time.perf_counter()
+        # noinspection PyBroadException
+        try:
+            self.logger.debug("Loading chats from '%s'...", channel_id)
+            chats = module.get_chats()
+        except Exception:
+            self.logger.exception("Error occurred while getting chats from %s. "
+                                  "ETM will report no chat from this channel until further noticed.", channel_id)
+            return
+        fetched = time.perf_counter()
+        self.logger.debug("Found %s chats from '%s'.", len(chats), channel_id)
+        etm_chats = [self.update_chat_obj(chat, full_update=True, update_db=False)
+                     if self.get_cache_key(chat) in self.stale else self.compound_enrol(chat)
+                     for chat in chats]
+        # Rows of linked chats are kept up to date, other chats are written when evicted
+        linked = [i for i in etm_chats if self.db.get_chat_assoc(slave_uid=utils.chat_id_to_str(chat=i))]
+        if linked:
+            self.db.add_task(self.db.set_slave_chat_info_bulk, (linked,), {})
+        stale = {i for i in set(self.stale) if i[0] == channel_id}
+        if stale:
+            removed = stale.difference(self.get_cache_key(i) for i in etm_chats)
+            for key in removed:
+                self.delete_chat_object(*key)
+            self.stale.difference_update(stale)
+            self.logger.debug("Checked %s chats of '%s' from snapshot, %s of them are removed.",
+                              len(stale), channel_id, len(removed))
+        self.logger.info("All %s chats from '%s' are enrolled in %.2f s (%.2f s to get chats, %.2f s to convert).",
+                         len(chats), channel_id, time.perf_counter() - start, fetched - start,
+                         time.perf_counter() - fetched)
+
+    def load_snapshot(self) -> bool:
+        """Enrol chats from the snapshot file and mark them as stale.
+
+        Returns:
+            If the snapshot is loaded.
+        """
+        if not self.snapshot_path.exists():
+            return False
+        start = time.perf_counter()
+        # noinspection PyBroadException
+        try:
+            version, chats = pickle.loads(zlib.decompress(self.snapshot_path.read_bytes()))
+            if version != SNAPSHOT_VERSION:
+                self.logger.warning("Chat cache snapshot of version %s is not supported, ignored.", version)
+                return False
+        except Exception:
+            self.logger.exception("Failed to load chat cache snapshot from %s.", self.snapshot_path)
+            return False
+        for chat in chats:
+            chat.db = self.db
+            self.stale.add(self.get_cache_key(chat))
+            self.enrol(chat)
+        self.logger.info("Loaded %s chats from snapshot in %.2f s.", len(chats), time.perf_counter() - start)
+        return True
+
+    def save_snapshot(self):
+        """Write all cached chats to the snapshot file."""
+        start = time.perf_counter()
+        with self.lock:
+            chats: List[ETMChatType] = list(self.cache.values())
+        # noinspection PyBroadException
+        try:
+            data = zlib.compress(pickle.dumps((SNAPSHOT_VERSION, chats), pickle.HIGHEST_PROTOCOL))
+            partial = self.snapshot_path.with_name(self.snapshot_path.name + ".partial")
+            partial.write_bytes(data)
+            partial.replace(self.snapshot_path)
+        except Exception:
+            self.logger.exception("Failed to write chat cache snapshot to %s.", self.snapshot_path)
+            return
+        self.logger.debug("Saved %s chats to snapshot (%s bytes) in %.2f s.",
+                          len(chats), len(data), time.perf_counter() - start)
+
+    def _schedule_snapshot(self):
+        self.snapshot_timer = Timer(SNAPSHOT_INTERVAL, self._write_scheduled_snapshot)
+        self.snapshot_timer.daemon = True
+        self.snapshot_timer.start()
+
+    def _write_scheduled_snapshot(self):
+        self.save_snapshot()
+        self._schedule_snapshot()
+
+    def stop(self):
+        """Stop writing snapshots periodically, and write the last one if
+        warm start is enabled.
+        """
+        if self.snapshot_timer is None:
+            return
+        self.snapshot_timer.cancel()
+        self.save_snapshot()
 
     def compound_enrol(self, chat: Chat) -> ETMChatType:
         """Convert and enrol a chat object for the first time.
@@ -61,9 +224,81 @@ class ChatObjectCacheManager:
         This would not update the cached object upon conflicting.
         """
         key = self.get_cache_key(chat)
-        self.cache[key] = chat
+        with self.lock:
+            if key not in self.cache and key not in self.evicted:
+                self.keys_snapshot = None
+            self.cache[key] = chat
+            self.cache.move_to_end(key)
+            self.evicted.discard(key)
+            self.evicting.pop(key, None)
+            self.deleted.discard(key)
+            self.misses.pop(key, None)
+            self._update_weight(key, chat)
+        self.search_index.add(key, chat.get_entry_string(linked=False))
         self.logger.debug("Enrolling key %s with value %s", key, chat)
 
+    @staticmethod
+    def get_weight(chat: ETMChatType) -> int:
+        """Weight of a chat in the cache, by its number of members."""
+        return 1 + len(chat.members)
+
+    def _update_weight(self, key: CacheKey, chat: ETMChatType):
+        """Update weight of a cached chat, and evict other chats if needed."""
+        with self.lock:
+            if self.cache.get(key) is not chat:
+                return
+            weight = self.get_weight(chat)
+            self.total_weight += weight - self.weights.get(key, 0)
+            self.weights[key] = weight
+            self.evict(keep=key)
+
+    def is_pinned(self, chat: ETMChatType) -> bool:
+        """Linked chats and chats active recently are not evicted."""
+        chat_uid = utils.chat_id_to_str(chat=chat)
+        if self.db.get_chat_assoc(slave_uid=chat_uid):
+            return True
+        last_time = self.db.get_last_message_time(chat_uid)
+        return last_time is not None and datetime.datetime.now() - last_time < PIN_ACTIVE_PERIOD
+
+    def evict(self, keep: Optional[CacheKey] = None):
+        """Evict least recently used chats until the total weight is within
+        the limit, and write them to the database to be reloaded on demand.
+
+        Args:
+            keep: Key of a chat not to be evicted, such as the one being
+                enrolled or reloaded.
+        """
+        if not self.max_weight:
+            return
+        evicted = []
+        with self.lock:
+            # Pinned and kept chats are moved to the end, stop when all of them are checked
+            remaining = len(self.cache)
+            while self.total_weight > self.max_weight and remaining > 0:
+                remaining -= 1
+                key, chat = next(iter(self.cache.items()))
+                if key == keep or self.is_pinned(chat):
+                    self.cache.move_to_end(key)
+                    continue
+                del self.cache[key]
+                self.total_weight -= self.weights.pop(key)
+                self.evicted.add(key)
+                self.evicting[key] = chat
+                evicted.append(chat)
+        if evicted:
+            self.db.add_task(self._write_evicted, (evicted,), {})
+            self.logger.debug("Evicted %s chats from cache, total weight is now %s.",
+                              len(evicted), self.total_weight)
+
+    def _write_evicted(self, chats: List[ETMChatType]):
+        """Write evicted chats to the database, run in the database worker."""
+        self.db.set_slave_chat_info_bulk(chats)
+        with self.lock:
+            for chat in chats:
+                key = self.get_cache_key(chat)
+                if self.evicting.get(key) is chat:
+                    del self.evicting[key]
+
     @staticmethod
     def get_cache_key(chat: BaseChat) -> CacheKey:
         module_id = chat.module_id
@@ -89,10 +324,17 @@ class ChatObjectCacheManager:
         the module_id, chat_id and group_id specified.
         """
         key = (module_id, chat_id)
-        if key in self.cache:
-            return self.cache[key]
-
-        c_log = self.db.get_slave_chat_info(module_id, chat_id)
+        with self.lock:
+            if key in self.cache:
+                self.cache.move_to_end(key)
+                return self.cache[key]
+            evicting = self.evicting.pop(key, None)
+            deleted = key in self.deleted
+        if evicting is not None:
+            self.enrol(evicting)
+            return evicting
+
+        c_log = None if deleted else self.db.get_slave_chat_info(module_id, chat_id)
         if c_log is not None and c_log.pickle:
             # Suppress AttributeError caused by change of class name in EFB 2.0.0b26, ETM 2.0.0b40
             with suppress(AttributeError):
@@ -101,9 +343,9 @@ class ChatObjectCacheManager:
                 return obj
 
         # Only look up from slave channels as middlewares don’t have get_chat_by_id method.
-        if module_id in coordinator.slaves:
-            with suppress(EFBChatNotFound, KeyError):
-                chat_obj = coordinator.slaves[module_id].get_chat(chat_id)
+        if module_id in coordinator.slaves and not self.is_recent_miss(key):
+            chat_obj = self.get_chat_from_slave(module_id, chat_id)
+            if chat_obj is not None:
                 return self.compound_enrol(chat_obj)
 
         if build_dummy:
@@ -114,6 +356,52 @@ class ChatObjectCacheManager:
                                  name=chat_id)
         return None
 
+    def is_recent_miss(self, key: CacheKey) -> bool:
+        """If a chat is recently not found in its slave channel."""
+        with self.lock:
+            expiry = self.misses.get(key)
+            if expiry is None:
+                return False
+            if expiry > time.monotonic():
+                return True
+            del self.misses[key]
+            return False
+
+    def add_miss(self, key: CacheKey):
+        """Remember a chat not found in its slave channel for a while."""
+        with self.lock:
+            self.misses[key] = time.monotonic() + MISS_TTL
+            self.misses.move_to_end(key)
+            while len(self.misses) > MISS_CACHE_SIZE:
+                self.misses.popitem(last=False)
+
+    def get_breaker(self, module_id: ModuleID) -> CircuitBreaker:
+        """Circuit breaker of calls to a slave channel."""
+        with self.lock:
+            if module_id not in self.breakers:
+                self.breakers[module_id] = CircuitBreaker(module_id, expected=(EFBChatNotFound, KeyError))
+            return self.breakers[module_id]
+
+    def get_chat_from_slave(self, module_id: ModuleID, chat_id: ChatID) -> Optional[Chat]:
+        """Get a chat from its slave channel, through the circuit breaker
+        of the channel.
+
+        Returns:
+            The chat, or ``None`` if it is not found, the channel does not
+            respond in time, or the circuit of the channel is open.
+        """
+        try:
+            return self.get_breaker(module_id).call(coordinator.slaves[module_id].get_chat, chat_id)
+        except (EFBChatNotFound, KeyError):
+            self.add_miss((module_id, chat_id))
+        except CircuitOpen:
+            self.logger.debug("Circuit of %s is open, skipped looking up chat %s.", module_id, chat_id)
+        except CallTimeout as e:
+            self.logger.warning("Failed to look up chat %s: %s", chat_id, e)
+        except Exception:
+            self.logger.exception("Error occurred while getting chat %s from %s.", chat_id, module_id)
+        return None
+
     @overload
     def get_chat_member(self, module_id: ModuleID, chat_id: ChatID, member_id: ChatID,
                         build_dummy: Literal[True]) -> ETMChatMember:
@@ -137,18 +425,22 @@ class ChatObjectCacheManager:
             return None
         return chat.add_system_member(name=member_id, uid=member_id)
 
-    def update_chat_obj(self, chat: Chat, full_update: bool = False) -> ETMChatType:
+    def update_chat_obj(self, chat: Chat, full_update: bool = False, update_db: bool = True) -> ETMChatType:
         """Insert or update chat object to cache.
         Only checking name and alias, not checking group/member association,
         unless full update is requested.
+
+        If ``update_db`` is False, the caller is responsible for updating
+        the returned object to database.
         """
         key = self.get_cache_key(chat)
         self.logger.debug("Trying to update key %s with object %s. Full update: %s", key, chat, full_update)
-        if key not in self.cache:
+        with self.lock:
+            cached = self.cache.get(key)
+        if cached is None:
             self.logger.debug("Key %s is not in cache. Do compound enrol.", key)
             return self.compound_enrol(chat)
 
-        cached = cast(ETMChatType, self.cache[key])
         self.logger.debug("Cached object found with key %s.", key)
 
         if full_update:
@@ -159,7 +451,10 @@ class ChatObjectCacheManager:
             cached.vendor_specific = etm_chat.vendor_specific
             cached.notification = etm_chat.notification
             cached.members = self.update_chat_members(cached, etm_chat.members, full_update)
-            cached.update_to_db()
+            self._update_weight(key, cached)
+            self.search_index.add(key, cached.get_entry_string(linked=False))
+            if update_db:
+                cached.update_to_db()
         else:
             if chat.name != cached.name or \
                     chat.alias != cached.alias or \
@@ -169,23 +464,30 @@ class ChatObjectCacheManager:
                 cached.alias = chat.alias
                 cached.notification = chat.notification
                 cached.description = chat.description
-                cached.update_to_db()
+                self.search_index.add(key, cached.get_entry_string(linked=False))
+                if update_db:
+                    cached.update_to_db(members=False)
         return cached
 
     def update_chat_members(self,
                             chat: ETMChatType,
                             members: MutableSequence[ETMChatMember],
                             full_update: bool = False) -> MutableSequence[ETMChatMember]:
-        """Update chat members. Overwrite, add, and remove member objects if needed."""
+        """Update chat members. Overwrite, add, and remove member objects if needed.
+
+        Entries of removed members are deleted from database.
+        """
         cached_objs = {(i.module_id, i.uid): i for i in chat.members}
         chat.members = []
         for i in members:
             idx = (i.module_id, i.uid)
             if idx in cached_objs:
-                chat.members.append(self.update_chat_member_obj(cached_objs[idx], i))
+                chat.members.append(self.update_chat_member_obj(cached_objs.pop(idx), i))
             else:
                 i.chat = chat
                 chat.members.append(i)
+        if cached_objs:
+            self.db.delete_chat_members(chat.module_id, chat.uid, [i.uid for i in cached_objs.values()])
         return chat.members
 
     @staticmethod
@@ -232,11 +534,27 @@ class ChatObjectCacheManager:
         return cached
 
     def delete_chat_object(self, module_id: ModuleID, chat_id: ChatID):
-        """Remove chat object from cache."""
+        """Remove chat object from cache and the database."""
         key = (module_id, chat_id)
-        if key not in self.cache:
-            return
-        self.cache.pop(key)
+        with self.lock:
+            self.stale.discard(key)
+            self.evicted.discard(key)
+            self.evicting.pop(key, None)
+            self.search_index.remove(key)
+            if self.keys_snapshot is not None and key in self.keys_snapshot:
+                self.keys_snapshot = None
+            if key in self.cache:
+                self.cache.pop(key)
+                self.total_weight -= self.weights.pop(key)
+            # Not loaded from the database until deleted after pending writes of the chat
+            self.deleted.add(key)
+        self.db.add_task(self._delete_chat_info, (key,), {})
+
+    def _delete_chat_info(self, key: CacheKey):
+        """Delete a deleted chat from the database, run in the database worker."""
+        self.db.delete_slave_chat_info(*key)
+        with self.lock:
+            self.deleted.discard(key)
 
     def delete_chat_members(self, module_id: ModuleID, chat_id: ChatID, member_ids: Collection[ChatID]):
         """Remove chat member objects from cache."""
@@ -246,8 +564,82 @@ class ChatObjectCacheManager:
         chat = self.cache[key]
         member_ids = set(member_ids)
         chat.members = [i for i in chat.members if i.uid not in member_ids]
+        self._update_weight(key, chat)
 
     @property
     def all_chats(self) -> Iterator[ETMChatType]:
-        """Return all chats that is not a group member and not myself."""
-        return (val for val in self.cache.values() if isinstance(val, ETMChatType))
+        """Return all chats that is not a group member and not myself.
+
+        Chats evicted from the cache are loaded from the database without
+        their members, and are not enrolled again.
+        """
+        # Take a snapshot, as chats may be enrolled from other threads
+        with self.lock:
+            cached = list(self.cache.values())
+            evicted = list(self.evicted)
+        yield from (val for val in cached if isinstance(val, ETMChatType))
+        for key in evicted:
+            chat = self._load_evicted(key)
+            if chat is not None:
+                yield chat
+
+    @property
+    def all_keys(self) -> FrozenSet[CacheKey]:
+        """Keys of chats in ``all_chats``.
+
+        The same immutable set is returned until chats are added or removed,
+        so that it can be shared by chat lists.
+        """
+        with self.lock:
+            if self.keys_snapshot is None:
+                keys = {key for key, val in self.cache.items() if isinstance(val, ETMChatType)}
+                self.keys_snapshot = frozenset(keys | self.evicted)
+            return self.keys_snapshot
+
+    def _load_evicted(self, key: CacheKey) -> Optional[ETMChatType]:
+        """Load an evicted chat from the database without its members, and
+        without enrolling it again."""
+        with self.lock:
+            if key in self.evicting:
+                return self.evicting[key]
+        c_log = self.db.get_slave_chat_info(*key)
+        if c_log is not None and c_log.pickle:
+            with suppress(AttributeError):
+                return unpickle(c_log.pickle, self.db, members=False)
+        return None
+
+    def search_chats(self, pattern: Union[str, Pattern]) -> Iterator[ETMChatType]:
+        """Return chats in ``all_chats`` that match a filter, per
+        ``ETMChatMixin.match``.
+
+        Candidates are looked up from the search index, and only they are
+        matched against the filter. Linked chats are always matched, as
+        links are not indexed.
+        """
+        for _, chat in self._search(pattern):
+            yield chat
+
+    def search_keys(self, pattern: Union[str, Pattern]) -> Iterator[CacheKey]:
+        """Return keys of chats in ``all_chats`` that match a filter, per
+        ``ETMChatMixin.match``.
+        """
+        for key, _ in self._search(pattern):
+            yield key
+
+    def _search(self, pattern: Union[str, Pattern]) -> Iterator[Tuple[CacheKey, ETMChatType]]:
+        candidates = self.search_index.search(pattern)
+        linked: Set[CacheKey] = set()
+        for slave_uid in self.db.chat_assoc.get_linked_slaves():
+            channel_id, chat_uid, _ = utils.chat_id_str_to_id(slave_uid)
+            linked.add((channel_id, chat_uid))
+        for key in candidates | linked:
+            with self.lock:
+                chat = self.cache.get(key)
+                is_evicted = key in self.evicted
+            if chat is None and is_evicted:
+                chat = self._load_evicted(key)
+            if chat is None:
+                continue
+            # Plain strings are already matched against the index
+            if (isinstance(pattern, str) and key not in linked) or chat.match(pattern):
+                yield key, chat
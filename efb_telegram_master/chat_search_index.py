@@ -0,0 +1,172 @@
+# coding: utf-8
+"""
+Trigram index of strings matched by chat filters in ``/link`` and
+``/chat``, to find chats that may match a filter without checking every
+chat.
+"""
+
+import threading
+from array import array
+from typing import Dict, Set, List, Generic, TypeVar, Hashable, Pattern, Iterable, Union, Tuple
+
+try:
+    from re import _parser as sre_parse  # type: ignore
+except ImportError:  # Python < 3.11
+    import sre_parse  # type: ignore
+
+K = TypeVar("K", bound=Hashable)
+
+LABELS = "channel: \nchannel id: \nname: \nalias: \nid: \ntype: \nmode: \ndescription: \nnotification: \nother: "
+"""Labels of the strings matched by chat filters, with empty values."""
+
+
+def trigrams(text: str) -> Set[str]:
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+STOP_GRAMS = frozenset(trigrams(LABELS))
+"""Trigrams of labels shared by all chats, which are not indexed."""
+
+
+def required_literals(pattern: Pattern) -> List[str]:
+    """Literal strings that all matches of a regular expression contain,
+    in lower case.
+
+    Only literals in the top-level sequence, in groups and in positive
+    lookahead assertions are found. Returns an empty list if the pattern
+    cannot be parsed.
+    """
+    if not isinstance(pattern.pattern, str):
+        return []
+    try:
+        parsed = sre_parse.parse(pattern.pattern, pattern.flags)
+    except Exception:
+        return []
+    literals: List[str] = []
+
+    def walk(sequence: Iterable):
+        run: List[str] = []
+        for op, value in sequence:
+            if op is sre_parse.LITERAL:
+                run.append(chr(value))
+                continue
+            if run:
+                literals.append("".join(run).lower())
+                run = []
+            if op is sre_parse.SUBPATTERN:
+                walk(value[-1])
+            elif op is sre_parse.ASSERT and value[0] == 1:
+                walk(value[1])
+        if run:
+            literals.append("".join(run).lower())
+
+    walk(parsed)
+    return literals
+
+
+class ChatSearchIndex(Generic[K]):
+    """Inverted index from trigrams to keys of lower-cased strings.
+
+    Each string added gets a new sequential ID, so that posting lists of
+    trigrams are compact arrays of increasing IDs, only appended to.
+    IDs of removed or replaced strings are skipped on lookup, and dropped
+    from the arrays when they outnumber the live ones.
+
+    Trigrams in ``STOP_GRAMS`` are not indexed, queries made only of them
+    are looked up by scanning all strings instead.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.ids: Dict[K, int] = dict()
+        self.entries: Dict[int, Tuple[K, str]] = dict()
+        self.postings: Dict[str, array] = dict()
+        self.next_id = 0
+        self.live_postings = 0
+        self.dead_postings = 0
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def add(self, key: K, text: str):
+        """Add or update the string of a key."""
+        text = text.lower()
+        with self.lock:
+            if key in self.ids:
+                if self.entries[self.ids[key]][1] == text:
+                    return
+                self._remove(key)
+            entry_id = self.next_id
+            self.next_id += 1
+            self.ids[key] = entry_id
+            self.entries[entry_id] = (key, text)
+            self._post(entry_id, text)
+
+    def remove(self, key: K):
+        """Remove the string of a key."""
+        with self.lock:
+            if key in self.ids:
+                self._remove(key)
+
+    def _post(self, entry_id: int, text: str):
+        grams = trigrams(text) - STOP_GRAMS
+        for gram in grams:
+            if gram not in self.postings:
+                self.postings[gram] = array("I")
+            self.postings[gram].append(entry_id)
+        self.live_postings += len(grams)
+
+    def _remove(self, key: K):
+        _, text = self.entries.pop(self.ids.pop(key))
+        count = len(trigrams(text) - STOP_GRAMS)
+        self.live_postings -= count
+        self.dead_postings += count
+        if self.dead_postings > max(self.live_postings, 4096):
+            self._compact()
+
+    def _compact(self):
+        """Renumber all strings and rebuild posting lists without removed
+        strings."""
+        entries = list(self.entries.values())
+        self.ids.clear()
+        self.entries.clear()
+        self.postings.clear()
+        self.live_postings = self.dead_postings = 0
+        for entry_id, (key, text) in enumerate(entries):
+            self.ids[key] = entry_id
+            self.entries[entry_id] = (key, text)
+            self._post(entry_id, text)
+        self.next_id = len(entries)
+
+    def _search(self, grams: Set[str], literals: List[str]) -> Set[K]:
+        """Keys of strings containing all literals, found from the shortest
+        posting list of the trigrams given."""
+        grams = grams - STOP_GRAMS
+        if grams:
+            ids: Iterable[int] = min((self.postings.get(i, ()) for i in grams), key=len)
+        else:
+            ids = self.entries.keys()
+        result = set()
+        for entry_id in ids:
+            entry = self.entries.get(entry_id)
+            if entry is not None and all(i in entry[1] for i in literals):
+                result.add(entry[0])
+        return result
+
+    def search(self, query: Union[str, Pattern]) -> Set[K]:
+        """Keys whose strings may match a filter.
+
+        For a plain string, these are the keys whose strings contain it,
+        ignoring case. For a regular expression, these are the keys whose
+        strings contain all literals required by it, which must be checked
+        against it again.
+        """
+        with self.lock:
+            if isinstance(query, str):
+                literals = [query.lower()]
+            else:
+                literals = required_literals(query)
+            grams: Set[str] = set()
+            for literal in literals:
+                grams.update(trigrams(literal))
+            return self._search(grams, literals)
@@ -0,0 +1,115 @@
+# coding: utf-8
+"""
+Circuit breaker of synchronous calls to slave channels, with a time limit
+on each call.
+"""
+
+import logging
+import threading
+import time
+from typing import Callable, Tuple, Type, TypeVar, Any, Optional
+
+FAILURE_THRESHOLD = 3
+"""Number of consecutive failures to open the circuit."""
+RESET_TIMEOUT = 60.
+"""Seconds to keep the circuit open before a trial call is allowed."""
+CALL_TIMEOUT = 5.
+"""Seconds to wait for a call to return."""
+
+_T = TypeVar("_T")
+
+
+class CircuitOpen(Exception):
+    """Raised instead of making a call while the circuit is open."""
+
+
+class CallTimeout(Exception):
+    """Raised when a call does not return in time. The call keeps running
+    in a daemon thread, and its result is discarded."""
+
+
+class CircuitBreaker:
+    """Stop calling a module after consecutive failures.
+
+    Calls raising other exceptions than ``expected`` ones, or not returning
+    in ``call_timeout`` seconds, are failures. After ``failure_threshold``
+    consecutive failures, the circuit is open and calls fail immediately
+    with ``CircuitOpen`` for ``reset_timeout`` seconds. Then one trial call
+    is allowed at a time, closing the circuit if it succeeds, or opening it
+    again otherwise.
+    """
+
+    logger = logging.getLogger(__name__)
+
+    def __init__(self, name: str, failure_threshold: int = FAILURE_THRESHOLD,
+                 reset_timeout: float = RESET_TIMEOUT, call_timeout: float = CALL_TIMEOUT,
+                 expected: Tuple[Type[BaseException], ...] = ()):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.call_timeout = call_timeout
+        self.expected = expected
+        self.lock = threading.Lock()
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.trial_running = False
+
+    @property
+    def is_open(self) -> bool:
+        """If calls are failed immediately now."""
+        with self.lock:
+            return self._is_open()
+
+    def _is_open(self) -> bool:
+        if self.opened_at is None:
+            return False
+        return self.trial_running or time.monotonic() - self.opened_at < self.reset_timeout
+
+    def call(self, func: Callable[..., _T], *args: Any, **kwargs: Any) -> _T:
+        """Call a function if the circuit is not open.
+
+        Raises:
+            CircuitOpen: if the circuit is open.
+            CallTimeout: if the call does not return in time.
+        """
+        with self.lock:
+            if self._is_open():
+                raise CircuitOpen(self.name)
+            trial = self.opened_at is not None
+            self.trial_running = trial
+
+        result: list = []
+        error: list = []
+
+        def run():
+            try:
+                result.append(func(*args, **kwargs))
+            except BaseException as e:
+                error.append(e)
+
+        thread = threading.Thread(target=run, name=f"ETM call thread of {self.name}", daemon=True)
+        thread.start()
+        thread.join(self.call_timeout)
+        if thread.is_alive():
+            self._record(False)
+            raise CallTimeout(f"{self.name} did not respond in {self.call_timeout} seconds.")
+        if error:
+            self._record(isinstance(error[0], self.expected))
+            raise error[0]
+        self._record(True)
+        return result[0]
+
+    def _record(self, success: bool):
+        with self.lock:
+            self.trial_running = False
+            if success:
+                if self.opened_at is not None:
+                    self.logger.info("Circuit of %s is closed.", self.name)
+                self.failures = 0
+                self.opened_at = None
+                return
+            self.failures += 1
+            if self.opened_at is not None or self.failures >= self.failure_threshold:
+                self.logger.warning("Circuit of %s is open for %s seconds after %s failures.",
+                                    self.name, self.reset_timeout, self.failures)
+                self.opened_at = time.monotonic()
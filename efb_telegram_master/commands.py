@@ -1,7 +1,7 @@
 # coding=utf-8
 import html
 import logging
-from typing import Tuple, Dict, TYPE_CHECKING, List, Any, Union, Optional
+from typing import TYPE_CHECKING, List, Any, Union, Optional
 
 from telegram import Message, Update
 from telegram.ext import CommandHandler, ConversationHandler, CallbackQueryHandler, MessageHandler, CallbackContext
@@ -16,6 +16,7 @@ from .locale_mixin import LocaleMixin
 
 if TYPE_CHECKING:
     from . import TelegramChannel
+    from .conversation_store import ConversationStore
 
 
 class ETMCommandMsgStorage:
@@ -39,7 +40,7 @@ class CommandsManager(LocaleMixin):
     def __init__(self, channel: 'TelegramChannel'):
         self.channel: 'TelegramChannel' = channel
         self.bot = channel.bot_manager
-        self.msg_storage: Dict[Tuple[int, int], ETMCommandMsgStorage] = dict()
+        self.msg_storage: 'ConversationStore' = channel.conversation_store
         self.logger = logging.getLogger(__name__)
 
         self.bot.dispatcher.add_handler(
@@ -63,6 +64,7 @@ class CommandsManager(LocaleMixin):
         )
 
         self.bot.dispatcher.add_handler(self.command_conv)
+        self.msg_storage.add_handler("command", self.command_conv)
 
         self.modules_list: List[Any[SlaveChannel, Middleware]] = []
         for i in sorted(coordinator.slaves.keys()):
@@ -0,0 +1,226 @@
+# coding=utf-8
+
+"""Column-level compression of message log entries, with dictionaries
+trained on existing entries.
+
+Compressed values are stored as blobs with the following layout:
+
+- ``0xC5``: magic byte, distinct from the first byte of pickles (``0x80``)
+  and of ``msg_log_codec`` data (``0xE7``)
+- Algorithm ID: ``1`` for zlib, ``2`` for zstd
+- Dictionary ID as LEB128 varint, ``0`` if no dictionary is used
+- Compressed data
+
+zlib is always available. zstd requires the optional ``zstandard``
+package, which can be installed with ``pip install efb-telegram-master[zstd]``.
+"""
+
+import logging
+import re
+import threading
+import zlib
+from abc import ABC, abstractmethod
+from collections import Counter
+from typing import Dict, Optional, Sequence, Tuple, Type
+
+__all__ = ['MAGIC', 'ALGORITHMS', 'Compressor', 'ZlibCompressor', 'ZstdCompressor',
+           'ColumnCompression', 'compression']
+
+MAGIC = 0xC5
+"""First byte of compressed values."""
+
+DICTIONARY_SIZE = 32 * 1024
+"""Size of trained dictionaries in bytes. This is also the window size of
+zlib, where a larger dictionary would not be used.
+"""
+
+
+class Compressor(ABC):
+    """Compressor of one algorithm with an optional dictionary."""
+
+    algorithm_id: int
+    default_level: int
+
+    def __init__(self, dict_id: int = 0, dictionary: Optional[bytes] = None, level: Optional[int] = None):
+        self.dict_id = dict_id
+        self.dictionary = dictionary
+        self.level = self.default_level if level is None else level
+
+    @abstractmethod
+    def compress(self, data: bytes) -> bytes:
+        raise NotImplementedError()
+
+    @abstractmethod
+    def decompress(self, data: bytes) -> bytes:
+        raise NotImplementedError()
+
+    @staticmethod
+    @abstractmethod
+    def train(samples: Sequence[bytes], size: int = DICTIONARY_SIZE) -> bytes:
+        """Train a dictionary from samples of data."""
+        raise NotImplementedError()
+
+
+class ZlibCompressor(Compressor):
+    """Raw deflate compressor with a preset dictionary."""
+
+    algorithm_id = 1
+    default_level = 6
+
+    def compress(self, data: bytes) -> bytes:
+        if self.dictionary:
+            compressor = zlib.compressobj(self.level, wbits=-15, zdict=self.dictionary)
+        else:
+            compressor = zlib.compressobj(self.level, wbits=-15)
+        return compressor.compress(data) + compressor.flush()
+
+    def decompress(self, data: bytes) -> bytes:
+        if self.dictionary:
+            decompressor = zlib.decompressobj(wbits=-15, zdict=self.dictionary)
+        else:
+            decompressor = zlib.decompressobj(wbits=-15)
+        return decompressor.decompress(data) + decompressor.flush()
+
+    @staticmethod
+    def train(samples: Sequence[bytes], size: int = DICTIONARY_SIZE) -> bytes:
+        """Build a preset dictionary from the most common words and word
+        pairs in samples, weighted by their length.
+
+        Deflate encodes closer matches with fewer bits, so the most valuable
+        strings are placed at the end of the dictionary.
+        """
+        counter: Counter = Counter()
+        for sample in samples:
+            words = re.findall(rb"\S+\s*", sample)
+            counter.update(words)
+            counter.update(a + b for a, b in zip(words, words[1:]))
+        scored = sorted(((count * len(word), word) for word, count in counter.items() if count > 1),
+                        reverse=True)
+        selected = []
+        total = 0
+        for _, word in scored:
+            if total + len(word) > size:
+                continue
+            selected.append(word)
+            total += len(word)
+        return b"".join(reversed(selected))
+
+
+class ZstdCompressor(Compressor):
+    """Zstandard compressor with a trained dictionary."""
+
+    algorithm_id = 2
+    default_level = 3
+
+    def __init__(self, dict_id: int = 0, dictionary: Optional[bytes] = None, level: Optional[int] = None):
+        # Import only when used as ``zstandard`` is an optional dependency
+        import zstandard
+        super().__init__(dict_id, dictionary, level)
+        self.zstd_dict = zstandard.ZstdCompressionDict(dictionary) if dictionary else None
+        # Compressor and decompressor objects are not thread safe
+        self.local = threading.local()
+
+    def _get_objects(self):
+        import zstandard
+        if not hasattr(self.local, 'compressor'):
+            self.local.compressor = zstandard.ZstdCompressor(level=self.level, dict_data=self.zstd_dict)
+            self.local.decompressor = zstandard.ZstdDecompressor(dict_data=self.zstd_dict)
+        return self.local.compressor, self.local.decompressor
+
+    def compress(self, data: bytes) -> bytes:
+        return self._get_objects()[0].compress(data)
+
+    def decompress(self, data: bytes) -> bytes:
+        return self._get_objects()[1].decompress(data)
+
+    @staticmethod
+    def train(samples: Sequence[bytes], size: int = DICTIONARY_SIZE) -> bytes:
+        import zstandard
+        return zstandard.train_dictionary(size, list(samples)).as_bytes()
+
+
+ALGORITHMS: Dict[str, Type[Compressor]] = {
+    "zlib": ZlibCompressor,
+    "zstd": ZstdCompressor,
+}
+"""Compressor classes by algorithm name."""
+
+
+class ColumnCompression:
+    """Compressors of all known dictionaries, and the one used for new
+    values. Shared by all compressed fields in the database.
+    """
+
+    logger = logging.getLogger(__name__)
+
+    def __init__(self):
+        self.compressors: Dict[Tuple[int, int], Compressor] = {}
+        """Compressors by algorithm ID and dictionary ID."""
+        self.active: Optional[Compressor] = None
+        """Compressor used for new values, ``None`` to disable compression."""
+        self.min_size = 128
+        """Values shorter than this in bytes are not compressed."""
+
+    def add(self, compressor: Compressor):
+        """Register a compressor to decompress values with."""
+        self.compressors[(compressor.algorithm_id, compressor.dict_id)] = compressor
+
+    @staticmethod
+    def is_compressed(value) -> bool:
+        return isinstance(value, (bytes, bytearray, memoryview)) and len(value) > 2 and value[0] == MAGIC
+
+    def compress(self, data: bytes) -> Optional[bytes]:
+        """Compress a value with the active compressor.
+
+        Returns:
+            The compressed value, ``None`` if compression is disabled or
+            does not reduce the size.
+        """
+        compressor = self.active
+        if compressor is None or len(data) < self.min_size:
+            return None
+        header = bytearray((MAGIC, compressor.algorithm_id))
+        dict_id = compressor.dict_id
+        while dict_id > 0x7F:
+            header.append((dict_id & 0x7F) | 0x80)
+            dict_id >>= 7
+        header.append(dict_id)
+        compressed = bytes(header) + compressor.compress(data)
+        if len(compressed) >= len(data):
+            return None
+        return compressed
+
+    def decompress(self, value: bytes) -> bytes:
+        """Decompress a value produced by :meth:`compress`.
+
+        Raises:
+            ValueError: If the algorithm or dictionary of the value is unknown.
+        """
+        value = bytes(value)
+        algorithm_id = value[1]
+        dict_id = 0
+        shift = 0
+        pos = 2
+        while True:
+            byte = value[pos]
+            pos += 1
+            dict_id |= (byte & 0x7F) << shift
+            if byte < 0x80:
+                break
+            shift += 7
+        compressor = self.compressors.get((algorithm_id, dict_id))
+        if compressor is None:
+            if dict_id == 0:
+                for cls in ALGORITHMS.values():
+                    if cls.algorithm_id == algorithm_id:
+                        compressor = cls()
+                        self.add(compressor)
+            if compressor is None:
+                raise ValueError(f"Unknown compression algorithm {algorithm_id} or dictionary {dict_id}")
+        return compressor.decompress(value[pos:])
+
+
+compression = ColumnCompression()
+"""Column compression shared by all compressed fields, configured by
+``DatabaseManager``.
+"""
@@ -0,0 +1,261 @@
+# coding: utf-8
+"""
+Data of conversations started from inline buttons of messages, such as
+chat lists and command messages, kept for a limited time and up to a
+limited number of conversations.
+"""
+
+import io
+import logging
+import pickle
+import time
+import zlib
+from collections import OrderedDict
+from threading import RLock, Timer
+from typing import TYPE_CHECKING, Any, Dict, Iterator, MutableMapping, Optional, Tuple
+
+from telegram import Bot
+from telegram.ext import ConversationHandler
+
+from ehforwarderbot import coordinator, Channel, Middleware, utils as efb_utils
+from .chat import ETMChatType
+from .utils import TelegramChatID, TelegramMessageID
+
+if TYPE_CHECKING:
+    from . import TelegramChannel
+
+ConversationKey = Tuple[TelegramChatID, TelegramMessageID]
+"""Telegram chat ID and message ID of the message of a conversation."""
+
+STORE_VERSION = 1
+"""Version of the format of saved conversation files."""
+SWEEP_INTERVAL = 60
+"""Interval of removing expired conversations in seconds."""
+
+
+class _Pickler(pickle.Pickler):
+    def __init__(self, file: io.BytesIO, store: 'ConversationStore'):
+        super().__init__(file, pickle.HIGHEST_PROTOCOL)
+        self.store = store
+
+    def persistent_id(self, obj: Any) -> Optional[Tuple]:
+        return self.store.reference(obj)
+
+
+class _Unpickler(pickle.Unpickler):
+    def __init__(self, file: io.BytesIO, store: 'ConversationStore'):
+        super().__init__(file)
+        self.store = store
+
+    def persistent_load(self, pid: Tuple) -> Any:
+        return self.store.dereference(pid)
+
+
+class ConversationStore(MutableMapping[ConversationKey, Any]):
+    """Data of conversations by their messages, shared by chat lists and
+    command messages.
+
+    A conversation expires when its data is not set or read for
+    ``conversation_ttl`` seconds, and the least recently used ones are
+    removed when there are more than ``conversation_store_size``. Its
+    states in the conversation handlers added are removed with it, so that
+    buttons of expired conversations are handled by fallbacks.
+
+    If ``persist_conversations`` is enabled, conversations are saved when
+    ETM stops and loaded when it starts. Modules, chats, the chat manager,
+    the database and the bot referred to by their data are saved as
+    references, and conversations referring to modules no longer enabled
+    are dropped.
+    """
+
+    def __init__(self, channel: 'TelegramChannel'):
+        self.channel = channel
+        self.logger = logging.getLogger(__name__)
+        self.ttl: int = channel.flag("conversation_ttl")
+        self.size: int = channel.flag("conversation_store_size")
+        self.persist: bool = channel.flag("persist_conversations")
+
+        self.lock = RLock()
+        self.entries: 'OrderedDict[ConversationKey, Tuple[float, Any]]' = OrderedDict()
+        """Expiry time and data of conversations, least recently used first."""
+        self.handlers: Dict[str, ConversationHandler] = dict()
+        """Conversation handlers with states of conversations, by name."""
+
+        self.path = efb_utils.get_data_path(channel.channel_id) / "conversations.pickle"
+        self.sweep_timer: Optional[Timer] = None
+        self._schedule_sweep()
+
+    def add_handler(self, name: str, handler: ConversationHandler):
+        """Remove states of conversations from a handler when they expire,
+        and save them with the conversations."""
+        self.handlers[name] = handler
+
+    def __getitem__(self, key: ConversationKey) -> Any:
+        with self.lock:
+            _, value = self.entries[key]
+            self.entries[key] = (time.time() + self.ttl, value)
+            self.entries.move_to_end(key)
+            return value
+
+    def __setitem__(self, key: ConversationKey, value: Any):
+        with self.lock:
+            self.entries[key] = (time.time() + self.ttl, value)
+            self.entries.move_to_end(key)
+        self.sweep()
+
+    def __delitem__(self, key: ConversationKey):
+        with self.lock:
+            del self.entries[key]
+
+    def __contains__(self, key: object) -> bool:
+        with self.lock:
+            return key in self.entries
+
+    def __iter__(self) -> Iterator[ConversationKey]:
+        with self.lock:
+            return iter(list(self.entries))
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def sweep(self):
+        """Remove expired conversations, and the least recently used ones
+        over the size limit, with their states in handlers."""
+        now = time.time()
+        removed = []
+        with self.lock:
+            while self.entries:
+                key, (expiry, _) = next(iter(self.entries.items()))
+                if expiry > now and len(self.entries) <= self.size:
+                    break
+                del self.entries[key]
+                removed.append(key)
+            for key in removed:
+                for handler in self.handlers.values():
+                    handler.conversations.pop(key, None)
+        if removed:
+            self.logger.debug("Removed %s expired conversations, %s remaining.", len(removed), len(self.entries))
+
+    def _schedule_sweep(self):
+        self.sweep_timer = Timer(SWEEP_INTERVAL, self._run_scheduled_sweep)
+        self.sweep_timer.daemon = True
+        self.sweep_timer.start()
+
+    def _run_scheduled_sweep(self):
+        self.sweep()
+        self._schedule_sweep()
+
+    def stop(self):
+        """Stop removing expired conversations periodically, and save
+        conversations if enabled.
+        """
+        if self.sweep_timer is not None:
+            self.sweep_timer.cancel()
+        if self.persist:
+            self.save()
+
+    def reference(self, obj: Any) -> Optional[Tuple]:
+        """Reference to save an object as, ``None`` to save it by value."""
+        if isinstance(obj, ETMChatType):
+            return "chat", obj.module_id, obj.uid
+        if isinstance(obj, Channel):
+            return "module", obj.channel_id
+        if isinstance(obj, Middleware):
+            return "module", obj.middleware_id
+        if isinstance(obj, Bot):
+            return "bot",
+        if obj is self.channel.chat_manager:
+            return "chat_manager",
+        if obj is self.channel.db:
+            return "db",
+        return None
+
+    def dereference(self, pid: Tuple) -> Any:
+        """Object of a reference from ``reference``.
+
+        Raises:
+            NameError: if the module referred to is not enabled.
+        """
+        kind = pid[0]
+        if kind == "chat":
+            return self.channel.chat_manager.get_chat(pid[1], pid[2], build_dummy=True)
+        if kind == "module":
+            return coordinator.get_module_by_id(pid[1])
+        if kind == "bot":
+            return self.channel.bot_manager.updater.bot
+        if kind == "chat_manager":
+            return self.channel.chat_manager
+        if kind == "db":
+            return self.channel.db
+        raise pickle.UnpicklingError(f"Unknown reference {pid!r}")
+
+    def dumps(self, obj: Any) -> bytes:
+        file = io.BytesIO()
+        _Pickler(file, self).dump(obj)
+        return file.getvalue()
+
+    def loads(self, data: bytes) -> Any:
+        return _Unpickler(io.BytesIO(data), self).load()
+
+    def save(self):
+        """Write conversations and their states in handlers to file."""
+        start = time.perf_counter()
+        with self.lock:
+            entries = list(self.entries.items())
+        saved = []
+        for key, (expiry, value) in entries:
+            states = {name: handler.conversations[key] for name, handler in self.handlers.items()
+                      if key in handler.conversations}
+            # noinspection PyBroadException
+            try:
+                saved.append((key, expiry, self.dumps((value, states))))
+            except Exception:
+                self.logger.debug("Conversation %s cannot be saved, skipped.", key, exc_info=True)
+        # noinspection PyBroadException
+        try:
+            data = zlib.compress(pickle.dumps((STORE_VERSION, saved), pickle.HIGHEST_PROTOCOL))
+            partial = self.path.with_name(self.path.name + ".partial")
+            partial.write_bytes(data)
+            partial.replace(self.path)
+        except Exception:
+            self.logger.exception("Failed to save conversations to %s.", self.path)
+            return
+        self.logger.debug("Saved %s conversations (%s bytes) in %.2f s.",
+                          len(saved), len(data), time.perf_counter() - start)
+
+    def load(self):
+        """Load conversations saved on the last run, if enabled, and restore
+        their states in handlers.
+
+        Conversation handlers must be added before loading.
+        """
+        if not self.persist or not self.path.exists():
+            return
+        # noinspection PyBroadException
+        try:
+            version, saved = pickle.loads(zlib.decompress(self.path.read_bytes()))
+        except Exception:
+            self.logger.exception("Failed to load conversations from %s.", self.path)
+            return
+        if version != STORE_VERSION:
+            self.logger.warning("Saved conversations of version %s are not supported, ignored.", version)
+            return
+        now = time.time()
+        loaded = 0
+        for key, expiry, data in saved:
+            if expiry <= now:
+                continue
+            # noinspection PyBroadException
+            try:
+                value, states = self.loads(data)
+            except Exception:
+                self.logger.debug("Conversation %s cannot be loaded, skipped.", key, exc_info=True)
+                continue
+            with self.lock:
+                self.entries[key] = (expiry, value)
+                for name, state in states.items():
+                    if name in self.handlers:
+                        self.handlers[name].conversations[key] = state
+            loaded += 1
+        self.sweep()
+        self.logger.info("Loaded %s conversations from %s.", loaded, self.path)
@@ -2,17 +2,19 @@
 
 import datetime
 import logging
-import pickle
+import re
+import sqlite3
 import time
-from contextlib import suppress
-from functools import partial
-from queue import Queue
-from threading import Thread
-from typing import List, Optional, Tuple, Callable, Sequence, Any, Dict, Collection, TYPE_CHECKING
+from contextlib import suppress, contextmanager
+from pathlib import Path
+from queue import Queue, Empty
+from threading import Thread, Lock, Timer
+from typing import List, Optional, Tuple, Callable, Sequence, Any, Dict, Collection, Iterator, Iterable, TYPE_CHECKING
 
 from peewee import Model, TextField, DateTimeField, CharField, SqliteDatabase, DoesNotExist, fn, BlobField, \
-    OperationalError
+    OperationalError, IntegerField, Cast, SQL, EXCLUDED, chunked, FieldAccessor
 from playhouse.migrate import SqliteMigrator, migrate
+from playhouse.sqlite_ext import FTS5Model, SearchField
 from telegram import Message
 from typing_extensions import TypedDict
 
@@ -20,17 +22,31 @@ from ehforwarderbot import Message as EFBMessage
 from ehforwarderbot import utils, Channel, coordinator, MsgType
 from ehforwarderbot.message import Substitutions, MessageCommands, MessageAttribute
 from ehforwarderbot.types import ModuleID, ChatID, MessageID, ReactionName
+from .chat_assoc_table import ChatAssocTable
+from .chat import ETMGroupChat
 from .chat_object_cache import ChatObjectCacheManager
-from .message import ETMMsg
+from . import msg_log_codec, msg_log_search
+from .compression import compression, ALGORITHMS, MAGIC as COMPRESSION_MAGIC
+from .db_backup import DatabaseBackup, BackupCancelled, BACKUP_KEEP, BACKUP_MAX_RATE_KIB, BACKUP_STEP_KIB
+from .storage import StorageBackend
+from .message import ETMMsg, LazyETMMsg
+from .msg_log_cache import MsgLogCache, MSG_LOG_CACHE_SIZE
 from .msg_type import TGMsgType
 from .utils import TelegramChatID, EFBChannelChatIDStr, TgChatMsgIDStr, message_id_to_str, \
-    chat_id_to_str, OldMsgID, chat_id_str_to_id
+    chat_id_to_str, OldMsgID, chat_id_str_to_id, message_id_str_to_id, message_link
 
 if TYPE_CHECKING:
     from . import TelegramChannel
     from .chat import ETMChatMember, ETMChatType
 
 database = SqliteDatabase(None)
+"""SQLite database shared by all threads.
+
+Peewee opens a separate connection for each thread, so lookups from
+different threads do not share a connection. Write transactions are opened
+with ``BEGIN IMMEDIATE`` to take the write lock upfront, so that there is
+only one writer at a time, and in WAL mode readers are never blocked by it.
+"""
 
 PickledDict = TypedDict('PickledDict', {
     "target": EFBChannelChatIDStr,
@@ -57,21 +73,75 @@ class BaseModel(Model):
         database = database
 
 
+class CompressedFieldAccessor(FieldAccessor):
+    """Decompress the value of a compressed field upon its first access."""
+
+    def __get__(self, instance, instance_type=None):
+        if instance is not None:
+            value = instance.__data__.get(self.name)
+            if compression.is_compressed(value):
+                value = self.field.decompress(value)
+                instance.__data__[self.name] = value
+            return value
+        return self.field
+
+
+class CompressedTextField(TextField):
+    """Text field stored compressed as a blob when compression is enabled."""
+
+    accessor_class = CompressedFieldAccessor
+
+    def db_value(self, value):
+        if value is None or compression.is_compressed(value):
+            return value
+        value = self.adapt(value)
+        compressed = compression.compress(value.encode())
+        return value if compressed is None else compressed
+
+    def python_value(self, value):
+        if compression.is_compressed(value):
+            return bytes(value)
+        return super().python_value(value)
+
+    @staticmethod
+    def decompress(value: bytes) -> str:
+        return compression.decompress(value).decode()
+
+
+class CompressedBlobField(BlobField):
+    """Blob field stored compressed when compression is enabled."""
+
+    accessor_class = CompressedFieldAccessor
+
+    def db_value(self, value):
+        if isinstance(value, (bytes, bytearray, memoryview)) and not compression.is_compressed(value):
+            compressed = compression.compress(bytes(value))
+            if compressed is not None:
+                value = compressed
+        return super().db_value(value)
+
+    @staticmethod
+    def decompress(value: bytes) -> bytes:
+        return compression.decompress(value)
+
+
 class ChatAssoc(BaseModel):
-    master_uid = TextField()
-    slave_uid = TextField()
+    master_uid = TextField(index=True)
+    slave_uid = TextField(index=True)
 
 
 class MsgLog(BaseModel):
     master_msg_id = TextField(unique=True, primary_key=True)
     """Message ID from Telegram."""
-    master_msg_id_alt = TextField(null=True)
+    master_msg_id_alt = TextField(null=True, index=True)
     """Editable message ID from Telegram if ``master_msg_id`` is not editable
     and a separate one is sent.
     """
+    master_chat_id = IntegerField(null=True)
+    """Telegram chat ID of ``master_msg_id``."""
     slave_message_id = TextField()
     """Message from slave channel."""
-    text = TextField()
+    text = CompressedTextField()
     """Text in the message."""
     slave_origin_uid = TextField()
     """Channel + chat ID of chat the message is sent to."""
@@ -92,25 +162,107 @@ class MsgLog(BaseModel):
     """Unique file ID of attachment in Telegram."""
     msg_type = TextField()
     """Message type in EFB framework."""
-    pickle = BlobField(null=True)
-    """Miscellaneous data serialized with ``pickle``, per spec in
-    ``DatabaseManager.pickle_misc_msg()``.
+    pickle = CompressedBlobField(null=True)
+    """Miscellaneous data encoded with ``msg_log_codec``, per spec in
+    ``DatabaseManager.pickle_misc_msg()``. Older entries are serialized
+    with ``pickle``.
     """
     sent_to = TextField()
     """Module ID of the message sent to."""
     time = DateTimeField(default=datetime.datetime.now, null=True)
     """Time of the message sent."""
 
+    class Meta:
+        indexes = (
+            # Lookup by slave message ID, used on edits, replies and reactions
+            (('slave_origin_uid', 'slave_message_id', 'time'), False),
+            # Last message of a slave chat
+            (('slave_origin_uid', 'time'), False),
+            # Recent slave chats of a Telegram chat
+            (('master_chat_id', 'slave_origin_uid', 'time'), False),
+        )
+
     def build_etm_msg(self, chat_manager: ChatObjectCacheManager,
-                      recur: bool = True) -> ETMMsg:
-        c_module, c_id, _ = chat_id_str_to_id(self.slave_origin_uid)
-        a_module, a_id, a_grp = chat_id_str_to_id(self.slave_member_uid)
-        chat: 'ETMChatType' = chat_manager.get_chat(c_module, c_id, build_dummy=True)
-        author: 'ETMChatMember' = chat_manager.get_chat_member(a_module, a_grp, a_id, build_dummy=True)  # type: ignore
-        msg = ETMMsg(
+                      recur: bool = True, db: Optional['DatabaseManager'] = None) -> ETMMsg:
+        """Build a message object from the log entry.
+
+        Chat, author, target and miscellaneous data are decoded and resolved
+        only when they are accessed, see ``LazyETMMsg``. Miscellaneous data
+        is validated upfront, so that a broken entry is still reported here.
+
+        Args:
+            chat_manager: Chat manager to resolve chats and members with
+            recur: Resolve the target message of this message
+            db: Database manager to look up the target message with, only
+                ``tgdata.db`` is looked up if not provided.
+
+        Raises:
+            pickle.UnpicklingError: If miscellaneous data is malformed.
+        """
+        if self.pickle:
+            msg_log_codec.decode(self.pickle, fields=())
+
+        def get_misc(key: str, default: Any = None) -> Any:
+            if not self.pickle:
+                return default
+            return msg_log_codec.decode(self.pickle, fields=(key,)).get(key, default)
+
+        def resolve_chat() -> 'ETMChatType':
+            c_module, c_id, _ = chat_id_str_to_id(self.slave_origin_uid)
+            return chat_manager.get_chat(c_module, c_id, build_dummy=True)
+
+        def resolve_author() -> 'ETMChatMember':
+            a_module, a_id, a_grp = chat_id_str_to_id(self.slave_member_uid)
+            return chat_manager.get_chat_member(a_module, a_grp, a_id, build_dummy=True)  # type: ignore
+
+        def resolve_target() -> Optional[ETMMsg]:
+            target = get_misc('target')
+            if not target or not recur:
+                return None
+            if db is not None:
+                target_row = db.get_msg_log(master_msg_id=target)
+            else:
+                target_row = MsgLog.get_or_none(MsgLog.master_msg_id == target)
+            if target_row is None:
+                return None
+            return target_row.build_etm_msg(chat_manager, recur=False, db=db)
+
+        def resolve_substitutions() -> Optional[Substitutions]:
+            substitutions = get_misc('substitutions')
+            if substitutions is None:
+                return None
+            subs = Substitutions({})
+            for sk, sv in substitutions.items():
+                module_id, chat_id, group_id = chat_id_str_to_id(sv)
+                if group_id:
+                    subs[sk] = chat_manager.get_chat_member(module_id, group_id, chat_id, build_dummy=True)
+                else:
+                    subs[sk] = chat_manager.get_chat(module_id, chat_id, build_dummy=True)
+            return subs
+
+        def resolve_reactions() -> Dict[ReactionName, List['ETMChatMember']]:
+            reactions: Dict[ReactionName, List[ETMChatMember]] = {}
+            for rk, rv in get_misc('reactions', {}).items():
+                reactions[rk] = []
+                for idx in rv:
+                    module_id, chat_id, group_id = chat_id_str_to_id(idx)
+                    reactions[rk].append(chat_manager.get_chat_member(module_id, group_id, chat_id, build_dummy=True))  # type: ignore
+            return reactions
+
+        # Miscellaneous data, per spec in ``PickledDict``
+        resolvers: Dict[str, Callable[[], Any]] = {
+            "chat": resolve_chat,
+            "author": resolve_author,
+            "target": resolve_target,
+            "is_system": lambda: get_misc('is_system', False),
+            "attributes": lambda: get_misc('attributes'),
+            "commands": lambda: get_misc('commands'),
+            "substitutions": resolve_substitutions,
+            "reactions": resolve_reactions,
+        }
+        msg = LazyETMMsg(
+            resolvers,
             uid=self.slave_message_id,
-            chat=chat,
-            author=author,
             text=self.text,
             type=MsgType(self.msg_type),
             type_telegram=TGMsgType(self.media_type),
@@ -121,46 +273,66 @@ class MsgLog(BaseModel):
             to_module = coordinator.get_module_by_id(self.sent_to)
             if isinstance(to_module, Channel):
                 msg.deliver_to = to_module
-
-        # - ``target``: ``master_msg_id`` of the target message
-        # - ``is_system``
-        # - ``attributes``
-        # - ``commands``
-        # - ``substitutions``: ``Dict[Tuple[int, int], SlaveChatID]``
-        # - ``reactions``: ``Dict[str, Collection[SlaveChatID]]``
-        if self.pickle:
-            misc_data: PickledDict = pickle.loads(self.pickle)
-
-            if 'target' in misc_data and recur:
-                target_row = self.get_or_none(MsgLog.master_msg_id == misc_data['target'])
-                if target_row:
-                    msg.target = target_row.build_etm_msg(chat_manager, recur=False)
-            if 'is_system' in misc_data:
-                msg.is_system = misc_data['is_system']
-            if 'attributes' in misc_data:
-                msg.attributes = misc_data['attributes']
-            if 'commands' in misc_data:
-                msg.commands = misc_data['commands']
-            if 'substitutions' in misc_data:
-                subs = Substitutions({})
-                for sk, sv in misc_data['substitutions'].items():
-                    module_id, chat_id, group_id = chat_id_str_to_id(sv)
-                    if group_id:
-                        subs[sk] = chat_manager.get_chat_member(module_id, group_id, chat_id, build_dummy=True)
-                    else:
-                        subs[sk] = chat_manager.get_chat(module_id, chat_id, build_dummy=True)
-                msg.substitutions = subs
-            if 'reactions' in misc_data:
-                reactions: Dict[ReactionName, List[ETMChatMember]] = {}
-                for rk, rv in misc_data['reactions'].items():
-                    reactions[rk] = []
-                    for idx in rv:
-                        module_id, chat_id, group_id = chat_id_str_to_id(idx)
-                        reactions[rk].append(chat_manager.get_chat_member(module_id, group_id, chat_id, build_dummy=True))  # type: ignore
-                msg.reactions = reactions
         return msg
 
 
+class MsgLogIndex(FTS5Model):
+    """Full-text index of message log text, where ``rowid`` is the same as
+    in ``msglog``.
+
+    Entries are written from Python when message logs are committed, as
+    text in ``msglog`` may be compressed, and removed by a trigger when
+    message logs are deleted.
+
+    The table is only created if SQLite supports it, per ``is_supported``.
+    """
+    MIN_SQLITE_VERSION = (3, 34, 0)
+    """Minimum SQLite version with the trigram tokenizer of FTS5."""
+    text = SearchField()
+    """Text of the message."""
+    master_chat_id = SearchField(unindexed=True)
+    """Telegram chat ID of the message."""
+
+    class Meta:
+        database = database
+        options = {'tokenize': 'trigram'}
+
+    @classmethod
+    def is_supported(cls) -> bool:
+        """If SQLite is built with FTS5 and has its trigram tokenizer."""
+        if sqlite3.sqlite_version_info < cls.MIN_SQLITE_VERSION:
+            return False
+        options = {i for i, in database.execute_sql("PRAGMA compile_options").fetchall()}
+        return "ENABLE_FTS5" in options
+
+    @classmethod
+    def create_delete_trigger(cls):
+        database.execute_sql(
+            "CREATE TRIGGER IF NOT EXISTS msglogindex_delete AFTER DELETE ON msglog "
+            "BEGIN DELETE FROM msglogindex WHERE rowid = old.rowid; END"
+        )
+
+    @classmethod
+    def has_delete_trigger(cls) -> bool:
+        return database.execute_sql(
+            "SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = 'msglogindex_delete'"
+        ).fetchone() is not None
+
+    @classmethod
+    def drop_delete_trigger(cls):
+        database.execute_sql("DROP TRIGGER IF EXISTS msglogindex_delete")
+
+
+class ArchivedMsgLog(MsgLog):
+    """Message log entry moved to a monthly archive file, which is attached
+    to the connection as ``msglog_archive`` by ``MsgLogArchive``.
+    """
+
+    class Meta:
+        schema = "msglog_archive"
+        table_name = "msglog"
+
+
 class SlaveChatInfo(BaseModel):
     slave_channel_id = TextField()
     slave_channel_emoji = CharField()
@@ -171,29 +343,568 @@ class SlaveChatInfo(BaseModel):
     slave_chat_type = CharField()
     pickle = BlobField(null=True)
 
+    @classmethod
+    def chat_key(cls) -> tuple:
+        """Columns that identify a chat, where a ``NULL`` group ID is
+        treated as an empty string, so that it is unique in an index.
+        """
+        return cls.slave_channel_id, cls.slave_chat_uid, fn.IFNULL(cls.slave_chat_group_id, SQL("''"))
+
+
+SlaveChatInfo.add_index(SlaveChatInfo.index(
+    *SlaveChatInfo.chat_key(), unique=True,
+    name="slavechatinfo_slave_channel_id_slave_chat_uid_slave_chat_group_id"))
+
+
+class ChatMemberInfo(BaseModel):
+    module_id = TextField()
+    """Module ID of the group chat."""
+    group_id = TextField()
+    """ID of the group chat."""
+    member_uid = TextField()
+    """ID of the member."""
+    pickle = BlobField()
+    """Member object without its chat, per ``ETMChatMember.pickle``."""
+
+    class Meta:
+        indexes = (
+            (('module_id', 'group_id', 'member_uid'), True),
+        )
+
+
+class ChatActivity(BaseModel):
+    slave_origin_uid = TextField(primary_key=True)
+    """Channel + chat ID of a slave chat."""
+    time = DateTimeField()
+    """Time of the last message log written of the chat."""
+
+
+class CompressionDictionary(BaseModel):
+    algorithm = TextField()
+    """Name of compression algorithm, per ``compression.ALGORITHMS``."""
+    dictionary = BlobField()
+    """Trained dictionary."""
+    time = DateTimeField(default=datetime.datetime.now)
+    """Time of the dictionary trained."""
+
+
+class MsgLogArchive:
+    """Message logs moved out of ``tgdata.db``, partitioned by month into
+    ``msglog_YYYY_MM.db`` files.
+
+    A partition is attached to the connection of the current thread only
+    while it is used, as ``ATTACH`` is not allowed inside a transaction and
+    the number of attached databases is limited.
+    """
+
+    logger = logging.getLogger(__name__)
+    SCHEMA = "msglog_archive"
+    FILE_PATTERN = re.compile(r"^msglog_(\d{4}_\d{2})\.db$")
+
+    def __init__(self, path: Path):
+        self.path = path
+
+    @staticmethod
+    def month_of(value: datetime.datetime) -> str:
+        """Name of the partition of a time, in ``YYYY_MM``."""
+        return value.strftime("%Y_%m")
+
+    def file_of(self, month: str) -> Path:
+        return self.path / f"msglog_{month}.db"
+
+    def partitions(self) -> List[str]:
+        """Months of all partitions, newest first."""
+        if not self.path.is_dir():
+            return []
+        months = (self.FILE_PATTERN.match(i.name) for i in self.path.iterdir())
+        return sorted((i.group(1) for i in months if i), reverse=True)
+
+    @contextmanager
+    def attach(self, month: str) -> Iterator[None]:
+        """Attach a partition as ``msglog_archive`` to the connection of
+        the current thread.
+        """
+        database.execute_sql(f'ATTACH DATABASE ? AS "{self.SCHEMA}"', (str(self.file_of(month)),))
+        try:
+            yield
+        finally:
+            database.execute_sql(f'DETACH DATABASE "{self.SCHEMA}"')
+
+    def move(self, month: str, master_msg_ids: Sequence[TgChatMsgIDStr]):
+        """Move message logs from ``tgdata.db`` to a partition.
+
+        Entries are copied with ``INSERT OR REPLACE``, so moving them again
+        is harmless if a previous move is interrupted before they are
+        deleted from ``tgdata.db``.
+        """
+        self.path.mkdir(parents=True, exist_ok=True)
+        with self.attach(month), database.atomic("IMMEDIATE"):
+            ArchivedMsgLog.create_table()
+            for batch in chunked(master_msg_ids, DatabaseManager.SQLITE_MAX_VARIABLE_NUMBER):
+                ArchivedMsgLog.insert_from(
+                    MsgLog.select(*MsgLog._meta.sorted_fields).where(MsgLog.master_msg_id.in_(batch)),
+                    ArchivedMsgLog._meta.sorted_fields
+                ).on_conflict_replace().execute()
+                MsgLog.delete().where(MsgLog.master_msg_id.in_(batch)).execute()
+
+    @staticmethod
+    def _conditions(master_msg_id: Optional[TgChatMsgIDStr] = None,
+                    slave_msg_id: Optional[MessageID] = None,
+                    slave_origin_uid: Optional[EFBChannelChatIDStr] = None):
+        if master_msg_id:
+            return ArchivedMsgLog.master_msg_id == master_msg_id
+        return (ArchivedMsgLog.slave_origin_uid == slave_origin_uid) & \
+               (ArchivedMsgLog.slave_message_id == slave_msg_id)
+
+    def get(self, master_msg_id: Optional[TgChatMsgIDStr] = None,
+            slave_msg_id: Optional[MessageID] = None,
+            slave_origin_uid: Optional[EFBChannelChatIDStr] = None) -> Optional[MsgLog]:
+        """Get the latest archived message log by message ID, looking up
+        partitions from the newest one.
+        """
+        partitions = self.partitions()
+        if not partitions:
+            return None
+        if database.in_transaction():
+            self.logger.debug("Archived message logs are not looked up inside a transaction.")
+            return None
+        conditions = self._conditions(master_msg_id, slave_msg_id, slave_origin_uid)
+        for month in partitions:
+            with self.attach(month):
+                if not ArchivedMsgLog.table_exists():
+                    continue
+                log = ArchivedMsgLog.select().where(conditions).order_by(ArchivedMsgLog.time.desc()).first()
+            if log is not None:
+                return log
+        return None
+
+    def delete(self, master_msg_id: Optional[TgChatMsgIDStr] = None,
+               slave_msg_id: Optional[MessageID] = None,
+               slave_origin_uid: Optional[EFBChannelChatIDStr] = None) -> int:
+        """Delete archived message logs by message ID from all partitions.
+
+        Returns:
+            Number of entries deleted.
+        """
+        conditions = self._conditions(master_msg_id, slave_msg_id, slave_origin_uid)
+        deleted = 0
+        for month in self.partitions():
+            with self.attach(month), database.atomic("IMMEDIATE"):
+                if ArchivedMsgLog.table_exists():
+                    deleted += ArchivedMsgLog.delete().where(conditions).execute()
+        return deleted
+
+    def prune(self, before: str) -> List[str]:
+        """Delete partitions of months before ``before``.
+
+        Returns:
+            Months of the partitions deleted.
+        """
+        pruned = []
+        for month in self.partitions():
+            if month < before:
+                path = self.file_of(month)
+                for suffix in ("-journal", "-wal", "-shm"):
+                    with suppress(FileNotFoundError):
+                        path.with_name(path.name + suffix).unlink()
+                path.unlink()
+                pruned.append(month)
+        return pruned
+
+
+class SQLiteStorage(StorageBackend):
+    """Storage in ``tgdata.db`` with the peewee models above.
+
+    Write transactions take the write lock upfront with ``BEGIN IMMEDIATE``.
+    Tables are created and migrated by ``DatabaseManager``.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path: Path, pragmas: Dict[str, Any]):
+        database.init(str(path), pragmas=list(pragmas.items()))
+        database.connect()
+        self.search_index: bool = MsgLogIndex.is_supported()
+        """If message logs are written to the full-text index."""
+
+    def close(self):
+        database.close()
+
+    def get_chat_assocs(self) -> Iterable[Tuple[EFBChannelChatIDStr, EFBChannelChatIDStr]]:
+        return ChatAssoc.select(ChatAssoc.master_uid, ChatAssoc.slave_uid).order_by(ChatAssoc.id).tuples()
+
+    def add_chat_assoc(self, master_uid: EFBChannelChatIDStr, slave_uid: EFBChannelChatIDStr,
+                       multiple_slave: bool = False):
+        with database.atomic("IMMEDIATE"):
+            if not multiple_slave:
+                ChatAssoc.delete().where(ChatAssoc.master_uid == master_uid).execute()
+            ChatAssoc.delete().where(ChatAssoc.slave_uid == slave_uid).execute()
+            ChatAssoc.create(master_uid=master_uid, slave_uid=slave_uid)
+
+    def remove_chat_assoc(self, master_uid: Optional[EFBChannelChatIDStr] = None,
+                          slave_uid: Optional[EFBChannelChatIDStr] = None) -> int:
+        with database.atomic("IMMEDIATE"):
+            if master_uid:
+                return ChatAssoc.delete().where(ChatAssoc.master_uid == master_uid).execute()
+            return ChatAssoc.delete().where(ChatAssoc.slave_uid == slave_uid).execute()
+
+    def migrate_chat_assoc(self, from_master_uid: EFBChannelChatIDStr, to_master_uid: EFBChannelChatIDStr) -> int:
+        with database.atomic("IMMEDIATE"):
+            slave_uids = [i for i, in ChatAssoc.select(ChatAssoc.slave_uid)
+                          .where(ChatAssoc.master_uid == from_master_uid).tuples()]
+            ChatAssoc.delete().where(ChatAssoc.slave_uid.in_(slave_uids)
+                                     & (ChatAssoc.master_uid != from_master_uid)).execute()
+            return ChatAssoc.update(master_uid=to_master_uid) \
+                .where(ChatAssoc.master_uid == from_master_uid).execute()
+
+    def upsert_msg_logs(self, rows: List[Dict[str, Any]]):
+        """Also write full-text index entries of the message logs in the
+        same transaction, if the index is supported.
+        """
+        update = {
+            field: EXCLUDED[field.column_name]
+            for field in MsgLog._meta.sorted_fields
+            if field.name not in ("master_msg_id", "time", "pickle")
+        }
+        update[MsgLog.pickle] = fn.COALESCE(EXCLUDED.pickle, MsgLog.pickle)
+        batch_size = DatabaseManager.SQLITE_MAX_VARIABLE_NUMBER // len(rows[0])
+        activity: Dict[EFBChannelChatIDStr, datetime.datetime] = {}
+        for data in rows:
+            uid = data['slave_origin_uid']
+            if uid not in activity or activity[uid] < data['time']:
+                activity[uid] = data['time']
+        with database.atomic("IMMEDIATE"):
+            for batch in chunked(rows, batch_size):
+                MsgLog.insert_many(batch) \
+                    .on_conflict(conflict_target=[MsgLog.master_msg_id], update=update) \
+                    .execute()
+            for batch in chunked(rows, DatabaseManager.SQLITE_MAX_VARIABLE_NUMBER // 3):
+                if not self.search_index:
+                    break
+                rowids = dict(MsgLog.select(MsgLog.master_msg_id, SQL('rowid'))
+                              .where(MsgLog.master_msg_id.in_([i['master_msg_id'] for i in batch]))
+                              .tuples())
+                MsgLogIndex.insert_many(
+                    [(rowids[i['master_msg_id']], i['text'] or "", i['master_chat_id']) for i in batch],
+                    fields=[MsgLogIndex.rowid, MsgLogIndex.text, MsgLogIndex.master_chat_id]
+                ).on_conflict_replace().execute()
+            for batch in chunked(activity.items(), DatabaseManager.SQLITE_MAX_VARIABLE_NUMBER // 2):
+                ChatActivity.insert_many(batch, fields=[ChatActivity.slave_origin_uid, ChatActivity.time]) \
+                    .on_conflict(conflict_target=[ChatActivity.slave_origin_uid],
+                                 update={ChatActivity.time: fn.MAX(ChatActivity.time, EXCLUDED.time)}) \
+                    .execute()
+
+    def get_msg_log(self, master_msg_id: Optional[TgChatMsgIDStr] = None,
+                    slave_msg_id: Optional[MessageID] = None,
+                    slave_origin_uid: Optional[EFBChannelChatIDStr] = None) -> Optional[MsgLog]:
+        try:
+            if master_msg_id:
+                return MsgLog.select().where(MsgLog.master_msg_id == master_msg_id) \
+                    .order_by(MsgLog.time.desc()).first()
+            return MsgLog.select().where((MsgLog.slave_message_id == slave_msg_id) &
+                                         (MsgLog.slave_origin_uid == slave_origin_uid)
+                                         ).order_by(MsgLog.time.desc()).first()
+        except DoesNotExist:
+            return None
+
+    @database.atomic("IMMEDIATE")
+    def delete_msg_log(self, master_msg_id: Optional[TgChatMsgIDStr] = None,
+                       slave_msg_id: Optional[MessageID] = None,
+                       slave_origin_uid: Optional[EFBChannelChatIDStr] = None):
+        try:
+            if master_msg_id:
+                MsgLog.delete().where(MsgLog.master_msg_id == master_msg_id).execute()
+            else:
+                MsgLog.delete().where((MsgLog.slave_message_id == slave_msg_id) &
+                                      (MsgLog.slave_origin_uid == slave_origin_uid)
+                                      ).execute()
+        except DoesNotExist:
+            return
+
+    def get_recent_slave_chats(self, master_chat_id: TelegramChatID, limit: int) -> List[EFBChannelChatIDStr]:
+        query = MsgLog \
+            .select(MsgLog.slave_origin_uid, fn.MAX(MsgLog.time)) \
+            .where(MsgLog.master_chat_id == int(master_chat_id)) \
+            .group_by(MsgLog.slave_origin_uid) \
+            .order_by(fn.MAX(MsgLog.time).desc()) \
+            .limit(limit)
+        return [EFBChannelChatIDStr(i.slave_origin_uid) for i in query]
+
+    def get_last_message(self, slave_origin_uid: EFBChannelChatIDStr) -> Optional[MsgLog]:
+        try:
+            return MsgLog.select().where(
+                MsgLog.slave_origin_uid == slave_origin_uid
+            ).order_by(MsgLog.time.desc()).limit(1).first()
+        except DoesNotExist:
+            return None
+
+    def get_chat_activity(self) -> Dict[EFBChannelChatIDStr, datetime.datetime]:
+        return dict(ChatActivity.select(ChatActivity.slave_origin_uid, ChatActivity.time).tuples())
+
+    def get_slave_chat_info(self, slave_channel_id: ModuleID, slave_chat_uid: ChatID,
+                            slave_chat_group_id: Optional[ChatID] = None) -> Optional[SlaveChatInfo]:
+        try:
+            return SlaveChatInfo.select() \
+                .where((SlaveChatInfo.slave_channel_id == slave_channel_id) &
+                       (SlaveChatInfo.slave_chat_uid == slave_chat_uid) &
+                       (SlaveChatInfo.slave_chat_group_id == slave_chat_group_id)).first()
+        except DoesNotExist:
+            return None
+
+    @database.atomic("IMMEDIATE")
+    def set_slave_chat_info(self, rows: Collection[Dict[str, Any]], members: Collection[Dict[str, Any]] = ()):
+        if rows:
+            update = {
+                SlaveChatInfo.slave_channel_emoji: EXCLUDED.slave_channel_emoji,
+                SlaveChatInfo.slave_chat_name: EXCLUDED.slave_chat_name,
+                SlaveChatInfo.slave_chat_alias: EXCLUDED.slave_chat_alias,
+                SlaveChatInfo.slave_chat_type: EXCLUDED.slave_chat_type,
+                SlaveChatInfo.pickle: EXCLUDED.pickle,
+            }
+            for batch in chunked(rows, DatabaseManager.SQLITE_MAX_VARIABLE_NUMBER // len(next(iter(rows)))):
+                SlaveChatInfo.insert_many(batch) \
+                    .on_conflict(conflict_target=list(SlaveChatInfo.chat_key()), update=update) \
+                    .execute()
+        self.set_chat_members(members)
+
+    @database.atomic("IMMEDIATE")
+    def set_chat_members(self, rows: Collection[Dict[str, Any]]):
+        """Entries not changed are not written."""
+        for batch in chunked(rows, DatabaseManager.SQLITE_MAX_VARIABLE_NUMBER // 4):
+            ChatMemberInfo.insert_many(batch) \
+                .on_conflict(conflict_target=[ChatMemberInfo.module_id, ChatMemberInfo.group_id,
+                                              ChatMemberInfo.member_uid],
+                             update={ChatMemberInfo.pickle: EXCLUDED.pickle},
+                             where=(ChatMemberInfo.pickle != EXCLUDED.pickle)) \
+                .execute()
+
+    @database.atomic("IMMEDIATE")
+    def delete_slave_chat_info(self, slave_channel_id: ModuleID, slave_chat_uid: ChatID,
+                               slave_chat_group_id: Optional[ChatID] = None) -> int:
+        return SlaveChatInfo.delete() \
+            .where((SlaveChatInfo.slave_channel_id == slave_channel_id) &
+                   (SlaveChatInfo.slave_chat_uid == slave_chat_uid) &
+                   (SlaveChatInfo.slave_chat_group_id == slave_chat_group_id)).execute()
+
+    def get_chat_members(self, module_id: ModuleID, group_id: ChatID) -> List[ChatMemberInfo]:
+        return list(ChatMemberInfo.select()
+                    .where((ChatMemberInfo.module_id == module_id) & (ChatMemberInfo.group_id == group_id))
+                    .order_by(ChatMemberInfo.id))
+
+    @database.atomic("IMMEDIATE")
+    def delete_chat_members(self, module_id: ModuleID, group_id: ChatID,
+                            member_uids: Optional[Collection[ChatID]] = None):
+        """Entries of members stored as slave chat info in earlier versions
+        are also deleted.
+        """
+        conditions = (ChatMemberInfo.module_id == module_id) & (ChatMemberInfo.group_id == group_id)
+        legacy_conditions = (SlaveChatInfo.slave_channel_id == module_id) & \
+                            (SlaveChatInfo.slave_chat_group_id == group_id)
+        if member_uids is None:
+            ChatMemberInfo.delete().where(conditions).execute()
+            SlaveChatInfo.delete().where(legacy_conditions).execute()
+            return
+        for batch in chunked(member_uids, DatabaseManager.SQLITE_MAX_VARIABLE_NUMBER - 2):
+            ChatMemberInfo.delete().where(conditions & ChatMemberInfo.member_uid.in_(batch)).execute()
+            SlaveChatInfo.delete().where(legacy_conditions & SlaveChatInfo.slave_chat_uid.in_(batch)).execute()
+
 
 class DatabaseManager:
     logger = logging.getLogger(__name__)
     FAIL_FLAG = '__fail__'
+    MIGRATION_BATCH_SIZE = 10000
+    """Number of rows to be updated per transaction when backfilling columns."""
+    REENCODE_BATCH_SIZE = 1000
+    """Number of message logs to be converted from ``pickle`` per task."""
+    COMPRESS_BATCH_SIZE = 1000
+    """Number of message logs to be compressed per task."""
+    COMPRESSION_SAMPLE_SIZE = 5000
+    """Number of recent message logs to train compression dictionaries with."""
+    COMPRESSION_MIN_SAMPLES = 100
+    """Minimum number of samples needed to train a compression dictionary."""
+    RETENTION_BATCH_SIZE = 1000
+    """Number of message logs to be checked for retention per task."""
+    DEFAULT_RETENTION: Dict[str, Any] = {
+        "hot_days": None,
+        "keep_days": None,
+        "keep_reactions": True,
+        "interval_hours": 24,
+    }
+    """Retention rules of message logs, can be overridden with
+    ``database.retention`` in the channel config.
+
+    - ``hot_days``: Message logs older than this are moved to monthly
+      archive files, ``None`` to keep all message logs in ``tgdata.db``.
+    - ``keep_days``: Archived message logs older than this are deleted,
+      ``None`` to keep them forever.
+    - ``keep_reactions``: Keep message logs with reactions in ``tgdata.db``.
+    - ``interval_hours``: Interval between retention runs.
+    """
+    INDEX_BATCH_SIZE = 1000
+    """Number of existing message logs to be added to the full-text index
+    per task.
+    """
+    SEARCH_LIMIT = 10
+    """Default number of results of a message log search."""
+    SQLITE_MAX_VARIABLE_NUMBER = 999
+    """Maximum number of parameters in one statement in older SQLite
+    versions, used to split bulk inserts.
+    """
+    DEFAULT_PRAGMAS: Dict[str, Any] = {
+        # Set before journal mode, so that it applies to new databases
+        "auto_vacuum": "incremental",
+        "journal_mode": "wal",
+        "synchronous": "normal",
+        "mmap_size": 64 * 1024 * 1024,
+    }
+    """SQLite pragmas set on every connection, can be overridden with
+    ``database.pragmas`` in the channel config.
+    """
+    DEFAULT_WRITE_BEHIND_INTERVAL_MS = 200
+    """Maximum time in milliseconds a message log write can be pending
+    before it is committed, can be overridden with
+    ``database.write_behind_interval_ms`` in the channel config.
+    ``0`` commits every write immediately.
+    """
+    DEFAULT_WRITE_BEHIND_BATCH_SIZE = 100
+    """Number of pending message log writes that triggers a commit, can be
+    overridden with ``database.write_behind_batch_size`` in the channel config.
+    """
+    BACKENDS = ("sqlite", "lmdb")
+    """Names of storage backends, selected with ``database.backend`` in the
+    channel config. Full-text search, compression, retention, backups and
+    vacuum are only available with ``sqlite``.
+    """
+    SQLITE_ONLY_SECTIONS = ("compression", "retention", "maintenance", "backup")
+    """Sections of ``database`` in the channel config only supported by the
+    SQLite backend."""
+    DEFAULT_MAINTENANCE: Dict[str, Any] = {
+        "interval_hours": 24,
+        "quiet_seconds": 300,
+        "vacuum_pages": 256,
+    }
+    """Schedule of incremental vacuum, can be overridden with
+    ``database.maintenance`` in the channel config.
+
+    - ``interval_hours``: Interval between runs, ``None`` to only run when
+      requested with ``compact_database``.
+    - ``quiet_seconds``: Scheduled runs wait until no message is logged for
+      this long.
+    - ``vacuum_pages``: Number of free pages returned to the file system
+      per task.
+    """
 
     def __init__(self, channel: 'TelegramChannel'):
         base_path = utils.get_data_path(channel.channel_id)
-
-        self.logger.debug("Loading database...")
-        database.init(str(base_path / 'tgdata.db'))
-        database.connect()
+        db_config = channel.config.get('database', None) or {}
+
+        backend = db_config.get('backend', None) or "sqlite"
+        if backend not in self.BACKENDS:
+            raise ValueError(f"Unknown database backend {backend!r}, expected one of {', '.join(self.BACKENDS)}.")
+        self.storage: StorageBackend
+        if backend == "lmdb":
+            unsupported = [i for i in self.SQLITE_ONLY_SECTIONS if db_config.get(i, None)]
+            if unsupported:
+                raise ValueError(f"database.{', database.'.join(unsupported)} in the config "
+                                 f"are only supported by the sqlite database backend.")
+            from .lmdb_storage import LMDBStorage
+            self.logger.debug("Loading LMDB database...")
+            self.storage = LMDBStorage(base_path / 'tgdata.lmdb', db_config.get('lmdb', None) or {})
+        else:
+            pragmas = self.DEFAULT_PRAGMAS.copy()
+            pragmas.update(db_config.get('pragmas', None) or {})
+            self.logger.debug("Loading database with pragmas %s...", pragmas)
+            self.storage = SQLiteStorage(base_path / 'tgdata.db', pragmas)
         self.logger.debug("Database loaded.")
 
+        self.write_behind_interval: float = db_config.get(
+            'write_behind_interval_ms', self.DEFAULT_WRITE_BEHIND_INTERVAL_MS) / 1000
+        self.write_behind_batch_size: int = db_config.get(
+            'write_behind_batch_size', self.DEFAULT_WRITE_BEHIND_BATCH_SIZE)
+        self.pending_logs: Dict[TgChatMsgIDStr, Dict[str, Any]] = dict()
+        """Message log rows not yet committed, keyed by ``master_msg_id``."""
+        self.pending_since: float = 0
+        """Monotonic time when the oldest pending row was added."""
+        self.pending_lock = Lock()
+        """Lock for ``pending_logs`` and ``pending_since``."""
+        self.flush_lock = Lock()
+        """Lock held while pending rows are being committed."""
+        self.msg_log_cache = MsgLogCache(db_config.get('msg_log_cache_size', MSG_LOG_CACHE_SIZE))
+        """Recently looked up message logs."""
+        self.last_write_time: float = time.monotonic()
+        """Monotonic time when a message log was last written."""
+
         self.task_queue: 'Queue[Optional[Tuple[Callable, Sequence[Any], Dict[str, Any]]]]' = Queue()
         self.worker_thread = Thread(target=self.task_worker, name="ETM database worker thread")
         self.worker_thread.start()
 
+        if self.is_sqlite:
+            self._check_migration()
+            self._check_search_index()
+
+        self.chat_assoc = ChatAssocTable()
+        """Routing table of chat associations, loaded from the database."""
+        self.chat_assoc.load(self.storage.get_chat_assocs())
+
+        self.chat_activity: Dict[EFBChannelChatIDStr, datetime.datetime] = self.storage.get_chat_activity()
+        """Time of the last message of each slave chat, mirroring the
+        ``chatactivity`` table, updated with ``pending_lock`` held.
+        """
+
+        self.compression_stats: Dict[str, Any] = {}
+        """Statistics of the last run of ``compress_message_logs``."""
+        self.archive: Optional[MsgLogArchive] = None
+        """Archive of message logs, only with the SQLite backend."""
+        self.retention: Dict[str, Any] = self.DEFAULT_RETENTION.copy()
+        self.retention.update(db_config.get('retention', None) or {})
+        self.retention_timer: Optional[Timer] = None
+        self.maintenance: Dict[str, Any] = self.DEFAULT_MAINTENANCE.copy()
+        self.maintenance.update(db_config.get('maintenance', None) or {})
+        self.maintenance_timer: Optional[Timer] = None
+        backup_config = db_config.get('backup', None) or {}
+        self.backup = DatabaseBackup(Path(backup_config.get('path', None) or base_path / 'backups'),
+                                     keep=backup_config.get('keep', BACKUP_KEEP),
+                                     max_rate_kib=backup_config.get('max_rate_kib', BACKUP_MAX_RATE_KIB),
+                                     step_kib=backup_config.get('step_kib', BACKUP_STEP_KIB))
+        self.backup_thread: Optional[Thread] = None
+        if not self.is_sqlite:
+            return
+
+        self._setup_compression(db_config.get('compression', None) or {})
+
+        self.add_task(self.reencode_legacy_pickles, (), {})
+        if self.search_available:
+            self.add_task(self.index_message_logs, (), {})
+
+        self.archive = MsgLogArchive(base_path / 'msglog_archive')
+        keep_days, hot_days = self.retention['keep_days'], self.retention['hot_days']
+        if keep_days is not None and hot_days is not None and keep_days < hot_days:
+            raise ValueError("database.retention.keep_days must not be less than hot_days.")
+        if hot_days is not None or keep_days is not None:
+            self._schedule_retention()
+
+        if self.maintenance['interval_hours'] is not None:
+            self._schedule_maintenance(self.maintenance['quiet_seconds'])
+
+    @property
+    def is_sqlite(self) -> bool:
+        """If the SQLite backend is used."""
+        return isinstance(self.storage, SQLiteStorage)
+
+    @property
+    def search_available(self) -> bool:
+        """If message logs can be searched with ``search_msg_log``."""
+        return isinstance(self.storage, SQLiteStorage) and self.storage.search_index
+
+    def _check_migration(self):
         self.logger.debug("Checking database migration...")
         if not ChatAssoc.table_exists():
             self._create()
         else:
             msg_log_columns = {i.name for i in database.get_columns("msglog")}
+            msg_log_indexes = {i.name for i in database.get_indexes("msglog")}
             slave_chat_info_columns = {i.name for i in database.get_columns("slavechatinfo")}
+            slave_chat_info_indexes = {i.name for i in database.get_indexes("slavechatinfo")}
             if "file_id" not in msg_log_columns:
                 self._migrate(0)
             elif "pickle" not in msg_log_columns:
@@ -202,40 +913,134 @@ class DatabaseManager:
                 self._migrate(2)
             elif "file_unique_id" not in msg_log_columns:
                 self._migrate(3)
+            elif "msglog_slave_origin_uid_time" not in msg_log_indexes:
+                self._migrate(4)
+            elif "master_chat_id" not in msg_log_columns:
+                self._migrate(5)
+            elif "slavechatinfo_slave_channel_id_slave_chat_uid_slave_chat_group_id" not in slave_chat_info_indexes:
+                self._migrate(6)
+            elif not CompressionDictionary.table_exists():
+                self._migrate(7)
+            elif not ChatMemberInfo.table_exists():
+                self._migrate(8)
+            elif not ChatActivity.table_exists():
+                self._migrate(9)
+            elif not MsgLogIndex.table_exists():
+                self._migrate(10)
+            self._backfill_master_chat_id()
         self.logger.debug("Database migration finished...")
 
+    def _backfill_master_chat_id(self):
+        """Fill in ``master_chat_id`` of message logs from before migration 5,
+        from the chat ID part of ``master_msg_id`` ("chat_id.message_id").
+
+        Each batch is committed on its own, so that the write lock is not
+        held through a large message log table. An interrupted backfill is
+        resumed on the next start.
+        """
+        master_chat_id = Cast(fn.substr(MsgLog.master_msg_id, 1, fn.instr(MsgLog.master_msg_id, ".") - 1),
+                              "INTEGER")
+        total = 0
+        while True:
+            with database.atomic("IMMEDIATE"):
+                batch = MsgLog.select(MsgLog.master_msg_id) \
+                    .where(MsgLog.master_chat_id.is_null()) \
+                    .limit(self.MIGRATION_BATCH_SIZE)
+                updated = MsgLog.update(master_chat_id=master_chat_id) \
+                    .where(MsgLog.master_msg_id.in_(batch)).execute()
+            total += updated
+            if updated < self.MIGRATION_BATCH_SIZE:
+                break
+        if total:
+            self.logger.info("Filled in Telegram chat ID of %s message logs.", total)
+
+    def _check_search_index(self):
+        """Disable search if SQLite does not support the full-text index,
+        or rebuild the index if it was disabled on an earlier run.
+        """
+        if not self.search_available:
+            self.logger.warning("Search of message logs is disabled, as it requires SQLite %s or later "
+                                "built with FTS5. SQLite %s is found.",
+                                ".".join(map(str, MsgLogIndex.MIN_SQLITE_VERSION)), sqlite3.sqlite_version)
+            # Message logs could not be deleted if the trigger is kept
+            MsgLogIndex.drop_delete_trigger()
+        elif not MsgLogIndex.has_delete_trigger():
+            # Message logs written and deleted while search was disabled are
+            # not in sync with the index, which is rebuilt by ``index_message_logs``.
+            with database.atomic("IMMEDIATE"):
+                MsgLogIndex.delete().execute()
+                MsgLogIndex.create_delete_trigger()
+
     def task_worker(self):
         while True:
-            task = self.task_queue.get()
+            timeout = self._flush_timeout()
+            if timeout == 0:
+                self._run_task(self.flush_message_log, (), {})
+                continue
+            try:
+                task = self.task_queue.get(timeout=timeout)
+            except Empty:
+                continue
             if task is None:
+                self._run_task(self.flush_message_log, (), {})
                 self.task_queue.task_done()
                 break
             method, args, kwargs = task
-            try:
-                method(*args, **kwargs)
-            except OperationalError as e:
-                self.logger.exception("Operational error occurred when running %s(%s, %s): %r", method.__name__, args,
-                                      kwargs, e)
+            self._run_task(method, args, kwargs)
             self.task_queue.task_done()
 
+    def _run_task(self, method: Callable, args: Sequence[Any], kwargs: Dict[str, Any]):
+        # Keep the worker running whatever a task raises, so that pending
+        # message logs are still committed.
+        try:
+            method(*args, **kwargs)
+        except OperationalError as e:
+            self.logger.exception("Operational error occurred when running %s(%s, %s): %r", method.__name__, args,
+                                  kwargs, e)
+        except Exception as e:
+            self.logger.exception("Error occurred when running %s(%s, %s): %r", method.__name__, args, kwargs, e)
+
+    def _flush_timeout(self) -> Optional[float]:
+        """Seconds until pending message logs are due to be committed,
+        ``None`` if there is nothing pending.
+        """
+        with self.pending_lock:
+            if not self.pending_logs:
+                return None
+            if len(self.pending_logs) >= self.write_behind_batch_size:
+                return 0
+            return max(0., self.pending_since + self.write_behind_interval - time.monotonic())
+
     def stop_worker(self):
+        """Stop the worker thread after committing all pending writes."""
+        if self.retention_timer is not None:
+            self.retention_timer.cancel()
+        if self.maintenance_timer is not None:
+            self.maintenance_timer.cancel()
+        if self.backup_thread is not None:
+            self.backup.cancel()
+            self.backup_thread.join()
         self.task_queue.put(None)
         self.worker_thread.join()
+        self.flush_message_log()
 
     def add_task(self, method: Callable, args: Sequence[Any], kwargs: Dict[str, Any]):
         self.task_queue.put((method, args, kwargs))
 
     @staticmethod
-    @database.atomic()
+    @database.atomic("IMMEDIATE")
     def _create():
         """
         Initializing tables.
         """
-        database.execute_sql("PRAGMA journal_mode = OFF")
-        database.create_tables([ChatAssoc, MsgLog, SlaveChatInfo])
+        database.create_tables([ChatAssoc, MsgLog, SlaveChatInfo, CompressionDictionary, ChatMemberInfo,
+                                ChatActivity])
+        if MsgLogIndex.is_supported():
+            database.create_tables([MsgLogIndex])
+            MsgLogIndex.create_delete_trigger()
 
     @staticmethod
-    @database.atomic()
+    @database.atomic("IMMEDIATE")
     def _migrate(i: int):
         """
         Run migrations.
@@ -273,8 +1078,60 @@ class DatabaseManager:
             migrate(
                 migrator.add_column("msglog", "file_unique_id", MsgLog.file_unique_id)
             )
+        if i <= 4:
+            # Migration 4: Add indexes for message log and chat association lookups
+            # 2026OCT16
+            migrate(
+                migrator.add_index("msglog", ("slave_origin_uid", "slave_message_id", "time"), False),
+                migrator.add_index("msglog", ("slave_origin_uid", "time"), False),
+                migrator.add_index("msglog", ("master_msg_id_alt",), False),
+                migrator.add_index("chatassoc", ("master_uid",), False),
+                migrator.add_index("chatassoc", ("slave_uid",), False),
+            )
+        if i <= 5:
+            # Migration 5: Add column for Telegram chat ID to message log table
+            # 2026OCT16
+            migrate(
+                migrator.add_column("msglog", "master_chat_id", MsgLog.master_chat_id)
+            )
+            # Existing rows are backfilled by ``_backfill_master_chat_id``
+            # after migrations, in transactions of their own.
+            migrate(
+                migrator.add_index("msglog", ("master_chat_id", "slave_origin_uid", "time"), False)
+            )
+        if i <= 6:
+            # Migration 6: Add unique index of chats to slave chat info table
+            # 2026OCT16
+            # Remove duplicate entries, keeping the latest one of each chat
+            latest = SlaveChatInfo.select(fn.MAX(SlaveChatInfo.id)).group_by(*SlaveChatInfo.chat_key())
+            SlaveChatInfo.delete().where(SlaveChatInfo.id.not_in(latest)).execute()
+            SlaveChatInfo._schema.create_indexes()
+        if i <= 7:
+            # Migration 7: Add table for compression dictionaries
+            # 2026OCT16
+            database.create_tables([CompressionDictionary])
+        if i <= 8:
+            # Migration 8: Add table for members of group chats
+            # 2026OCT16
+            database.create_tables([ChatMemberInfo])
+        if i <= 9:
+            # Migration 9: Add table for last message time of slave chats
+            # 2026OCT16
+            database.create_tables([ChatActivity])
+            ChatActivity.insert_from(
+                MsgLog.select(MsgLog.slave_origin_uid, fn.MAX(MsgLog.time))
+                      .where(MsgLog.time.is_null(False))
+                      .group_by(MsgLog.slave_origin_uid),
+                [ChatActivity.slave_origin_uid, ChatActivity.time]
+            ).execute()
+        if i <= 10:
+            # Migration 10: Add full-text index of message logs if supported,
+            # existing message logs are indexed by ``index_message_logs``
+            # 2026OCT16
+            if MsgLogIndex.is_supported():
+                database.create_tables([MsgLogIndex])
+                MsgLogIndex.create_delete_trigger()
 
-    @database.atomic()
     def add_chat_assoc(self, master_uid: EFBChannelChatIDStr,
                        slave_uid: EFBChannelChatIDStr,
                        multiple_slave: bool = False):
@@ -287,14 +1144,10 @@ class DatabaseManager:
             slave_uid (str): Slave channel UID ("%(channel_id)s.%(chat_id)s")
             multiple_slave: Allow linking to multiple slave channels.
         """
-        if not multiple_slave:
-            self.remove_chat_assoc(master_uid=master_uid)
-        self.remove_chat_assoc(slave_uid=slave_uid)
-        return ChatAssoc.create(master_uid=master_uid, slave_uid=slave_uid)
+        self.storage.add_chat_assoc(master_uid, slave_uid, multiple_slave)
+        self.chat_assoc.link(master_uid, slave_uid, multiple_slave)
 
-    @staticmethod
-    @database.atomic()
-    def remove_chat_assoc(master_uid: Optional[EFBChannelChatIDStr] = None,
+    def remove_chat_assoc(self, master_uid: Optional[EFBChannelChatIDStr] = None,
                           slave_uid: Optional[EFBChannelChatIDStr] = None):
         """
         Remove chat associations (chat links).
@@ -304,29 +1157,37 @@ class DatabaseManager:
             master_uid (str): Master chat UID ("%(chat_id)s")
             slave_uid (str): Slave channel UID ("%(channel_id)s.%(chat_id)s")
         """
-        try:
-            if bool(master_uid) == bool(slave_uid):
-                raise ValueError("Only one parameter is to be provided.")
-            elif master_uid:
-                return ChatAssoc.delete().where(ChatAssoc.master_uid == master_uid).execute()
-            elif slave_uid:
-                return ChatAssoc.delete().where(ChatAssoc.slave_uid == slave_uid).execute()
-        except DoesNotExist:
-            return 0
+        if bool(master_uid) == bool(slave_uid):
+            raise ValueError("Only one parameter is to be provided.")
+        count = self.storage.remove_chat_assoc(master_uid=master_uid, slave_uid=slave_uid)
+        self.chat_assoc.unlink(master_uid=master_uid, slave_uid=slave_uid)
+        return count
 
-    @staticmethod
-    def get_master_msg_id(message: EFBMessage) -> Optional[EFBChannelChatIDStr]:
+    def migrate_chat_assoc(self, from_master_uid: EFBChannelChatIDStr, to_master_uid: EFBChannelChatIDStr) -> int:
+        """
+        Move all chat associations of a Telegram chat to another one, used
+        when a group is migrated to a supergroup.
+
+        Args:
+            from_master_uid (str): Old master chat UID ("%(chat_id)s")
+            to_master_uid (str): New master chat UID ("%(chat_id)s")
+
+        Returns:
+            Number of slave chats moved.
+        """
+        count = self.storage.migrate_chat_assoc(from_master_uid, to_master_uid)
+        self.chat_assoc.migrate(from_master_uid, to_master_uid)
+        return count
+
+    def get_master_msg_id(self, message: EFBMessage) -> Optional[EFBChannelChatIDStr]:
         """Get master message ID from a message object."""
-        log: Optional[MsgLog] = MsgLog.get_or_none(
-            MsgLog.slave_origin_uid == chat_id_to_str(chat=message.chat),
-            MsgLog.slave_message_id == message.uid
-        )
+        log = self.get_msg_log(slave_msg_id=message.uid, slave_origin_uid=chat_id_to_str(chat=message.chat))
         if log:
             return log.master_msg_id
         return None
 
     def pickle_misc_msg(self, message: EFBMessage) -> Optional[bytes]:
-        """Pickle miscellaneous information of a message.
+        """Encode miscellaneous information of a message with ``msg_log_codec``.
 
         Since 2.0.0b34, this would be a dict that reflects the following
         attributes of an ``EFBMessage``/``ETMMsg`` object.
@@ -362,17 +1223,508 @@ class DatabaseManager:
                 data['target'] = target_id
 
         if data:
-            return pickle.dumps(data)
+            return msg_log_codec.encode(data)
         return None
 
+    def reencode_legacy_pickles(self, after: TgChatMsgIDStr = TgChatMsgIDStr("")):
+        """Convert a batch of miscellaneous data of message logs from
+        ``pickle`` to ``msg_log_codec``, and queue the next batch.
+
+        Compressed values are not converted, so that converted and
+        compressed rows are not scanned again on every start. They are
+        still loaded as legacy pickles.
+
+        Args:
+            after: Convert message logs with ``master_msg_id`` after this.
+        """
+        rows = MsgLog.select(MsgLog.master_msg_id, MsgLog.pickle) \
+            .where((MsgLog.master_msg_id > after) &
+                   (fn.substr(MsgLog.pickle, 1, 1).not_in([bytes((msg_log_codec.MAGIC,)),
+                                                            bytes((COMPRESSION_MAGIC,))]))) \
+            .order_by(MsgLog.master_msg_id) \
+            .limit(self.REENCODE_BATCH_SIZE) \
+            .tuples()
+        rows = list(rows)
+        converted = 0
+        with database.atomic("IMMEDIATE"):
+            for master_msg_id, raw in rows:
+                try:
+                    misc_data = msg_log_codec.decode(raw)
+                except Exception as e:
+                    self.logger.debug("[%s] Failed to load legacy pickle, skipped: %r", master_msg_id, e)
+                    continue
+                # Only update if the row is not changed since it is read
+                converted += MsgLog.update(pickle=msg_log_codec.encode(misc_data)) \
+                    .where((MsgLog.master_msg_id == master_msg_id) & (MsgLog.pickle.coerce(False) == raw)) \
+                    .execute()
+        if converted:
+            self.logger.debug("Converted %s message logs from legacy pickle.", converted)
+        if len(rows) == self.REENCODE_BATCH_SIZE:
+            self.add_task(self.reencode_legacy_pickles, (rows[-1][0],), {})
+
+    def _setup_compression(self, config: Dict[str, Any]):
+        """Load compression dictionaries, and set up compression of new
+        values per ``database.compression`` in the channel config.
+        """
+        algorithm = config.get('algorithm', None)
+        if algorithm is not None and algorithm not in ALGORITHMS:
+            raise ValueError(f"Unknown compression algorithm {algorithm!r}, "
+                             f"expected one of {', '.join(ALGORITHMS)}.")
+        level = config.get('level', None)
+        compression.min_size = config.get('min_size', compression.min_size)
+
+        latest = None
+        for row in CompressionDictionary.select().order_by(CompressionDictionary.id):
+            try:
+                compressor = ALGORITHMS[row.algorithm](row.id, row.dictionary, level)
+            except ImportError:
+                self.logger.warning("Compression dictionary %s of %s is found, but the algorithm is not "
+                                    "available. Messages compressed with it cannot be read.", row.id, row.algorithm)
+                continue
+            compression.add(compressor)
+            if row.algorithm == algorithm:
+                latest = compressor
+
+        if algorithm is None:
+            compression.active = None
+            return
+        if latest is not None:
+            compression.active = latest
+            self.add_task(self.compress_message_logs, (), {})
+        else:
+            # Compress without dictionary until one is trained
+            compression.active = ALGORITHMS[algorithm](level=level)
+            compression.add(compression.active)
+            self.add_task(self.train_compression_dictionary, (), {})
+        self.logger.debug("Compressing message logs with %s, dictionary %s.",
+                          algorithm, compression.active.dict_id)
+
+    def train_compression_dictionary(self) -> int:
+        """Train a compression dictionary with recent message logs, use it
+        to compress new values, and compress existing message logs with it.
+
+        Returns:
+            ID of the dictionary, 0 if compression is disabled or there are
+            not enough message logs to train with.
+        """
+        if compression.active is None:
+            return 0
+        field_text, field_pickle = MsgLog.text, MsgLog.pickle
+        samples = []
+        query = MsgLog.select(field_text, field_pickle) \
+            .order_by(MsgLog.time.desc()) \
+            .limit(self.COMPRESSION_SAMPLE_SIZE) \
+            .tuples()
+        for text, raw in query:
+            if compression.is_compressed(text):
+                text = field_text.decompress(text)
+            if text:
+                samples.append(text.encode())
+            if raw is not None:
+                samples.append(field_pickle.decompress(raw) if compression.is_compressed(raw) else bytes(raw))
+        if len(samples) < self.COMPRESSION_MIN_SAMPLES:
+            self.logger.info("Only %s samples are found, compression dictionary is not trained.", len(samples))
+            return 0
+
+        cls = type(compression.active)
+        algorithm = next(k for k, v in ALGORITHMS.items() if v is cls)
+        try:
+            dictionary = cls.train(samples)
+        except Exception as e:
+            self.logger.exception("Failed to train compression dictionary: %r", e)
+            return 0
+        row = CompressionDictionary.create(algorithm=algorithm, dictionary=dictionary)
+        compressor = cls(row.id, dictionary, compression.active.level)
+        compression.add(compressor)
+        compression.active = compressor
+        self.logger.info("Trained %s compression dictionary %s of %s bytes with %s samples.",
+                         algorithm, row.id, len(dictionary), len(samples))
+        self.add_task(self.compress_message_logs, (), {})
+        return row.id
+
+    def compress_message_logs(self, after: TgChatMsgIDStr = TgChatMsgIDStr("")):
+        """Compress a batch of uncompressed message logs, and queue the next
+        batch. Statistics of the run are logged and kept in
+        ``compression_stats`` when finished.
+
+        Args:
+            after: Compress message logs with ``master_msg_id`` after this.
+        """
+        if compression.active is None:
+            return
+        if not after:
+            self.compression_stats = {"rows": 0, "compressed": 0, "bytes_before": 0, "bytes_after": 0,
+                                      "seconds": 0.0, "finished": False}
+        stats = self.compression_stats
+        start = time.perf_counter()
+
+        rows = list(MsgLog.select(MsgLog.master_msg_id, MsgLog.text, MsgLog.pickle)
+                    .where(MsgLog.master_msg_id > after)
+                    .order_by(MsgLog.master_msg_id)
+                    .limit(self.COMPRESS_BATCH_SIZE)
+                    .tuples())
+        with database.atomic("IMMEDIATE"):
+            for master_msg_id, text, raw in rows:
+                update = {}
+                size_before = size_after = 0
+                if isinstance(text, str):
+                    compressed = compression.compress(text.encode())
+                    if compressed is not None:
+                        update[MsgLog.text] = compressed
+                        size_before += len(text.encode())
+                        size_after += len(compressed)
+                if raw is not None and not compression.is_compressed(raw):
+                    compressed = compression.compress(bytes(raw))
+                    if compressed is not None:
+                        update[MsgLog.pickle] = compressed
+                        size_before += len(raw)
+                        size_after += len(compressed)
+                if not update:
+                    continue
+                # Only update if the row is not changed since it is read,
+                # compare with stored values without compressing them again.
+                unchanged = (MsgLog.master_msg_id == master_msg_id) & (MsgLog.text.coerce(False) == text) & \
+                    (MsgLog.pickle.is_null() if raw is None else MsgLog.pickle.coerce(False) == raw)
+                if MsgLog.update(update).where(unchanged).execute():
+                    stats["compressed"] += 1
+                    stats["bytes_before"] += size_before
+                    stats["bytes_after"] += size_after
+
+        stats["rows"] += len(rows)
+        stats["seconds"] += time.perf_counter() - start
+        if len(rows) == self.COMPRESS_BATCH_SIZE:
+            self.add_task(self.compress_message_logs, (rows[-1][0],), {})
+        else:
+            stats["finished"] = True
+            self.logger.info("Compressed %s of %s message logs from %s to %s bytes in %.2f s (%.0f rows/s).",
+                             stats["compressed"], stats["rows"], stats["bytes_before"], stats["bytes_after"],
+                             stats["seconds"], stats["rows"] / (stats["seconds"] or 1))
+
+    def index_message_logs(self):
+        """Add a batch of message logs not yet in the full-text index,
+        newest first, and queue the next batch.
+
+        As message logs are indexed when committed, all message logs after
+        the oldest indexed one are already indexed.
+        """
+        oldest = MsgLogIndex.select(MsgLogIndex.rowid).order_by(MsgLogIndex.rowid).limit(1).scalar()
+        query = MsgLog.select(SQL('rowid'), MsgLog.text, MsgLog.master_chat_id)
+        if oldest is not None:
+            query = query.where(SQL('rowid') < oldest)
+        rows = []
+        for rowid, text, master_chat_id in query.order_by(SQL('rowid').desc()).limit(self.INDEX_BATCH_SIZE).tuples():
+            if compression.is_compressed(text):
+                text = MsgLog.text.decompress(text)
+            rows.append((rowid, text or "", master_chat_id))
+        if not rows:
+            return
+        with database.atomic("IMMEDIATE"):
+            MsgLogIndex.insert_many(rows, fields=[MsgLogIndex.rowid, MsgLogIndex.text, MsgLogIndex.master_chat_id]) \
+                .on_conflict_replace().execute()
+        self.logger.debug("Indexed %s message logs for search.", len(rows))
+        if len(rows) == self.INDEX_BATCH_SIZE:
+            self.add_task(self.index_message_logs, (), {})
+
+    def search_msg_log(self, query: str, master_chat_id: Optional[TelegramChatID] = None,
+                       offset: int = 0, limit: int = SEARCH_LIMIT) -> List[Dict[str, Any]]:
+        """Search text of message logs, newest first.
+
+        Args:
+            query: Terms separated by whitespace, all of which are to be
+                found in the text, per ``msg_log_search.parse_query``.
+            master_chat_id: Only search messages in this Telegram chat.
+            offset: Number of results to skip.
+            limit: Maximum number of results.
+
+        Returns:
+            ``master_msg_id``, ``slave_origin_uid``, ``slave_member_uid``,
+            ``msg_type``, ``text``, ``time`` and ``link`` of each result,
+            where ``link`` is empty if the message cannot be linked to.
+            Empty if search is not available, per ``search_available``.
+        """
+        if not self.search_available:
+            return []
+        match, substrings = msg_log_search.parse_query(query)
+        if match is None and not substrings:
+            return []
+        self.flush_message_log()
+        conditions = []
+        if match is not None:
+            conditions.append(MsgLogIndex.match(match))
+        for i in substrings:
+            # Case folding of short terms is limited to ASCII letters
+            conditions.append(fn.instr(fn.lower(MsgLogIndex.text), i.lower()) > 0)
+        if master_chat_id:
+            conditions.append(MsgLogIndex.master_chat_id == int(master_chat_id))
+        hits = list(MsgLogIndex.select(MsgLogIndex.rowid, MsgLogIndex.text)
+                    .where(*conditions)
+                    .order_by(MsgLogIndex.rowid.desc())
+                    .offset(offset).limit(limit).tuples())
+        if not hits:
+            return []
+        logs = {
+            i[0]: i[1:] for i in
+            MsgLog.select(SQL('rowid'), MsgLog.master_msg_id, MsgLog.slave_origin_uid, MsgLog.slave_member_uid,
+                          MsgLog.msg_type, MsgLog.time)
+                  .where(SQL('rowid').in_([rowid for rowid, _ in hits]))
+                  .tuples()
+        }
+        results = []
+        for rowid, text in hits:
+            if rowid not in logs:
+                continue
+            master_msg_id, slave_origin_uid, slave_member_uid, msg_type, log_time = logs[rowid]
+            results.append({
+                "master_msg_id": master_msg_id,
+                "slave_origin_uid": slave_origin_uid,
+                "slave_member_uid": slave_member_uid or "",
+                "msg_type": msg_type,
+                "text": text,
+                "time": log_time or datetime.datetime.min,
+                "link": message_link(*message_id_str_to_id(master_msg_id)) or "",
+            })
+        return results
+
+    def _schedule_retention(self):
+        """Queue a retention run, and schedule the next one."""
+        self.add_task(self.apply_retention, (), {})
+        self.retention_timer = Timer(self.retention['interval_hours'] * 3600, self._schedule_retention)
+        self.retention_timer.daemon = True
+        self.retention_timer.start()
+
+    def apply_retention(self, after: TgChatMsgIDStr = TgChatMsgIDStr("")):
+        """Move a batch of message logs older than ``hot_days`` to monthly
+        archive files, and queue the next batch. When finished, archive
+        files older than ``keep_days`` are deleted.
+
+        Message logs that would be deleted right after being archived are
+        deleted from ``tgdata.db`` directly.
+
+        Args:
+            after: Check message logs with ``master_msg_id`` after this.
+        """
+        hot_days, keep_days = self.retention['hot_days'], self.retention['keep_days']
+        now = datetime.datetime.now()
+        keep_from = self.archive.month_of(now - datetime.timedelta(days=keep_days)) \
+            if keep_days is not None else ""
+        hot_cutoff = now - datetime.timedelta(days=hot_days if hot_days is not None else keep_days)
+
+        rows = list(MsgLog.select(MsgLog.master_msg_id, MsgLog.time, MsgLog.pickle)
+                    .where((MsgLog.master_msg_id > after) & (MsgLog.time < hot_cutoff))
+                    .order_by(MsgLog.master_msg_id)
+                    .limit(self.RETENTION_BATCH_SIZE)
+                    .tuples())
+        months: Dict[str, List[TgChatMsgIDStr]] = {}
+        for master_msg_id, log_time, raw in rows:
+            if self.retention['keep_reactions'] and raw is not None:
+                try:
+                    data = MsgLog.pickle.decompress(raw) if compression.is_compressed(raw) else raw
+                    if msg_log_codec.decode(data, fields=('reactions',)).get('reactions'):
+                        continue
+                except Exception as e:
+                    self.logger.debug("[%s] Failed to load misc data, archived: %r", master_msg_id, e)
+            month = self.archive.month_of(log_time)
+            if hot_days is None and month >= keep_from:
+                # Not due to be deleted, and archiving is disabled
+                continue
+            months.setdefault(month, []).append(master_msg_id)
+
+        for month, master_msg_ids in months.items():
+            if month < keep_from:
+                with database.atomic("IMMEDIATE"):
+                    for batch in chunked(master_msg_ids, self.SQLITE_MAX_VARIABLE_NUMBER):
+                        MsgLog.delete().where(MsgLog.master_msg_id.in_(batch)).execute()
+                self.msg_log_cache.clear()
+                self.logger.debug("Deleted %s message logs of %s.", len(master_msg_ids), month)
+            else:
+                self.archive.move(month, master_msg_ids)
+                self.logger.debug("Archived %s message logs to %s.", len(master_msg_ids), month)
+
+        if len(rows) == self.RETENTION_BATCH_SIZE:
+            self.add_task(self.apply_retention, (rows[-1][0],), {})
+        elif keep_from:
+            pruned = self.archive.prune(keep_from)
+            if pruned:
+                self.logger.info("Deleted message log archives of %s.", ", ".join(pruned))
+
     @staticmethod
-    def get_chat_assoc(master_uid: Optional[EFBChannelChatIDStr] = None,
+    def get_compression_report() -> Dict[str, Any]:
+        """Report sizes of message logs, compressed and not.
+
+        Returns:
+            Dict of number of message logs (``rows``), compressed text and
+            misc data (``compressed_text``, ``compressed_pickle``), bytes
+            stored for text and misc data (``text_bytes``,
+            ``pickle_bytes``), size of database file (``database_bytes``),
+            and size of free pages in it, which can be reclaimed with
+            ``VACUUM`` (``free_bytes``).
+        """
+        text_bytes = fn.LENGTH(Cast(MsgLog.text, "BLOB"))
+        rows, compressed_text, compressed_pickle, text_size, pickle_size = MsgLog.select(
+            fn.COUNT(MsgLog.master_msg_id),
+            fn.SUM(fn.typeof(MsgLog.text) == "blob"),
+            fn.SUM(fn.substr(MsgLog.pickle, 1, 1) == bytes((COMPRESSION_MAGIC,))),
+            fn.SUM(text_bytes),
+            fn.SUM(fn.LENGTH(MsgLog.pickle)),
+        ).tuples().get()
+        page_count = database.execute_sql("PRAGMA page_count").fetchone()[0]
+        page_size = database.execute_sql("PRAGMA page_size").fetchone()[0]
+        freelist_count = database.execute_sql("PRAGMA freelist_count").fetchone()[0]
+        return {
+            "rows": rows,
+            "compressed_text": compressed_text or 0,
+            "compressed_pickle": compressed_pickle or 0,
+            "text_bytes": text_size or 0,
+            "pickle_bytes": pickle_size or 0,
+            "database_bytes": page_count * page_size,
+            "free_bytes": freelist_count * page_size,
+        }
+
+    def backup_database(self) -> Dict[str, Any]:
+        """Start an online backup of ``tgdata.db`` in a separate thread.
+
+        Pages are copied from a consistent snapshot at a limited rate, per
+        ``database.backup`` in the channel config, while message logs are
+        written as usual. Only the newest ``keep`` backups are kept.
+
+        Returns:
+            Status of the backup, per ``get_backup_status``. A new backup
+            is not started if one is running, or with the LMDB backend.
+        """
+        if not self.is_sqlite:
+            status = self.get_backup_status()
+            status["error"] = "Backups are only available with the sqlite database backend."
+            return status
+        if self.backup.acquire():
+            self.backup_thread = Thread(target=self._run_backup, name="ETM database backup thread")
+            self.backup_thread.start()
+        return self.get_backup_status()
+
+    def _run_backup(self):
+        try:
+            self.backup.run(database.connection())
+        except BackupCancelled:
+            self.logger.info("Database backup is cancelled.")
+        except Exception as e:
+            self.logger.exception("Failed to back up database: %r", e)
+        finally:
+            database.close()
+
+    def get_backup_status(self) -> Dict[str, Any]:
+        """Report progress of the running backup, or result of the last one.
+
+        Returns:
+            Dict of whether a backup is running (``running``), path of the
+            backup file (``file``), number of pages copied
+            (``pages_copied``) of all pages (``pages_total``), time spent
+            (``seconds``), error message if failed (``error``), and paths
+            of finished backups, newest first (``backups``).
+        """
+        status = self.backup.status.copy()
+        status["backups"] = [str(i) for i in self.backup.backups()]
+        return status
+
+    def cancel_backup(self) -> bool:
+        """Abort the running backup.
+
+        Returns:
+            If a backup is running.
+        """
+        if not self.backup.running:
+            return False
+        self.backup.cancel()
+        return True
+
+    def compact_database(self, full: bool = False) -> Dict[str, Any]:
+        """Return free pages of ``tgdata.db`` to the file system in the
+        background.
+
+        Free pages are removed in small batches with incremental vacuum,
+        which requires ``auto_vacuum`` to be ``incremental``. Databases
+        created before it is enabled need a full ``VACUUM`` once, which
+        blocks other writes until it is finished.
+
+        Args:
+            full: Run a full ``VACUUM``, which also enables incremental
+                vacuum per the ``auto_vacuum`` pragma.
+
+        Returns:
+            ``auto_vacuum`` mode of the database (``auto_vacuum``), and size
+            of free pages before compaction (``free_bytes``). With the LMDB
+            backend, nothing is done and only ``error`` is returned.
+        """
+        if not self.is_sqlite:
+            return {"error": "Compaction is only available with the sqlite database backend."}
+        self.add_task(self.vacuum if full else self.incremental_vacuum, (), {})
+        return self._get_vacuum_status()
+
+    @staticmethod
+    def _get_vacuum_status() -> Dict[str, Any]:
+        modes = {0: "none", 1: "full", 2: "incremental"}
+        page_size = database.execute_sql("PRAGMA page_size").fetchone()[0]
+        return {
+            "auto_vacuum": modes.get(database.execute_sql("PRAGMA auto_vacuum").fetchone()[0], ""),
+            "free_bytes": database.execute_sql("PRAGMA freelist_count").fetchone()[0] * page_size,
+        }
+
+    def _schedule_maintenance(self, delay: float):
+        """Queue a scheduled incremental vacuum after ``delay`` seconds."""
+        self.maintenance_timer = Timer(delay, self.add_task, (self.incremental_vacuum, (), {"scheduled": True}))
+        self.maintenance_timer.daemon = True
+        self.maintenance_timer.start()
+
+    def _is_quiet(self) -> bool:
+        """If no message log is written for ``quiet_seconds``."""
+        with self.pending_lock:
+            if self.pending_logs:
+                return False
+            return time.monotonic() - self.last_write_time >= self.maintenance['quiet_seconds']
+
+    def incremental_vacuum(self, scheduled: bool = False):
+        """Remove a batch of free pages from ``tgdata.db``, and queue the
+        next batch until there is none.
+
+        Args:
+            scheduled: Wait for a quiet period before each batch, and
+                schedule the next run when finished.
+        """
+        if scheduled and not self._is_quiet():
+            self._schedule_maintenance(self.maintenance['quiet_seconds'])
+            return
+        status = self._get_vacuum_status()
+        if status['auto_vacuum'] != "incremental" or not status['free_bytes']:
+            if status['auto_vacuum'] != "incremental":
+                self.logger.debug("Incremental vacuum is skipped, auto_vacuum is %s.", status['auto_vacuum'])
+            if scheduled:
+                self._schedule_maintenance(self.maintenance['interval_hours'] * 3600)
+            return
+        with database.atomic("IMMEDIATE"):
+            # Each statement removes one page, as ``sqlite3`` runs only
+            # one step of statements returning no rows.
+            for _ in range(self.maintenance['vacuum_pages']):
+                database.execute_sql("PRAGMA incremental_vacuum(1)")
+        self.add_task(self.incremental_vacuum, (), {"scheduled": scheduled})
+
+    def vacuum(self):
+        """Rebuild ``tgdata.db`` with ``VACUUM``, after committing pending
+        message logs.
+        """
+        self.flush_message_log()
+        start = time.perf_counter()
+        database.execute_sql("VACUUM")
+        self.logger.info("Vacuumed database in %.2f s, auto_vacuum is %s.",
+                         time.perf_counter() - start, self._get_vacuum_status()['auto_vacuum'])
+
+    def get_chat_assoc(self, master_uid: Optional[EFBChannelChatIDStr] = None,
                        slave_uid: Optional[EFBChannelChatIDStr] = None
                        ) -> List[EFBChannelChatIDStr]:
         """
         Get chat association (chat link) information.
         Only one parameter is to be provided.
 
+        Looked up from the in-memory routing table without reading the
+        database.
+
         Args:
             master_uid (str): Master channel UID ("%(chat_id)s")
             slave_uid (str): Slave channel UID ("%(channel_id)s.%(chat_id)s")
@@ -380,34 +1732,35 @@ class DatabaseManager:
         Returns:
             list: The counterpart ID.
         """
-        try:
-            if bool(master_uid) == bool(slave_uid):
-                raise ValueError("Only one parameter is to be provided.")
-            elif master_uid:
-                slaves = ChatAssoc.select(ChatAssoc.slave_uid, ChatAssoc.master_uid)\
-                    .where(ChatAssoc.master_uid == master_uid)
-                if len(slaves) > 0:
-                    return [i.slave_uid for i in slaves]
-                else:
-                    return []
-            elif slave_uid:
-                masters = ChatAssoc.select(ChatAssoc.slave_uid, ChatAssoc.master_uid)\
-                    .where(ChatAssoc.slave_uid == slave_uid)
-                if len(masters) > 0:
-                    return [i.master_uid for i in masters]
-                else:
-                    return []
-            else:
-                return []
-        except DoesNotExist:
-            return []
+        if bool(master_uid) == bool(slave_uid):
+            raise ValueError("Only one parameter is to be provided.")
+        elif master_uid:
+            return self.chat_assoc.get_slaves(master_uid)
+        else:
+            return self.chat_assoc.get_masters(slave_uid)  # type: ignore
+
+    def get_singly_linked_slave(self, master_uid: EFBChannelChatIDStr) -> Optional[EFBChannelChatIDStr]:
+        """
+        Get the only slave chat linked to a Telegram chat.
+
+        Args:
+            master_uid (str): Master channel UID ("%(chat_id)s")
+
+        Returns:
+            The slave chat UID, ``None`` if the Telegram chat is linked to
+            no slave chat or more than one.
+        """
+        return self.chat_assoc.get_singly_linked_slave(master_uid)
 
-    @database.atomic()
     def add_or_update_message_log(self,
                                   msg: ETMMsg,
                                   master_message: Message,
                                   old_message_id: Optional[OldMsgID] = None):
-        """Add or update a message into the database."""
+        """Add or update a message into the database.
+
+        The write is queued and committed together with other pending writes
+        by the worker thread, lookups made before that see the pending row.
+        """
         master_msg_id = message_id_to_str(master_message.chat_id, master_message.message_id)
         master_msg_id_alt = None
         self.logger.debug("[%s] Received message logging request of %s", master_msg_id, msg.uid)
@@ -418,38 +1771,97 @@ class DatabaseManager:
                 self.logger.debug("[%s] Message has an old ID: %s", master_msg_id, old_message_id_str)
                 master_msg_id, master_msg_id_alt = old_message_id_str, master_msg_id
 
-        row: MsgLog
-        r = MsgLog.get_or_none(MsgLog.master_msg_id == master_msg_id)
-        if r is not None:
-            row = r
-            save = row.save
-            self.logger.debug("[%s] Message record is found in database, update it", master_msg_id)
-        else:
-            row = MsgLog()
-            save = partial(row.save, force_insert=True)
-            self.logger.debug("[%s] Message record is not found in database, insert it", master_msg_id)
-
-        row.master_msg_id = master_msg_id
-        row.master_msg_id_alt = master_msg_id_alt
-        row.text = msg.text
-        row.slave_origin_uid = chat_id_to_str(chat=msg.chat)
-        row.slave_member_uid = chat_id_to_str(chat=msg.author)
-        row.msg_type = msg.type.name
-        row.sent_to = msg.deliver_to.channel_id
-        row.slave_message_id = msg.uid or f"{self.FAIL_FLAG}.{time.time()}"
-        row.media_type = msg.type_telegram.value
-        row.file_id = msg.file_id
-        row.file_unique_id = msg.file_unique_id
-        row.mime = msg.mime
-        pickle_data = self.pickle_misc_msg(msg)
-        if pickle_data:
-            row.pickle = pickle_data
-
-        result = save()
-        self.logger.debug("[%s] Database insert/update outcome: %s", master_msg_id, result)
-
-    @staticmethod
-    def get_msg_log(master_msg_id: Optional[TgChatMsgIDStr] = None,
+        data: Dict[str, Any] = {
+            "master_msg_id": master_msg_id,
+            "master_msg_id_alt": master_msg_id_alt,
+            "master_chat_id": int(message_id_str_to_id(master_msg_id)[0]),
+            "text": msg.text,
+            "slave_origin_uid": chat_id_to_str(chat=msg.chat),
+            "slave_member_uid": chat_id_to_str(chat=msg.author),
+            "msg_type": msg.type.name,
+            "sent_to": msg.deliver_to.channel_id,
+            "slave_message_id": msg.uid or f"{self.FAIL_FLAG}.{time.time()}",
+            "media_type": msg.type_telegram.value,
+            "file_id": msg.file_id,
+            "file_unique_id": msg.file_unique_id,
+            "mime": msg.mime,
+            "pickle": self.pickle_misc_msg(msg),
+            "time": datetime.datetime.now(),
+        }
+        if old_message_id is not None or master_message.edit_date:
+            # Edited messages keep their time, and do not make their chats active again
+            existing = self.get_msg_log(master_msg_id=master_msg_id)
+            if existing is not None:
+                data['time'] = existing.time
+
+        with self.pending_lock:
+            pending = self.pending_logs.get(master_msg_id)
+            if pending is not None:
+                self.logger.debug("[%s] Message record is pending, coalesce with it", master_msg_id)
+                # Pending rows are replaced rather than updated in place,
+                # so that a concurrent flush can tell if it has committed
+                # the latest version of a row.
+                if data['pickle'] is None:
+                    data['pickle'] = pending['pickle']
+                data['time'] = pending['time']
+            elif not self.pending_logs:
+                self.pending_since = time.monotonic()
+            self.pending_logs[master_msg_id] = data
+            self.last_write_time = time.monotonic()
+            last_time = self.chat_activity.get(data['slave_origin_uid'])
+            if last_time is None or last_time < data['time']:
+                self.chat_activity[data['slave_origin_uid']] = data['time']
+            is_first = len(self.pending_logs) == 1
+        self.msg_log_cache.invalidate(master_msg_id, data['slave_message_id'], data['slave_origin_uid'])
+
+        if not self.write_behind_interval:
+            self.flush_message_log()
+        elif is_first or len(self.pending_logs) >= self.write_behind_batch_size:
+            # Wake up the worker to schedule the commit.
+            self.add_task(self._flush_timeout, (), {})
+
+    def flush_message_log(self):
+        """Commit all pending message log writes in one transaction."""
+        with self.flush_lock:
+            with self.pending_lock:
+                rows = list(self.pending_logs.values())
+            if not rows:
+                return
+            self.storage.upsert_msg_logs(rows)
+            with self.pending_lock:
+                for data in rows:
+                    if self.pending_logs.get(data['master_msg_id']) is data:
+                        del self.pending_logs[data['master_msg_id']]
+                if self.pending_logs:
+                    self.pending_since = time.monotonic()
+            self.logger.debug("Committed %s message log writes.", len(rows))
+
+    def _get_pending_log(self, master_msg_id: Optional[TgChatMsgIDStr] = None,
+                         slave_msg_id: Optional[MessageID] = None,
+                         slave_origin_uid: Optional[EFBChannelChatIDStr] = None) -> Optional[MsgLog]:
+        """Get a message log that is not yet committed, as an unsaved row
+        merged with its committed version if any.
+        """
+        with self.pending_lock:
+            if master_msg_id:
+                data = self.pending_logs.get(master_msg_id)
+            else:
+                data = None
+                for i in self.pending_logs.values():
+                    if i['slave_message_id'] == slave_msg_id and i['slave_origin_uid'] == slave_origin_uid:
+                        data = i
+        if data is None:
+            return None
+        row = self.storage.get_msg_log(master_msg_id=data['master_msg_id'])
+        if row is None:
+            return MsgLog(**data)
+        for key, value in data.items():
+            if key == 'time' or (key == 'pickle' and value is None):
+                continue
+            setattr(row, key, value)
+        return row
+
+    def get_msg_log(self, master_msg_id: Optional[TgChatMsgIDStr] = None,
                     slave_msg_id: Optional[MessageID] = None,
                     slave_origin_uid: Optional[EFBChannelChatIDStr] = None) -> Optional[MsgLog]:
         """Get message log by message ID.
@@ -467,20 +1879,32 @@ class DatabaseManager:
             raise ValueError('master_msg_id and slave_msg_id is mutual exclusive')
         if not master_msg_id and not (slave_msg_id and slave_origin_uid):
             raise ValueError('slave_msg_id and slave_origin_uid must exists together.')
-        try:
-            if master_msg_id:
-                return MsgLog.select().where(MsgLog.master_msg_id == master_msg_id) \
-                    .order_by(MsgLog.time.desc()).first()
-            else:
-                return MsgLog.select().where((MsgLog.slave_message_id == slave_msg_id) &
-                                             (MsgLog.slave_origin_uid == slave_origin_uid)
-                                             ).order_by(MsgLog.time.desc()).first()
-        except DoesNotExist:
-            return None
+        pending = self._get_pending_log(master_msg_id, slave_msg_id, slave_origin_uid)
+        if pending is not None:
+            return pending
+        log = self.msg_log_cache.get(master_msg_id, slave_msg_id, slave_origin_uid)
+        if log is not None:
+            return log
+        generation = self.msg_log_cache.generation
+        log = self.storage.get_msg_log(master_msg_id, slave_msg_id, slave_origin_uid)
+        if log is None and self.archive is not None:
+            # Fall back to archived message logs
+            log = self.archive.get(master_msg_id, slave_msg_id, slave_origin_uid)
+        if log is not None:
+            self.msg_log_cache.put(log, generation)
+        return log
+
+    def get_msg_log_cache_stats(self) -> Dict[str, Any]:
+        """Report usage of the message log cache.
 
-    @staticmethod
-    @database.atomic()
-    def delete_msg_log(master_msg_id: Optional[TgChatMsgIDStr] = None,
+        Returns:
+            Dict of number of cached message logs (``size``), maximum number
+            of them (``capacity``), number of lookups answered from the
+            cache (``hits``) and not (``misses``), and ``hit_rate``.
+        """
+        return self.msg_log_cache.stats()
+
+    def delete_msg_log(self, master_msg_id: Optional[TgChatMsgIDStr] = None,
                        slave_msg_id: Optional[EFBChannelChatIDStr] = None,
                        slave_origin_uid: Optional[EFBChannelChatIDStr] = None):
         """Remove a message log by message ID.
@@ -495,18 +1919,17 @@ class DatabaseManager:
             raise ValueError('master_msg_id and slave_msg_id is mutual exclusive')
         if not master_msg_id and not (slave_msg_id and slave_origin_uid):
             raise ValueError('slave_msg_id and slave_origin_uid must exists together.')
-        try:
-            if master_msg_id:
-                MsgLog.delete().where(MsgLog.master_msg_id == master_msg_id).execute()
-            else:
-                MsgLog.delete().where((MsgLog.slave_message_id == slave_msg_id) &
-                                      (MsgLog.slave_origin_uid == slave_origin_uid)
-                                      ).execute()
-        except DoesNotExist:
-            return
-
-    @staticmethod
-    def get_slave_chat_info(slave_channel_id: Optional[ModuleID] = None,
+        with self.flush_lock, self.pending_lock:
+            for key, data in list(self.pending_logs.items()):
+                if key == master_msg_id or (data['slave_message_id'] == slave_msg_id and
+                                            data['slave_origin_uid'] == slave_origin_uid):
+                    del self.pending_logs[key]
+            self.storage.delete_msg_log(master_msg_id, slave_msg_id, slave_origin_uid)
+        if self.archive is not None:
+            self.archive.delete(master_msg_id, slave_msg_id, slave_origin_uid)
+        self.msg_log_cache.invalidate(master_msg_id, slave_msg_id, slave_origin_uid)
+
+    def get_slave_chat_info(self, slave_channel_id: Optional[ModuleID] = None,
                             slave_chat_uid: Optional[ChatID] = None,
                             slave_chat_group_id: Optional[ChatID] = None
                             ) -> Optional[SlaveChatInfo]:
@@ -518,86 +1941,99 @@ class DatabaseManager:
         """
         if slave_channel_id is None or slave_chat_uid is None:
             raise ValueError("Both slave_channel_id and slave_chat_id should be provided.")
-        try:
-            return SlaveChatInfo.select() \
-                .where((SlaveChatInfo.slave_channel_id == slave_channel_id) &
-                       (SlaveChatInfo.slave_chat_uid == slave_chat_uid) &
-                       (SlaveChatInfo.slave_chat_group_id == slave_chat_group_id)).first()
-        except DoesNotExist:
-            return None
+        return self.storage.get_slave_chat_info(slave_channel_id, slave_chat_uid, slave_chat_group_id)
 
-    @database.atomic()
-    def set_slave_chat_info(self, chat_object: 'ETMChatType') -> SlaveChatInfo:
+    def set_slave_chat_info(self, chat_object: 'ETMChatType', members: bool = True):
         """
         Insert or update slave chat info entry
 
         Args:
             chat_object (ETMChatType): Chat object for pickling
+            members: Also update members of a group chat.
+        """
+        self.set_slave_chat_info_bulk([chat_object], members)
 
-        Returns:
-            SlaveChatInfo: The inserted or updated row
-        """
-        slave_channel_id = chat_object.module_id
-        slave_channel_name = chat_object.module_name
-        slave_channel_emoji = chat_object.channel_emoji
-        slave_chat_uid = chat_object.uid
-        slave_chat_name = chat_object.name
-        slave_chat_alias = chat_object.alias
-        slave_chat_type = chat_object.chat_type_name
-        parent_chat: Optional['ETMChatType'] = getattr(chat_object, 'chat', None)
-        slave_chat_group_id: Optional[ChatID]
-        if parent_chat:
-            slave_chat_group_id = parent_chat.uid
-        else:
-            slave_chat_group_id = None
-
-        chat_info = self.get_slave_chat_info(slave_channel_id=slave_channel_id,
-                                             slave_chat_uid=slave_chat_uid,
-                                             slave_chat_group_id=slave_chat_group_id)
-        if chat_info is not None:
-            chat_info.slave_channel_name = slave_channel_name
-            chat_info.slave_channel_emoji = slave_channel_emoji
-            chat_info.slave_chat_name = slave_chat_name
-            chat_info.slave_chat_alias = slave_chat_alias
-            chat_info.slave_chat_type = slave_chat_type
-            chat_info.pickle = chat_object.pickle
-            chat_info.save()
-            return chat_info
-        else:
-            return SlaveChatInfo.create(slave_channel_id=slave_channel_id,
-                                        slave_channel_name=slave_channel_name,
-                                        slave_channel_emoji=slave_channel_emoji,
-                                        slave_chat_uid=slave_chat_uid,
-                                        slave_chat_group_id=slave_chat_group_id,
-                                        slave_chat_name=slave_chat_name,
-                                        slave_chat_alias=slave_chat_alias,
-                                        slave_chat_type=slave_chat_type,
-                                        pickle=chat_object.pickle)
+    def set_slave_chat_info_bulk(self, chat_objects: Collection['ETMChatType'], members: bool = True):
+        """
+        Insert or update slave chat info entries of multiple chats.
 
-    @staticmethod
-    @database.atomic()
-    def delete_slave_chat_info(slave_channel_id: ModuleID, slave_chat_uid: ChatID, slave_chat_group_id: ChatID = None):
-        return SlaveChatInfo.delete() \
-            .where((SlaveChatInfo.slave_channel_id == slave_channel_id) &
-                   (SlaveChatInfo.slave_chat_uid == slave_chat_uid) &
-                   (SlaveChatInfo.slave_chat_group_id == slave_chat_group_id)).execute()
+        Args:
+            chat_objects (Collection[ETMChatType]): Chat objects for pickling
+            members: Also update members of group chats, see
+                :meth:`set_chat_members`.
+        """
+        rows = []
+        member_rows: List[Dict[str, Any]] = []
+        for chat_object in chat_objects:
+            parent_chat: Optional['ETMChatType'] = getattr(chat_object, 'chat', None)
+            rows.append({
+                "slave_channel_id": chat_object.module_id,
+                "slave_channel_emoji": chat_object.channel_emoji,
+                "slave_chat_uid": chat_object.uid,
+                "slave_chat_group_id": parent_chat.uid if parent_chat else None,
+                "slave_chat_name": chat_object.name,
+                "slave_chat_alias": chat_object.alias,
+                "slave_chat_type": chat_object.chat_type_name,
+                "pickle": chat_object.pickle,
+            })
+            if members and isinstance(chat_object, ETMGroupChat):
+                member_rows.extend(self._chat_member_rows(chat_object, chat_object.members))
+        if not rows:
+            return
+        self.storage.set_slave_chat_info(rows, member_rows)
+        self.logger.debug("Updated %s slave chat info entries.", len(rows))
 
-    @staticmethod
-    def get_recent_slave_chats(master_chat_id: TelegramChatID, limit=5) -> List[EFBChannelChatIDStr]:
-        query = MsgLog \
-            .select(MsgLog.slave_origin_uid, fn.MAX(MsgLog.time)) \
-            .where(MsgLog.master_msg_id.startswith("{}.".format(master_chat_id))) \
-            .group_by(MsgLog.slave_origin_uid) \
-            .order_by(fn.MAX(MsgLog.time).desc()) \
-            .limit(limit)
+    def set_chat_members(self, chat_object: 'ETMChatType', members: Collection['ETMChatMember']):
+        """
+        Insert or update entries of members of a group chat. Entries not
+        changed are not written.
 
-        return [EFBChannelChatIDStr(i.slave_origin_uid) for i in query]
+        Args:
+            chat_object (ETMChatType): The group chat
+            members (Collection[ETMChatMember]): Members to be updated
+        """
+        self.storage.set_chat_members(self._chat_member_rows(chat_object, members))
 
     @staticmethod
-    def get_last_message(slave_chat_id: EFBChannelChatIDStr) -> Optional[MsgLog]:
-        try:
-            return MsgLog.select().where(
-                MsgLog.slave_origin_uid == slave_chat_id
-            ).order_by(MsgLog.time.desc()).limit(1).first()
-        except DoesNotExist:
-            return None
+    def _chat_member_rows(chat_object: 'ETMChatType', members: Collection['ETMChatMember']) -> List[Dict[str, Any]]:
+        return [{
+            "module_id": chat_object.module_id,
+            "group_id": chat_object.uid,
+            "member_uid": member.uid,
+            "pickle": member.pickle,
+        } for member in members]
+
+    def get_chat_members(self, module_id: ModuleID, group_id: ChatID) -> List[ChatMemberInfo]:
+        """Get entries of all members of a group chat."""
+        return self.storage.get_chat_members(module_id, group_id)
+
+    def delete_chat_members(self, module_id: ModuleID, group_id: ChatID,
+                            member_uids: Optional[Collection[ChatID]] = None):
+        """
+        Remove entries of members of a group chat.
+
+        Args:
+            module_id: Module ID of the group chat
+            group_id: ID of the group chat
+            member_uids: IDs of members to be removed, all members if not
+                provided.
+        """
+        self.storage.delete_chat_members(module_id, group_id, member_uids)
+
+    def delete_slave_chat_info(self, slave_channel_id: ModuleID, slave_chat_uid: ChatID,
+                               slave_chat_group_id: ChatID = None):
+        return self.storage.delete_slave_chat_info(slave_channel_id, slave_chat_uid, slave_chat_group_id)
+
+    def get_recent_slave_chats(self, master_chat_id: TelegramChatID, limit=5) -> List[EFBChannelChatIDStr]:
+        self.flush_message_log()
+        return self.storage.get_recent_slave_chats(master_chat_id, limit)
+
+    def get_last_message_time(self, slave_chat_id: EFBChannelChatIDStr) -> Optional[datetime.datetime]:
+        """Time of the last message log written of a slave chat, looked up
+        from memory. ``None`` if there is none.
+        """
+        return self.chat_activity.get(slave_chat_id)
+
+    def get_last_message(self, slave_chat_id: EFBChannelChatIDStr) -> Optional[MsgLog]:
+        self.flush_message_log()
+        return self.storage.get_last_message(slave_chat_id)
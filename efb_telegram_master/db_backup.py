@@ -0,0 +1,149 @@
+# coding: utf-8
+"""
+Online backup of an SQLite database with the SQLite backup API, copying a
+limited number of pages per step at a limited rate.
+"""
+
+import datetime
+import logging
+import re
+import sqlite3
+import threading
+import time
+from contextlib import suppress
+from pathlib import Path
+from typing import Dict, Any, List
+
+BACKUP_KEEP = 3
+"""Number of backup files to be kept."""
+BACKUP_MAX_RATE_KIB = 4096
+"""Maximum rate of copying in KiB per second, ``0`` for no limit."""
+BACKUP_STEP_KIB = 1024
+"""Size of pages copied in each step in KiB."""
+
+
+class BackupCancelled(Exception):
+    """Raised from the progress callback to abort a running backup."""
+
+
+class DatabaseBackup:
+    """Copy a live database to ``tgdata_YYYYMMDD_HHMMSS.db`` files.
+
+    Pages are copied inside a read transaction on the source connection,
+    so that the copy is a consistent snapshot, and writes from other
+    connections neither block nor restart the backup in WAL mode. The WAL
+    file cannot be checkpointed past the snapshot until the backup is done.
+
+    A backup is written to a ``.partial`` file, and renamed when finished.
+    Only one backup runs at a time.
+    """
+
+    logger = logging.getLogger(__name__)
+    FILE_PATTERN = re.compile(r"^tgdata_\d{8}_\d{6}\.db$")
+
+    def __init__(self, path: Path, keep: int = BACKUP_KEEP,
+                 max_rate_kib: int = BACKUP_MAX_RATE_KIB, step_kib: int = BACKUP_STEP_KIB):
+        self.path = path
+        self.keep = keep
+        self.max_rate = max_rate_kib * 1024
+        self.step_size = max(1, step_kib) * 1024
+        self.lock = threading.Lock()
+        self.running = False
+        self.cancelled = False
+        self.status: Dict[str, Any] = {"running": False, "file": "", "pages_copied": 0, "pages_total": 0,
+                                       "seconds": 0.0, "error": ""}
+        """Progress of the running backup, or result of the last one."""
+
+    def backups(self) -> List[Path]:
+        """Finished backup files, newest first."""
+        if not self.path.is_dir():
+            return []
+        return sorted((i for i in self.path.iterdir() if self.FILE_PATTERN.match(i.name)), reverse=True)
+
+    def acquire(self) -> bool:
+        """Mark a backup as running, ``False`` if one is already running."""
+        with self.lock:
+            if self.running:
+                return False
+            self.running = True
+            self.cancelled = False
+            self.status = {"running": True, "file": "", "pages_copied": 0, "pages_total": 0,
+                           "seconds": 0.0, "error": ""}
+            return True
+
+    def cancel(self):
+        """Abort the running backup after its current step."""
+        self.cancelled = True
+
+    def run(self, source: sqlite3.Connection) -> Path:
+        """Back up the main database of a connection. ``acquire`` must be
+        called first.
+
+        Args:
+            source: Connection in autocommit mode, not inside a
+                transaction, and not used by other threads until the
+                backup is finished.
+
+        Returns:
+            Path of the backup file.
+        """
+        status = self.status
+        start = time.monotonic()
+        name = f"tgdata_{datetime.datetime.now():%Y%m%d_%H%M%S}.db"
+        destination = self.path / name
+        partial = self.path / (name + ".partial")
+        status["file"] = str(destination)
+        try:
+            self.path.mkdir(parents=True, exist_ok=True)
+            page_size = source.execute("PRAGMA page_size").fetchone()[0]
+            pages = max(1, self.step_size // page_size)
+
+            def progress(_status: int, remaining: int, total: int):
+                status["pages_copied"] = total - remaining
+                status["pages_total"] = total
+                status["seconds"] = time.monotonic() - start
+                if self.cancelled:
+                    raise BackupCancelled()
+                if self.max_rate:
+                    delay = status["pages_copied"] * page_size / self.max_rate - status["seconds"]
+                    if delay > 0:
+                        time.sleep(delay)
+
+            target = sqlite3.connect(str(partial))
+            try:
+                # Hold a snapshot for the whole backup
+                source.execute("BEGIN")
+                source.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()
+                try:
+                    source.backup(target, pages=pages, progress=progress)
+                finally:
+                    source.execute("ROLLBACK")
+                # Keep the backup in a single file
+                target.execute("PRAGMA journal_mode = DELETE")
+            finally:
+                target.close()
+            partial.replace(destination)
+            self.prune()
+            self.logger.info("Backed up database to %s in %.2f s.", destination, time.monotonic() - start)
+            return destination
+        except BaseException as e:
+            status["error"] = "Cancelled." if isinstance(e, BackupCancelled) else repr(e)
+            with suppress(FileNotFoundError):
+                partial.unlink()
+            raise
+        finally:
+            status["seconds"] = time.monotonic() - start
+            status["running"] = False
+            with self.lock:
+                self.running = False
+
+    def prune(self) -> List[Path]:
+        """Delete backup files other than the newest ``keep`` ones.
+
+        Returns:
+            Paths of the files deleted.
+        """
+        pruned = self.backups()[self.keep:] if self.keep > 0 else []
+        for path in pruned:
+            path.unlink()
+        return pruned
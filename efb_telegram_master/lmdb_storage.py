@@ -0,0 +1,342 @@
+# coding: utf-8
+"""
+Storage backend in an LMDB environment, requires the ``lmdb`` package,
+which can be installed with ``pip install efb-telegram-master[lmdb]``.
+
+Rows are stored in named databases as pickled tuples of column values.
+Keys are byte strings ordered so that lookups are prefix scans:
+
+- ``msglog``: ``master_msg_id`` to a message log row.
+- ``msglog_slave``: ``slave_origin_uid``, ``slave_message_id`` and
+  ``time`` to ``master_msg_id``.
+- ``msglog_chat``: ``slave_origin_uid`` and ``time`` to ``master_msg_id``.
+- ``msglog_master_chat``: ``master_chat_id`` and ``slave_origin_uid`` to
+  the time of the last message of the slave chat in the Telegram chat.
+- ``chatactivity``: ``slave_origin_uid`` to the time of its last message.
+- ``chatassoc``: sequence number to ``master_uid`` and ``slave_uid``.
+- ``slavechatinfo``: channel ID, chat ID and group ID to a slave chat
+  info row.
+- ``chatmember``: module ID, group ID and member ID to a sequence number
+  and the pickled member.
+
+Parts of keys are separated by ``\\0``. Times and integers are encoded as
+big-endian unsigned integers offset by 2^63, so that they are ordered
+numerically.
+"""
+
+import datetime
+import pickle
+import struct
+import threading
+from pathlib import Path
+from typing import List, Optional, Tuple, Dict, Any, Collection, Iterable, Iterator
+
+from ehforwarderbot.types import ModuleID, ChatID, MessageID
+
+from .db import MsgLog, SlaveChatInfo, ChatMemberInfo
+from .storage import StorageBackend
+from .utils import EFBChannelChatIDStr, TgChatMsgIDStr, TelegramChatID
+
+__all__ = ['LMDBStorage']
+
+LMDB_MAP_SIZE_MIB = 16 * 1024
+"""Maximum size of the environment in MiB. Space is only allocated when
+used on most platforms.
+"""
+
+_SEP = b"\0"
+_UINT64 = struct.Struct(">Q")
+_OFFSET = 1 << 63
+_EPOCH = datetime.datetime(1970, 1, 1)
+
+MSG_LOG_COLUMNS = tuple(i.name for i in MsgLog._meta.sorted_fields)
+SLAVE_CHAT_INFO_COLUMNS = tuple(i.name for i in SlaveChatInfo._meta.sorted_fields if i.name != "id")
+
+
+def _key(*parts: Any) -> bytes:
+    """Join parts of a key, where a trailing separator is kept so that
+    the key can be used as a prefix.
+    """
+    return _SEP.join(i if isinstance(i, bytes) else str("" if i is None else i).encode() for i in parts)
+
+
+def _int(value: int) -> bytes:
+    return _UINT64.pack(value + _OFFSET)
+
+
+def _time(value: Optional[datetime.datetime]) -> bytes:
+    if value is None:
+        return _int(0)
+    return _int((value - _EPOCH) // datetime.timedelta(microseconds=1))
+
+
+def _from_time(value: bytes) -> datetime.datetime:
+    return _EPOCH + datetime.timedelta(microseconds=_UINT64.unpack(value)[0] - _OFFSET)
+
+
+def _dumps(values: Tuple[Any, ...]) -> bytes:
+    return pickle.dumps(values, protocol=4)
+
+
+class LMDBStorage(StorageBackend):
+    """Storage in an LMDB environment.
+
+    LMDB allows one write transaction at a time, and readers are never
+    blocked by it. As ``DatabaseManager`` commits message logs in batches
+    from one thread, writes rarely wait for each other.
+    """
+
+    name = "lmdb"
+
+    def __init__(self, path: Path, config: Dict[str, Any]):
+        """
+        Args:
+            path: Directory of the environment.
+            config: ``database.lmdb`` in the channel config, with the
+                maximum size of the environment in MiB (``map_size_mib``),
+                and whether to flush to disk on every commit (``sync``).
+        """
+        import lmdb
+        path.mkdir(parents=True, exist_ok=True)
+        self.env = lmdb.open(str(path), max_dbs=16,
+                             map_size=config.get('map_size_mib', LMDB_MAP_SIZE_MIB) * 1024 * 1024,
+                             sync=config.get('sync', True))
+        self.msglog = self.env.open_db(b"msglog")
+        self.msglog_slave = self.env.open_db(b"msglog_slave")
+        self.msglog_chat = self.env.open_db(b"msglog_chat")
+        self.msglog_master_chat = self.env.open_db(b"msglog_master_chat")
+        self.chatactivity = self.env.open_db(b"chatactivity")
+        self.chatassoc = self.env.open_db(b"chatassoc")
+        self.slavechatinfo = self.env.open_db(b"slavechatinfo")
+        self.chatmember = self.env.open_db(b"chatmember")
+        self.seq_lock = threading.Lock()
+        self.seq = 0
+        """Last sequence number given to chat associations and members."""
+        with self.env.begin() as txn:
+            cursor = txn.cursor(self.chatassoc)
+            if cursor.last():
+                self.seq = _UINT64.unpack(cursor.key())[0]
+            for value in txn.cursor(self.chatmember).iternext(keys=False):
+                self.seq = max(self.seq, _UINT64.unpack(value[:8])[0])
+
+    def close(self):
+        self.env.close()
+
+    def _next_seq(self) -> bytes:
+        with self.seq_lock:
+            self.seq += 1
+            return _UINT64.pack(self.seq)
+
+    @staticmethod
+    def _scan(txn, db, prefix: bytes) -> Iterator[Tuple[bytes, bytes]]:
+        """Iterate over entries with keys starting with ``prefix``."""
+        cursor = txn.cursor(db)
+        if not cursor.set_range(prefix):
+            return
+        for key, value in cursor:
+            if not key.startswith(prefix):
+                break
+            yield key, value
+
+    @staticmethod
+    def _last(txn, db, prefix: bytes) -> Optional[Tuple[bytes, bytes]]:
+        """Last entry with key starting with ``prefix``, which ends with a
+        separator.
+        """
+        cursor = txn.cursor(db)
+        # Smallest key after all keys with the prefix
+        upper = prefix[:-1] + bytes((prefix[-1] + 1,))
+        found = cursor.prev() if cursor.set_range(upper) else cursor.last()
+        if found and cursor.key().startswith(prefix):
+            return cursor.key(), cursor.value()
+        return None
+
+    # Chat associations
+
+    def _chat_assocs(self, txn) -> Iterator[Tuple[bytes, EFBChannelChatIDStr, EFBChannelChatIDStr]]:
+        for key, value in txn.cursor(self.chatassoc):
+            master_uid, slave_uid = bytes(value).decode().split("\0")
+            yield key, EFBChannelChatIDStr(master_uid), EFBChannelChatIDStr(slave_uid)
+
+    def get_chat_assocs(self) -> Iterable[Tuple[EFBChannelChatIDStr, EFBChannelChatIDStr]]:
+        with self.env.begin() as txn:
+            return [(master_uid, slave_uid) for _, master_uid, slave_uid in self._chat_assocs(txn)]
+
+    def add_chat_assoc(self, master_uid: EFBChannelChatIDStr, slave_uid: EFBChannelChatIDStr,
+                       multiple_slave: bool = False):
+        with self.env.begin(write=True) as txn:
+            for key, master, slave in list(self._chat_assocs(txn)):
+                if slave == slave_uid or (not multiple_slave and master == master_uid):
+                    txn.delete(key, db=self.chatassoc)
+            txn.put(self._next_seq(), _key(master_uid, slave_uid), db=self.chatassoc)
+
+    def remove_chat_assoc(self, master_uid: Optional[EFBChannelChatIDStr] = None,
+                          slave_uid: Optional[EFBChannelChatIDStr] = None) -> int:
+        count = 0
+        with self.env.begin(write=True) as txn:
+            for key, master, slave in list(self._chat_assocs(txn)):
+                if (master_uid and master == master_uid) or (not master_uid and slave == slave_uid):
+                    txn.delete(key, db=self.chatassoc)
+                    count += 1
+        return count
+
+    def migrate_chat_assoc(self, from_master_uid: EFBChannelChatIDStr, to_master_uid: EFBChannelChatIDStr) -> int:
+        count = 0
+        with self.env.begin(write=True) as txn:
+            assocs = list(self._chat_assocs(txn))
+            slave_uids = {slave for _, master, slave in assocs if master == from_master_uid}
+            for key, master, slave in assocs:
+                if master == from_master_uid:
+                    txn.put(key, _key(to_master_uid, slave), db=self.chatassoc)
+                    count += 1
+                elif slave in slave_uids:
+                    txn.delete(key, db=self.chatassoc)
+        return count
+
+    # Message log
+
+    def _load_msg_log(self, txn, master_msg_id: bytes) -> Optional[Dict[str, Any]]:
+        value = txn.get(master_msg_id, db=self.msglog)
+        if value is None:
+            return None
+        return dict(zip(MSG_LOG_COLUMNS, pickle.loads(value)))
+
+    def _delete_msg_log_row(self, txn, data: Dict[str, Any]):
+        txn.delete(_key(data['master_msg_id']), db=self.msglog)
+        txn.delete(_key(data['slave_origin_uid'], data['slave_message_id'], _time(data['time'])),
+                   db=self.msglog_slave)
+        txn.delete(_key(data['slave_origin_uid'], _time(data['time'])), db=self.msglog_chat)
+
+    def upsert_msg_logs(self, rows: List[Dict[str, Any]]):
+        """Text and miscellaneous data are compressed per ``compression``
+        as in ``tgdata.db``.
+        """
+        with self.env.begin(write=True) as txn:
+            for data in rows:
+                data = dict(data)
+                key = _key(data['master_msg_id'])
+                existing = self._load_msg_log(txn, key)
+                if existing is not None:
+                    data['time'] = existing['time']
+                    if data.get('pickle') is None:
+                        data['pickle'] = existing['pickle']
+                    self._delete_msg_log_row(txn, existing)
+                data['text'] = MsgLog.text.db_value(data.get('text'))
+                if data.get('pickle') is not None:
+                    data['pickle'] = bytes(MsgLog.pickle.db_value(data['pickle']))
+                txn.put(key, _dumps(tuple(data.get(i) for i in MSG_LOG_COLUMNS)), db=self.msglog)
+                log_time = _time(data['time'])
+                txn.put(_key(data['slave_origin_uid'], data['slave_message_id'], log_time), key,
+                        db=self.msglog_slave)
+                txn.put(_key(data['slave_origin_uid'], log_time), key, db=self.msglog_chat)
+                if data.get('master_chat_id') is not None:
+                    chat_key = _key(_int(int(data['master_chat_id'])), data['slave_origin_uid'])
+                    last = txn.get(chat_key, db=self.msglog_master_chat)
+                    if last is None or bytes(last) < log_time:
+                        txn.put(chat_key, log_time, db=self.msglog_master_chat)
+                activity_key = _key(data['slave_origin_uid'])
+                last = txn.get(activity_key, db=self.chatactivity)
+                if last is None or bytes(last) < log_time:
+                    txn.put(activity_key, log_time, db=self.chatactivity)
+
+    def _find_msg_log(self, txn, master_msg_id: Optional[TgChatMsgIDStr] = None,
+                      slave_msg_id: Optional[MessageID] = None,
+                      slave_origin_uid: Optional[EFBChannelChatIDStr] = None) -> Optional[Dict[str, Any]]:
+        if master_msg_id:
+            return self._load_msg_log(txn, _key(master_msg_id))
+        entry = self._last(txn, self.msglog_slave, _key(slave_origin_uid, slave_msg_id, b""))
+        if entry is None:
+            return None
+        return self._load_msg_log(txn, bytes(entry[1]))
+
+    def get_msg_log(self, master_msg_id: Optional[TgChatMsgIDStr] = None,
+                    slave_msg_id: Optional[MessageID] = None,
+                    slave_origin_uid: Optional[EFBChannelChatIDStr] = None) -> Optional[MsgLog]:
+        with self.env.begin() as txn:
+            data = self._find_msg_log(txn, master_msg_id, slave_msg_id, slave_origin_uid)
+        return MsgLog(**data) if data is not None else None
+
+    def delete_msg_log(self, master_msg_id: Optional[TgChatMsgIDStr] = None,
+                       slave_msg_id: Optional[MessageID] = None,
+                       slave_origin_uid: Optional[EFBChannelChatIDStr] = None):
+        with self.env.begin(write=True) as txn:
+            while True:
+                data = self._find_msg_log(txn, master_msg_id, slave_msg_id, slave_origin_uid)
+                if data is None:
+                    break
+                self._delete_msg_log_row(txn, data)
+
+    def get_recent_slave_chats(self, master_chat_id: TelegramChatID, limit: int) -> List[EFBChannelChatIDStr]:
+        prefix = _key(_int(int(master_chat_id)), b"")
+        with self.env.begin() as txn:
+            chats = [(bytes(value), bytes(key[len(prefix):]).decode())
+                     for key, value in self._scan(txn, self.msglog_master_chat, prefix)]
+        chats.sort(reverse=True)
+        return [EFBChannelChatIDStr(uid) for _, uid in chats[:limit]]
+
+    def get_last_message(self, slave_origin_uid: EFBChannelChatIDStr) -> Optional[MsgLog]:
+        with self.env.begin() as txn:
+            entry = self._last(txn, self.msglog_chat, _key(slave_origin_uid, b""))
+            data = self._load_msg_log(txn, bytes(entry[1])) if entry is not None else None
+        return MsgLog(**data) if data is not None else None
+
+    def get_chat_activity(self) -> Dict[EFBChannelChatIDStr, datetime.datetime]:
+        with self.env.begin() as txn:
+            return {EFBChannelChatIDStr(bytes(key).decode()): _from_time(bytes(value))
+                    for key, value in txn.cursor(self.chatactivity)}
+
+    # Slave chat info
+
+    def get_slave_chat_info(self, slave_channel_id: ModuleID, slave_chat_uid: ChatID,
+                            slave_chat_group_id: Optional[ChatID] = None) -> Optional[SlaveChatInfo]:
+        with self.env.begin() as txn:
+            value = txn.get(_key(slave_channel_id, slave_chat_uid, slave_chat_group_id), db=self.slavechatinfo)
+        if value is None:
+            return None
+        return SlaveChatInfo(**dict(zip(SLAVE_CHAT_INFO_COLUMNS, pickle.loads(value))))
+
+    def set_slave_chat_info(self, rows: Collection[Dict[str, Any]], members: Collection[Dict[str, Any]] = ()):
+        with self.env.begin(write=True) as txn:
+            for data in rows:
+                txn.put(_key(data['slave_channel_id'], data['slave_chat_uid'], data['slave_chat_group_id']),
+                        _dumps(tuple(data.get(i) for i in SLAVE_CHAT_INFO_COLUMNS)), db=self.slavechatinfo)
+            self._set_chat_members(txn, members)
+
+    def delete_slave_chat_info(self, slave_channel_id: ModuleID, slave_chat_uid: ChatID,
+                               slave_chat_group_id: Optional[ChatID] = None) -> int:
+        with self.env.begin(write=True) as txn:
+            return int(txn.delete(_key(slave_channel_id, slave_chat_uid, slave_chat_group_id),
+                                  db=self.slavechatinfo))
+
+    def _set_chat_members(self, txn, rows: Collection[Dict[str, Any]]):
+        for data in rows:
+            key = _key(data['module_id'], data['group_id'], data['member_uid'])
+            existing = txn.get(key, db=self.chatmember)
+            if existing is not None and bytes(existing[8:]) == data['pickle']:
+                continue
+            seq = bytes(existing[:8]) if existing is not None else self._next_seq()
+            txn.put(key, seq + data['pickle'], db=self.chatmember)
+
+    def set_chat_members(self, rows: Collection[Dict[str, Any]]):
+        """Entries not changed are not written."""
+        with self.env.begin(write=True) as txn:
+            self._set_chat_members(txn, rows)
+
+    def get_chat_members(self, module_id: ModuleID, group_id: ChatID) -> List[ChatMemberInfo]:
+        prefix = _key(module_id, group_id, b"")
+        with self.env.begin() as txn:
+            entries = sorted((bytes(value[:8]), bytes(key[len(prefix):]).decode(), bytes(value[8:]))
+                             for key, value in self._scan(txn, self.chatmember, prefix))
+        return [ChatMemberInfo(module_id=module_id, group_id=group_id, member_uid=member_uid, pickle=data)
+                for _, member_uid, data in entries]
+
+    def delete_chat_members(self, module_id: ModuleID, group_id: ChatID,
+                            member_uids: Optional[Collection[ChatID]] = None):
+        prefix = _key(module_id, group_id, b"")
+        with self.env.begin(write=True) as txn:
+            if member_uids is None:
+                keys = [bytes(key) for key, _ in self._scan(txn, self.chatmember, prefix)]
+            else:
+                keys = [_key(module_id, group_id, i) for i in member_uids]
+            for key in keys:
+                txn.delete(key, db=self.chatmember)
@@ -200,10 +200,7 @@ class MasterMessageProcessor(LocaleMixin):
         Otherwise return None.
         """
         master_chat_uid = utils.chat_id_to_str(self.channel_id, chat.id)
-        chats = self.db.get_chat_assoc(master_uid=master_chat_uid)
-        if len(chats) == 1:
-            return chats[0]
-        return None
+        return self.db.get_singly_linked_slave(master_chat_uid)
 
     def process_telegram_message(self, update: Update, context: CallbackContext,
                                  destination: EFBChannelChatIDStr, quote: bool = False,
@@ -476,7 +473,7 @@ class MasterMessageProcessor(LocaleMixin):
                 "This message is not found in ETM database. You cannot remove it from its remote chat."
             ))
         try:
-            etm_msg: ETMMsg = msg_log.build_etm_msg(self.chat_manager)
+            etm_msg: ETMMsg = msg_log.build_etm_msg(self.chat_manager, db=self.db)
         except UnpicklingError:
             return self.bot.reply_error(update, self._(
                 "This message is not found in ETM database. You cannot remove it from its remote chat."
@@ -3,7 +3,7 @@ import mimetypes
 import os
 import tempfile
 from pathlib import Path
-from typing import Optional, TYPE_CHECKING, Dict, Any, BinaryIO
+from typing import Optional, TYPE_CHECKING, Dict, Any, BinaryIO, Callable
 
 import magic
 import telegram
@@ -24,7 +24,7 @@ if TYPE_CHECKING:
 
 logger = logging.Logger(__name__)
 
-__all__ = ['ETMMsg']
+__all__ = ['ETMMsg', 'LazyETMMsg']
 
 
 class ETMMsg(Message):
@@ -214,3 +214,70 @@ class ETMMsg(Message):
                 self.file_id = message.video_note.file_id
                 self.file_unique_id = message.video_note.file_unique_id
                 self.mime = 'video/mpeg'
+
+
+class _LazyField:
+    """Attribute of ``LazyETMMsg`` computed by its resolver upon the first
+    access, and stored as an ordinary value afterwards.
+    """
+
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self
+        try:
+            return instance.__dict__[self.name]
+        except KeyError:
+            pass
+        resolver = instance.__dict__.get('_resolvers', {}).get(self.name)
+        if resolver is None:
+            raise AttributeError(self.name)
+        value = resolver()
+        instance.__dict__[self.name] = value
+        instance.__dict__['_resolvers'].pop(self.name, None)
+        return value
+
+    def __set__(self, instance, value):
+        instance.__dict__[self.name] = value
+        instance.__dict__.get('_resolvers', {}).pop(self.name, None)
+
+
+class LazyETMMsg(ETMMsg):
+    """ETMMsg with some fields resolved only when they are accessed, used
+    for messages built from the message log.
+
+    Fields with a resolver are left unset by the constructor. Assigning a
+    value to a field discards its resolver.
+    """
+
+    chat = _LazyField()  # type: ignore
+    author = _LazyField()  # type: ignore
+    target = _LazyField()  # type: ignore
+    is_system = _LazyField()  # type: ignore
+    attributes = _LazyField()  # type: ignore
+    commands = _LazyField()  # type: ignore
+    substitutions = _LazyField()  # type: ignore
+    reactions = _LazyField()  # type: ignore
+
+    def __init__(self, resolvers: Dict[str, Callable[[], Any]], **kwargs):
+        super().__init__(**kwargs)
+        for name in resolvers:
+            self.__dict__.pop(name, None)
+        self._resolvers: Dict[str, Callable[[], Any]] = dict(resolvers)
+
+    def resolve_all(self):
+        """Resolve all pending fields."""
+        for name in list(self._resolvers):
+            getattr(self, name)
+
+    def __getstate__(self):
+        self.resolve_all()
+        state = super().__getstate__()
+        del state['_resolvers']
+        return state
+
+    def __setstate__(self, state: Dict[str, Any]):
+        super().__setstate__(state)
+        self._resolvers = {}
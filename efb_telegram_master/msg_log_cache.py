@@ -0,0 +1,116 @@
+# coding: utf-8
+"""
+Least recently used cache of message log entries, looked up by either
+Telegram message ID or slave message ID.
+"""
+
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple, Any, TYPE_CHECKING
+
+from ehforwarderbot.types import MessageID
+
+from .utils import TgChatMsgIDStr, EFBChannelChatIDStr
+
+if TYPE_CHECKING:
+    from .db import MsgLog
+
+MSG_LOG_CACHE_SIZE = 1000
+"""Number of message log entries to be kept in the cache."""
+
+SlaveMsgKey = Tuple[EFBChannelChatIDStr, MessageID]
+"""Slave chat ID and slave message ID of a message log entry."""
+
+
+class MsgLogCache:
+    """Thread-safe LRU cache of ``MsgLog`` rows.
+
+    Entries are kept by ``master_msg_id``, with a secondary index from
+    ``(slave_origin_uid, slave_message_id)``. Rows read from the database
+    are only cached if no entry was invalidated since the read started, so
+    that a concurrent write is never hidden by a stale row.
+    """
+
+    def __init__(self, size: int = MSG_LOG_CACHE_SIZE):
+        self.size = size
+        self.entries: 'OrderedDict[TgChatMsgIDStr, MsgLog]' = OrderedDict()
+        self.slave_index: Dict[SlaveMsgKey, TgChatMsgIDStr] = {}
+        self.lock = threading.Lock()
+        self.generation = 0
+        """Number of invalidations, used to detect concurrent writes."""
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, master_msg_id: Optional[TgChatMsgIDStr] = None,
+            slave_msg_id: Optional[MessageID] = None,
+            slave_origin_uid: Optional[EFBChannelChatIDStr] = None) -> Optional['MsgLog']:
+        with self.lock:
+            if not master_msg_id:
+                master_msg_id = self.slave_index.get((slave_origin_uid, slave_msg_id))
+            log = self.entries.get(master_msg_id) if master_msg_id else None
+            if log is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(master_msg_id)
+            self.hits += 1
+            return log
+
+    def put(self, log: 'MsgLog', generation: int):
+        """Cache a row read from the database.
+
+        Args:
+            log: The row
+            generation: Value of ``generation`` before the row is read.
+        """
+        if self.size <= 0:
+            return
+        with self.lock:
+            if generation != self.generation:
+                return
+            self._remove(log.master_msg_id)
+            self.entries[log.master_msg_id] = log
+            self.slave_index[(log.slave_origin_uid, log.slave_message_id)] = log.master_msg_id
+            while len(self.entries) > self.size:
+                _, evicted = self.entries.popitem(last=False)
+                self._unindex(evicted)
+
+    def invalidate(self, master_msg_id: Optional[TgChatMsgIDStr] = None,
+                   slave_msg_id: Optional[MessageID] = None,
+                   slave_origin_uid: Optional[EFBChannelChatIDStr] = None):
+        """Remove the entry of a message if cached."""
+        with self.lock:
+            self.generation += 1
+            if master_msg_id:
+                self._remove(master_msg_id)
+            if slave_msg_id and slave_origin_uid:
+                key = self.slave_index.get((slave_origin_uid, slave_msg_id))
+                if key:
+                    self._remove(key)
+
+    def clear(self):
+        with self.lock:
+            self.generation += 1
+            self.entries.clear()
+            self.slave_index.clear()
+
+    def _remove(self, master_msg_id: TgChatMsgIDStr):
+        log = self.entries.pop(master_msg_id, None)
+        if log is not None:
+            self._unindex(log)
+
+    def _unindex(self, log: 'MsgLog'):
+        key = (log.slave_origin_uid, log.slave_message_id)
+        if self.slave_index.get(key) == log.master_msg_id:
+            del self.slave_index[key]
+
+    def stats(self) -> Dict[str, Any]:
+        """Number of entries, hits and misses of the cache."""
+        with self.lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self.entries),
+                "capacity": self.size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
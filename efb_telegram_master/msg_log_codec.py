@@ -0,0 +1,373 @@
+# coding=utf-8
+
+"""Encoding of miscellaneous message data stored in the ``pickle`` column
+of the message log.
+
+Data is encoded as a magic byte, a schema version byte, and a sequence of
+fields, each led by a one-byte field ID and its length in bytes, so that
+fields not needed can be skipped without decoding. Values are written with
+a small tagged encoding of built-in types. Values of other types, like
+arbitrary arguments of message commands, fall back to ``pickle``.
+
+Rows written before this encoding was introduced are plain pickles, which
+are still understood by :func:`decode`.
+"""
+
+import pickle
+import struct
+from typing import Any, Dict, List, Tuple, Callable, Optional, Collection, TYPE_CHECKING
+
+from ehforwarderbot.message import LinkAttribute, LocationAttribute, StatusAttribute, MessageCommand, \
+    MessageCommands, MessageAttribute
+
+if TYPE_CHECKING:
+    from .db import PickledDict
+
+__all__ = ['encode', 'decode', 'is_encoded', 'DecodeError', 'MAGIC', 'VERSION']
+
+MAGIC = 0xE7
+"""First byte of encoded data. Pickles with protocol 2 or later always
+start with ``0x80``.
+"""
+VERSION = 1
+"""Current schema version."""
+
+# Field IDs
+_TARGET = 1
+_IS_SYSTEM = 2
+_ATTRIBUTES = 3
+_COMMANDS = 4
+_SUBSTITUTIONS = 5
+_REACTIONS = 6
+
+# Attribute types
+_LINK = 1
+_LOCATION = 2
+_STATUS = 3
+_OTHER_ATTRIBUTE = 0
+
+# Value tags
+_NONE = 0x00
+_FALSE = 0x01
+_TRUE = 0x02
+_INT = 0x03
+_FLOAT = 0x04
+_STR = 0x05
+_BYTES = 0x06
+_LIST = 0x07
+_TUPLE = 0x08
+_DICT = 0x09
+_PICKLE = 0x0F
+
+_double = struct.Struct("<d")
+
+
+class DecodeError(pickle.UnpicklingError):
+    """Raised when encoded data is malformed. This is a subclass of
+    :exc:`pickle.UnpicklingError` so that it is handled the same way as a
+    broken pickle.
+    """
+
+
+def is_encoded(data: bytes) -> bool:
+    """Check if data is in this encoding, rather than a legacy pickle."""
+    return len(data) >= 2 and data[0] == MAGIC
+
+
+def encode(data: 'PickledDict') -> bytes:
+    """Encode miscellaneous data of a message, per spec in
+    ``DatabaseManager.pickle_misc_msg()``.
+    """
+    out = bytearray((MAGIC, VERSION))
+    field = bytearray()
+    if 'target' in data:
+        _write_str(field, data['target'])
+        _write_field(out, _TARGET, field)
+    if 'is_system' in data:
+        field.append(_TRUE if data['is_system'] else _FALSE)
+        _write_field(out, _IS_SYSTEM, field)
+    if 'attributes' in data:
+        _write_attribute(field, data['attributes'])
+        _write_field(out, _ATTRIBUTES, field)
+    if 'commands' in data:
+        commands = data['commands']
+        _write_uint(field, len(commands))
+        for command in commands:
+            _write_str(field, command.name)
+            _write_str(field, command.callable_name)
+            _write_value(field, command.args)
+            _write_value(field, command.kwargs)
+        _write_field(out, _COMMANDS, field)
+    if 'substitutions' in data:
+        substitutions = data['substitutions']
+        _write_uint(field, len(substitutions))
+        for (start, end), chat_id in substitutions.items():
+            _write_uint(field, start)
+            _write_uint(field, end)
+            _write_str(field, chat_id)
+        _write_field(out, _SUBSTITUTIONS, field)
+    if 'reactions' in data:
+        reactions = data['reactions']
+        _write_uint(field, len(reactions))
+        for reaction, chat_ids in reactions.items():
+            _write_str(field, reaction)
+            _write_uint(field, len(chat_ids))
+            for chat_id in chat_ids:
+                _write_str(field, chat_id)
+        _write_field(out, _REACTIONS, field)
+    return bytes(out)
+
+
+def decode(data: bytes, fields: Optional[Collection[str]] = None) -> 'PickledDict':
+    """Decode miscellaneous data of a message, either in this encoding or
+    as a legacy pickle.
+
+    Args:
+        data: Encoded data
+        fields: Keys of fields to decode, other fields are skipped.
+            Decode all fields if not provided.
+
+    Raises:
+        pickle.UnpicklingError: If data is malformed.
+    """
+    if not is_encoded(data):
+        result = pickle.loads(data)
+        if fields is not None:
+            result = {k: v for k, v in result.items() if k in fields}
+        return result
+    if data[1] > VERSION:
+        raise DecodeError(f"Unsupported version {data[1]}")
+    try:
+        return _Reader(data).read_fields(fields)
+    except (IndexError, UnicodeDecodeError, struct.error, KeyError, ValueError) as e:
+        raise DecodeError(f"Malformed data: {e!r}") from e
+
+
+def _write_field(out: bytearray, field_id: int, field: bytearray):
+    """Write a field with its ID and length, and clear the field buffer."""
+    out.append(field_id)
+    _write_uint(out, len(field))
+    out += field
+    field.clear()
+
+
+def _write_uint(out: bytearray, value: int):
+    """Write an unsigned integer as a LEB128 varint."""
+    while value > 0x7F:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _write_str(out: bytearray, value: str):
+    encoded = value.encode()
+    _write_uint(out, len(encoded))
+    out += encoded
+
+
+def _write_value(out: bytearray, value: Any):
+    """Write a value of built-in type with a leading tag, or its pickle."""
+    if value is None:
+        out.append(_NONE)
+    elif value is True:
+        out.append(_TRUE)
+    elif value is False:
+        out.append(_FALSE)
+    elif type(value) is int:
+        out.append(_INT)
+        # Zigzag encoding for signed integers
+        _write_uint(out, value * 2 if value >= 0 else -value * 2 - 1)
+    elif type(value) is float:
+        out.append(_FLOAT)
+        out += _double.pack(value)
+    elif type(value) is str:
+        out.append(_STR)
+        _write_str(out, value)
+    elif type(value) is bytes:
+        out.append(_BYTES)
+        _write_uint(out, len(value))
+        out += value
+    elif type(value) in (list, tuple):
+        out.append(_LIST if type(value) is list else _TUPLE)
+        _write_uint(out, len(value))
+        for i in value:
+            _write_value(out, i)
+    elif type(value) is dict:
+        out.append(_DICT)
+        _write_uint(out, len(value))
+        for k, v in value.items():
+            _write_value(out, k)
+            _write_value(out, v)
+    else:
+        out.append(_PICKLE)
+        dumped = pickle.dumps(value)
+        _write_uint(out, len(dumped))
+        out += dumped
+
+
+def _write_attribute(out: bytearray, attribute: MessageAttribute):
+    if type(attribute) is LinkAttribute:
+        out.append(_LINK)
+        _write_value(out, attribute.title)
+        _write_value(out, attribute.description)
+        _write_value(out, attribute.image)
+        _write_value(out, attribute.url)
+    elif type(attribute) is LocationAttribute:
+        out.append(_LOCATION)
+        out += _double.pack(attribute.latitude)
+        out += _double.pack(attribute.longitude)
+    elif type(attribute) is StatusAttribute:
+        out.append(_STATUS)
+        _write_str(out, attribute.status_type.name)
+        _write_value(out, attribute.timeout)
+    else:
+        out.append(_OTHER_ATTRIBUTE)
+        _write_value(out, attribute)
+
+
+class _Reader:
+    """Decoder of a single encoded value, reading ``data`` from ``pos``."""
+
+    __slots__ = ('data', 'pos')
+
+    def __init__(self, data: bytes):
+        self.data = data
+        self.pos = 2
+
+    def read_fields(self, fields: Optional[Collection[str]] = None) -> 'PickledDict':
+        result: Dict[str, Any] = {}
+        data = self.data
+        end = len(data)
+        while self.pos < end:
+            field_id = data[self.pos]
+            self.pos += 1
+            length = self.read_uint()
+            field_end = self.pos + length
+            key, reader = _FIELD_READERS[field_id]
+            if fields is None or key in fields:
+                result[key] = reader(self)
+                if self.pos != field_end:
+                    raise ValueError(f"Length of field {key} mismatch")
+            self.pos = field_end
+        if self.pos != end:
+            raise IndexError("Length exceeds data")
+        return result  # type: ignore
+
+    def read_uint(self) -> int:
+        data = self.data
+        byte = data[self.pos]
+        self.pos += 1
+        if byte < 0x80:
+            return byte
+        result = byte & 0x7F
+        shift = 7
+        while True:
+            byte = data[self.pos]
+            self.pos += 1
+            result |= (byte & 0x7F) << shift
+            if byte < 0x80:
+                return result
+            shift += 7
+
+    def read_bytes(self) -> bytes:
+        length = self.read_uint()
+        start = self.pos
+        self.pos = end = start + length
+        if end > len(self.data):
+            raise IndexError("Length exceeds data")
+        return self.data[start:end]
+
+    def read_str(self) -> str:
+        data = self.data
+        pos = self.pos
+        length = data[pos]
+        if length < 0x80:
+            # Short string, overrun is caught by the length check of field.
+            self.pos = end = pos + 1 + length
+            return data[pos + 1:end].decode()
+        return self.read_bytes().decode()
+
+    def read_double(self) -> float:
+        value = _double.unpack_from(self.data, self.pos)[0]
+        self.pos += 8
+        return value
+
+    def read_value(self) -> Any:
+        tag = self.data[self.pos]
+        self.pos += 1
+        if tag == _STR:
+            return self.read_str()
+        elif tag == _NONE:
+            return None
+        elif tag == _TRUE:
+            return True
+        elif tag == _FALSE:
+            return False
+        elif tag == _INT:
+            value = self.read_uint()
+            return value >> 1 if not value & 1 else -((value + 1) >> 1)
+        elif tag == _FLOAT:
+            return self.read_double()
+        elif tag == _BYTES:
+            return self.read_bytes()
+        elif tag == _LIST or tag == _TUPLE:
+            items = [self.read_value() for _ in range(self.read_uint())]
+            return items if tag == _LIST else tuple(items)
+        elif tag == _DICT:
+            result = {}
+            for _ in range(self.read_uint()):
+                k = self.read_value()
+                result[k] = self.read_value()
+            return result
+        elif tag == _PICKLE:
+            return pickle.loads(self.read_bytes())
+        raise ValueError(f"Unknown value tag {tag}")
+
+    def read_attribute(self) -> MessageAttribute:
+        attribute_type = self.data[self.pos]
+        self.pos += 1
+        if attribute_type == _LINK:
+            return LinkAttribute(title=self.read_value(), description=self.read_value(),
+                                 image=self.read_value(), url=self.read_value())
+        elif attribute_type == _LOCATION:
+            return LocationAttribute(latitude=self.read_double(), longitude=self.read_double())
+        elif attribute_type == _STATUS:
+            return StatusAttribute(status_type=StatusAttribute.Types[self.read_str()],
+                                   timeout=self.read_value())
+        elif attribute_type == _OTHER_ATTRIBUTE:
+            return self.read_value()
+        raise ValueError(f"Unknown attribute type {attribute_type}")
+
+    def read_commands(self) -> MessageCommands:
+        commands: List[MessageCommand] = []
+        for _ in range(self.read_uint()):
+            commands.append(MessageCommand(name=self.read_str(), callable_name=self.read_str(),
+                                           args=self.read_value(), kwargs=self.read_value()))
+        return MessageCommands(commands)
+
+    def read_substitutions(self) -> Dict[Tuple[int, int], str]:
+        result = {}
+        read_uint = self.read_uint
+        for _ in range(read_uint()):
+            start = read_uint()
+            end = read_uint()
+            result[(start, end)] = self.read_str()
+        return result
+
+    def read_reactions(self) -> Dict[str, Tuple[str, ...]]:
+        result = {}
+        read_uint, read_str = self.read_uint, self.read_str
+        for _ in range(read_uint()):
+            reaction = read_str()
+            result[reaction] = tuple([read_str() for _ in range(read_uint())])
+        return result
+
+
+_FIELD_READERS: Dict[int, Tuple[str, Callable[[_Reader], Any]]] = {
+    _TARGET: ('target', _Reader.read_str),
+    _IS_SYSTEM: ('is_system', _Reader.read_value),
+    _ATTRIBUTES: ('attributes', _Reader.read_attribute),
+    _COMMANDS: ('commands', _Reader.read_commands),
+    _SUBSTITUTIONS: ('substitutions', _Reader.read_substitutions),
+    _REACTIONS: ('reactions', _Reader.read_reactions),
+}
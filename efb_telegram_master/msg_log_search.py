@@ -0,0 +1,46 @@
+# coding: utf-8
+"""
+Helpers to search message logs with the full-text index in
+``msglogindex``, which uses the ``trigram`` tokenizer of SQLite FTS5.
+"""
+
+from typing import Optional, List, Tuple
+
+MIN_TERM_LENGTH = 3
+"""Terms shorter than this cannot be looked up in a trigram index."""
+
+
+def parse_query(query: str) -> Tuple[Optional[str], List[str]]:
+    """Split a search query into an FTS5 match expression and short terms.
+
+    Terms are separated by whitespace, and a message has to contain all of
+    them. Terms of at least ``MIN_TERM_LENGTH`` characters are quoted into
+    the match expression, so that FTS5 syntax in the query is searched
+    literally. Shorter terms are returned separately to be matched as
+    substrings.
+
+    Returns:
+        Match expression, ``None`` if there is no long term; and short terms.
+    """
+    terms = list(dict.fromkeys(query.split()))
+    match = " ".join('"%s"' % i.replace('"', '""') for i in terms if len(i) >= MIN_TERM_LENGTH)
+    return match or None, [i for i in terms if len(i) < MIN_TERM_LENGTH]
+
+
+def excerpt(text: str, query: str, width: int = 80) -> str:
+    """Part of the text around the first term of the query found in it,
+    in one line and at most ``width`` characters long.
+    """
+    text = " ".join(text.split())
+    if len(text) <= width:
+        return text
+    lowered = text.lower()
+    positions = [lowered.find(i.lower()) for i in query.split()]
+    first = min((i for i in positions if i >= 0), default=0)
+    start = max(0, min(first - width // 4, len(text) - width))
+    result = text[start:start + width]
+    if start > 0:
+        result = "…" + result[1:]
+    if start + width < len(text):
+        result = result[:-1] + "…"
+    return result
@@ -245,8 +245,7 @@ class SlaveMessageProcessor(LocaleMixin):
 
         singly_linked = True
         if tg_chat:
-            slaves = self.db.get_chat_assoc(master_uid=tg_chat)
-            if slaves and len(slaves) > 1:
+            if self.db.get_singly_linked_slave(tg_chat) is None:
                 singly_linked = False
                 self.logger.debug("[%s] Sender is linked with other chats in a Telegram group.", xid)
         self.logger.debug("[%s] Message is in chat %s", xid, msg.chat)
@@ -869,19 +868,23 @@ class SlaveMessageProcessor(LocaleMixin):
         if isinstance(status, ChatUpdates):
             self.logger.debug("Received chat updates from channel %s", status.channel)
             for i in status.removed_chats:
-                self.db.delete_slave_chat_info(status.channel.channel_id, i)
                 self.chat_manager.delete_chat_object(status.channel.channel_id, i)
+            updated_chats = []
             for i in itertools.chain(status.new_chats, status.modified_chats):
                 chat = status.channel.get_chat(i)
-                self.chat_manager.update_chat_obj(chat, full_update=True)
+                updated_chats.append(self.chat_manager.update_chat_obj(chat, full_update=True, update_db=False))
+            self.db.set_slave_chat_info_bulk(updated_chats)
         elif isinstance(status, MemberUpdates):
             self.logger.debug("Received member updates from channel %s about group %s",
                               status.channel, status.chat_id)
-            for i in status.removed_members:
-                self.db.delete_slave_chat_info(status.channel.channel_id, i, status.chat_id)
+            self.db.delete_chat_members(status.channel.channel_id, status.chat_id, status.removed_members)
             self.chat_manager.delete_chat_members(status.channel.channel_id, status.chat_id, status.removed_members)
             chat = status.channel.get_chat(status.chat_id)
-            self.chat_manager.update_chat_obj(chat, full_update=True)
+            cached = self.chat_manager.update_chat_obj(chat, full_update=True, update_db=False)
+            # Only write entries of members changed
+            changed = set(status.new_members) | set(status.modified_members)
+            self.db.set_slave_chat_info_bulk([cached], members=False)
+            self.db.set_chat_members(cached, [i for i in cached.members if i.uid in changed])
         elif isinstance(status, MessageRemoval):
             self.logger.debug("Received message removal request from channel %s on message %s",
                               status.source_channel, status.message)
@@ -942,7 +945,7 @@ class SlaveMessageProcessor(LocaleMixin):
                                   'Message ID %s from %s, status: %s.', status.msg_id, status.chat, status.reactions)
             return
 
-        old_msg: ETMMsg = old_msg_db.build_etm_msg(chat_manager=self.chat_manager)
+        old_msg: ETMMsg = old_msg_db.build_etm_msg(chat_manager=self.chat_manager, db=self.db)
         old_msg.reactions = status.reactions
         old_msg.edit = True
 
@@ -0,0 +1,152 @@
+# coding: utf-8
+"""
+Interface of storage backends of ``DatabaseManager``.
+
+A backend stores chat associations, message logs, slave chat info and
+members of group chats. Pending writes, caches and the in-memory routing
+table are kept by ``DatabaseManager`` regardless of the backend.
+
+Rows are passed in as dicts keyed by column names of the peewee models in
+``db``, and returned as instances of these models, which may not be
+bound to a database.
+"""
+
+import datetime
+from abc import ABC, abstractmethod
+from typing import List, Optional, Tuple, Dict, Any, Collection, Iterable, TYPE_CHECKING
+
+from ehforwarderbot.types import ModuleID, ChatID, MessageID
+
+from .utils import EFBChannelChatIDStr, TgChatMsgIDStr, TelegramChatID
+
+if TYPE_CHECKING:
+    from .db import MsgLog, SlaveChatInfo, ChatMemberInfo
+
+__all__ = ['StorageBackend']
+
+
+class StorageBackend(ABC):
+    """Storage of the data of ``DatabaseManager``.
+
+    All methods may be called from multiple threads. Each write method
+    is atomic.
+    """
+
+    name: str = ""
+    """Name of the backend in ``database.backend`` of the channel config."""
+
+    @abstractmethod
+    def close(self):
+        """Release resources of the backend."""
+
+    # Chat associations
+
+    @abstractmethod
+    def get_chat_assocs(self) -> Iterable[Tuple[EFBChannelChatIDStr, EFBChannelChatIDStr]]:
+        """All chat associations as ``(master_uid, slave_uid)``, in the
+        order they are added.
+        """
+
+    @abstractmethod
+    def add_chat_assoc(self, master_uid: EFBChannelChatIDStr, slave_uid: EFBChannelChatIDStr,
+                       multiple_slave: bool = False):
+        """Link a slave chat to a Telegram chat, removing other links of
+        the slave chat, and other links of the Telegram chat unless
+        ``multiple_slave``.
+        """
+
+    @abstractmethod
+    def remove_chat_assoc(self, master_uid: Optional[EFBChannelChatIDStr] = None,
+                          slave_uid: Optional[EFBChannelChatIDStr] = None) -> int:
+        """Remove all links of either a Telegram chat or a slave chat.
+
+        Returns:
+            Number of links removed.
+        """
+
+    @abstractmethod
+    def migrate_chat_assoc(self, from_master_uid: EFBChannelChatIDStr, to_master_uid: EFBChannelChatIDStr) -> int:
+        """Move all links of a Telegram chat to another one.
+
+        Returns:
+            Number of links moved.
+        """
+
+    # Message log
+
+    @abstractmethod
+    def upsert_msg_logs(self, rows: List[Dict[str, Any]]):
+        """Insert or update message logs, and the last message time of
+        their slave chats.
+
+        ``time`` of existing message logs is kept, and so is ``pickle`` if
+        the new one is ``None``. The last message time of a chat never
+        moves back.
+        """
+
+    @abstractmethod
+    def get_msg_log(self, master_msg_id: Optional[TgChatMsgIDStr] = None,
+                    slave_msg_id: Optional[MessageID] = None,
+                    slave_origin_uid: Optional[EFBChannelChatIDStr] = None) -> Optional['MsgLog']:
+        """Get a message log by Telegram message ID, or the latest one by
+        slave message ID.
+        """
+
+    @abstractmethod
+    def delete_msg_log(self, master_msg_id: Optional[TgChatMsgIDStr] = None,
+                       slave_msg_id: Optional[MessageID] = None,
+                       slave_origin_uid: Optional[EFBChannelChatIDStr] = None):
+        """Delete message logs by Telegram message ID or slave message ID."""
+
+    @abstractmethod
+    def get_recent_slave_chats(self, master_chat_id: TelegramChatID, limit: int) -> List[EFBChannelChatIDStr]:
+        """Slave chats with messages logged in a Telegram chat, most
+        recent first.
+        """
+
+    @abstractmethod
+    def get_last_message(self, slave_origin_uid: EFBChannelChatIDStr) -> Optional['MsgLog']:
+        """Latest message log of a slave chat."""
+
+    @abstractmethod
+    def get_chat_activity(self) -> Dict[EFBChannelChatIDStr, datetime.datetime]:
+        """Last message time of all slave chats."""
+
+    # Slave chat info
+
+    @abstractmethod
+    def get_slave_chat_info(self, slave_channel_id: ModuleID, slave_chat_uid: ChatID,
+                            slave_chat_group_id: Optional[ChatID] = None) -> Optional['SlaveChatInfo']:
+        """Get slave chat info of a chat."""
+
+    @abstractmethod
+    def set_slave_chat_info(self, rows: Collection[Dict[str, Any]], members: Collection[Dict[str, Any]] = ()):
+        """Insert or update slave chat info of chats, and entries of
+        members of group chats, per ``set_chat_members``.
+        """
+
+    @abstractmethod
+    def delete_slave_chat_info(self, slave_channel_id: ModuleID, slave_chat_uid: ChatID,
+                               slave_chat_group_id: Optional[ChatID] = None) -> int:
+        """Delete slave chat info of a chat.
+
+        Returns:
+            Number of entries deleted.
+        """
+
+    @abstractmethod
+    def set_chat_members(self, rows: Collection[Dict[str, Any]]):
+        """Insert or update entries of members of group chats."""
+
+    @abstractmethod
+    def get_chat_members(self, module_id: ModuleID, group_id: ChatID) -> List['ChatMemberInfo']:
+        """Entries of all members of a group chat, in the order they are
+        added.
+        """
+
+    @abstractmethod
+    def delete_chat_members(self, module_id: ModuleID, group_id: ChatID,
+                            member_uids: Optional[Collection[ChatID]] = None):
+        """Delete entries of members of a group chat, all of them if
+        ``member_uids`` is not provided.
+        """
@@ -56,6 +56,12 @@ class ExperimentalFlagsManager(LocaleMixin):
         "animated_stickers": False,
         "send_to_last_chat": "warn",
         "default_media_prompt": "emoji",
+        "slave_chats_timeout": 30,
+        "warm_start": False,
+        "chat_cache_max_weight": 0,
+        "conversation_ttl": 86400,
+        "conversation_store_size": 1000,
+        "persist_conversations": False,
     }
 
     def __init__(self, channel: 'TelegramChannel'):
@@ -114,6 +120,20 @@ def message_id_str_to_id(s: TgChatMsgIDStr) -> Tuple[TelegramChatID, TelegramMes
     return TelegramChatID(msg_ids[0]), TelegramMessageID(msg_ids[1])
 
 
+def message_link(chat_id: TelegramChatID, message_id: TelegramMessageID) -> Optional[str]:
+    """
+    Link to a Telegram message, only available for messages in supergroups
+    and channels.
+
+    Returns:
+        URL of the message, None if not available
+    """
+    chat_id = TelegramChatID(str(chat_id))
+    if not chat_id.startswith("-100"):
+        return None
+    return f"https://t.me/c/{chat_id[4:]}/{message_id}"
+
+
 def chat_id_to_str(channel_id: Optional[ModuleID] = None, chat_uid: Optional[ChatID] = None,
                    group_id: Optional[ChatID] = None,
                    chat: Optional[BaseChat] = None, channel: Optional[Channel] = None) -> EFBChannelChatIDStr:
@@ -314,6 +314,7 @@ def setup_telegram_bot_commands_list(data):
                 ("update_info", _("Update info of linked Telegram group.")),
                 ("react", _("Send a reaction to a message, or show a list of reactors.")),
                 ("rm", _("Remove a message from its remote chat.")),
+                ("search", _("Search for recorded messages.")),
             ]
         )
 
@@ -482,6 +483,40 @@ flags_settings = {
            '- emoji: Use emoji like 🖼️, 🎥, and 📄.\n'
            '- text: Use text like “Sent a picture/video/file”.\n'
            '- disabled: Use empty placeholders.')
+         ),
+    "slave_chats_timeout":
+        (30, 'int', None,
+         _('Seconds to wait for slave channels to list their chats on start. '
+           'Chats from slave channels responded later are loaded in the '
+           'background.')
+         ),
+    "warm_start":
+        (False, 'bool', None,
+         _('Load chats from a snapshot saved on the last run on start, and '
+           'check them against slave channels in the background.')
+         ),
+    "chat_cache_max_weight":
+        (0, 'int', None,
+         _('Maximum number of chats and their members kept in memory. '
+           'Least recently used chats are evicted when exceeded, except '
+           'linked chats and chats active in the last 24 hours. 0 for no '
+           'limit.')
+         ),
+    "conversation_ttl":
+        (86400, 'int', None,
+         _('Seconds to keep chat lists, recipient suggestions and command '
+           'messages available after they are last used.')
+         ),
+    "conversation_store_size":
+        (1000, 'int', None,
+         _('Maximum number of chat lists, recipient suggestions and command '
+           'messages kept available. Least recently used ones are removed '
+           'when exceeded.')
+         ),
+    "persist_conversations":
+        (False, 'bool', None,
+         _('Save chat lists, recipient suggestions and command messages when '
+           'ETM stops, so that their buttons keep working after a restart.')
          )
 }
 
@@ -68,6 +68,12 @@ setup(
             "lottie",
             "cairosvg",  # required by ``lottie`` to export GIF
         ],
+        "zstd": [
+            "zstandard",
+        ],
+        "lmdb": [
+            "lmdb",
+        ],
     },
     entry_points={
         "ehforwarderbot.master": "blueset.telegram = efb_telegram_master:TelegramChannel",
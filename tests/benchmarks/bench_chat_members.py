@@ -0,0 +1,78 @@
+"""Memory used by members of group chats.
+
+Builds copies of the groups generated by the mock slave channel, each
+filled with members per its membership template, and measures memory
+allocated by the members of the slave channel, by their ETM versions from
+``convert_chat``, and by ETM members restored from their pickles as when
+loaded from the database.
+
+Usage::
+
+    python -m tests.benchmarks.bench_chat_members --groups 200 --members 1000
+"""
+
+import argparse
+import gc
+import tracemalloc
+from typing import List, Callable, Any
+
+from ehforwarderbot.chat import GroupChat
+from ehforwarderbot.types import ChatID
+
+from efb_telegram_master.chat import convert_chat, unpickle_member, ETMGroupChat
+from tests.mocks.slave import MockSlaveChannel
+
+
+def build_groups(slave: MockSlaveChannel, groups: int, members: int) -> List[GroupChat]:
+    """Copies of the groups of the mock slave with ``members`` members each."""
+    templates = slave.chats_by_chat_type['GroupChat']
+    result = []
+    for i in range(groups):
+        template = templates[i % len(templates)]
+        group = GroupChat(channel=slave, name=template.name, alias=template.alias,
+                          uid=ChatID(f"{template.uid}_{i}"), notification=template.notification)
+        for j in range(members):
+            member = template.members[j % len(template.members)]
+            group.add_member(name=member.name, alias=member.alias, uid=ChatID(f"{member.uid}_{j}"),
+                             description=member.description)
+        result.append(group)
+    return result
+
+
+def measure(name: str, build: Callable[[], Any], count: int) -> Any:
+    gc.collect()
+    tracemalloc.start()
+    result = build()
+    gc.collect()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{name:<24} {size / 2 ** 20:>10.2f} MiB {size / count:>10.1f} B/member")
+    return result
+
+
+def restore(groups: List[ETMGroupChat], pickles: List[List[bytes]]) -> List[ETMGroupChat]:
+    for group, members in zip(groups, pickles):
+        group.members = [unpickle_member(i, group, None) for i in members]
+    return groups
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--groups", type=int, default=200, help="Number of groups")
+    parser.add_argument("--members", type=int, default=1000, help="Number of members per group")
+    args = parser.parse_args()
+
+    slave = MockSlaveChannel()
+    count = args.groups * args.members
+    print(f"{args.groups} groups of {args.members} members.")
+    groups = measure("Slave members", lambda: build_groups(slave, args.groups, args.members), count)
+    etm_groups = measure("ETM members", lambda: [convert_chat(None, i) for i in groups], count)
+
+    pickles = [[i.pickle for i in group.members] for group in etm_groups]
+    empty = [ETMGroupChat(None, channel=slave, uid=i.uid, name=i.name, with_self=False) for i in etm_groups]
+    del groups, etm_groups
+    measure("ETM members from pickle", lambda: restore(empty, pickles), count)
+
+
+if __name__ == "__main__":
+    main()
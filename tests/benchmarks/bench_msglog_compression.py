@@ -0,0 +1,136 @@
+"""Size and read throughput of the message log before and after column
+compression.
+
+Populates a temporary ``tgdata.db`` with a synthetic message log, measures
+its size and the throughput of reading message text, then enables
+compression as configured with ``database.compression``, which trains a
+dictionary and compresses existing rows online, and measures again.
+
+Usage::
+
+    python -m tests.benchmarks.bench_msglog_compression --rows 200000 --algorithm zstd
+"""
+
+import argparse
+import datetime
+import itertools
+import os
+import random
+import tempfile
+import time
+import types
+from typing import Dict, Any
+
+from ehforwarderbot.message import LinkAttribute
+
+from efb_telegram_master import msg_log_codec
+from efb_telegram_master.db import database, DatabaseManager, MsgLog
+
+VOCABULARY = "the of and to in is that for it on with as was at by this from".split() + \
+    [f"w{i}" for i in range(5000)]
+CUM_WEIGHTS = list(itertools.accumulate(1 / (i + 1) for i in range(len(VOCABULARY))))
+"""Zipf-like distribution of words."""
+
+
+def make_text(rng: random.Random) -> str:
+    """Text of a message, mostly short, with some long forwarded articles."""
+    length = int(rng.paretovariate(1.2) * 6)
+    words = rng.choices(VOCABULARY, cum_weights=CUM_WEIGHTS, k=min(length, 2000))
+    text = " ".join(words)
+    if rng.random() < .1:
+        text += f"\nhttps://example.com/articles/{rng.randrange(100000)}?utm_source=telegram"
+    return text
+
+
+def make_db(config: Dict[str, Any]) -> DatabaseManager:
+    channel = types.SimpleNamespace(channel_id="blueset.telegram", config={"database": config})
+    return DatabaseManager(channel)  # type: ignore
+
+
+def populate(rows: int, batch: int = 10000):
+    rng = random.Random(0)
+    start = datetime.datetime(2019, 1, 1)
+    conn = database.connection()
+    for offset in range(0, rows, batch):
+        entries = []
+        for i in range(offset, min(offset + batch, rows)):
+            text = make_text(rng)
+            misc = None
+            if rng.random() < .3:
+                misc = msg_log_codec.encode({"attributes": LinkAttribute(
+                    title=text[:60], description=text[:300], url=f"https://example.com/articles/{i}")})
+            entries.append((
+                f"-100{i % 20}.{i}", f"msg_{i}", text, f"tests.mocks.slave __chat_{i % 2000}__",
+                f"tests.mocks.slave __member_{i % 50}__ __chat_{i % 2000}__", "text", "Text",
+                "tests.mocks.slave", misc, (start + datetime.timedelta(seconds=i)).isoformat(" "),
+            ))
+        conn.executemany(
+            "INSERT INTO msglog (master_msg_id, slave_message_id, text, slave_origin_uid, slave_member_uid, "
+            "media_type, msg_type, sent_to, pickle, time) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", entries)
+        conn.commit()
+
+
+def measure(rows: int, repeat: int) -> Dict[str, float]:
+    report = DatabaseManager.get_compression_report()
+    database.execute_sql("VACUUM")
+    report["database_bytes"] = DatabaseManager.get_compression_report()["database_bytes"]
+
+    start = time.perf_counter()
+    scanned = 0
+    for row in MsgLog.select(MsgLog.master_msg_id, MsgLog.text, MsgLog.pickle):
+        scanned += len(row.text)
+        if row.pickle:
+            msg_log_codec.decode(row.pickle)
+    report["scan_rows_per_s"] = rows / (time.perf_counter() - start)
+
+    rng = random.Random(1)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        i = rng.randrange(rows)
+        row = MsgLog.get_by_id(f"-100{i % 20}.{i}")
+        assert row.text is not None
+    report["lookup_us"] = (time.perf_counter() - start) / repeat * 1e6
+
+    for key in ("rows", "compressed_text", "compressed_pickle", "text_bytes", "pickle_bytes",
+                "database_bytes", "scan_rows_per_s", "lookup_us"):
+        print(f"  {key:<20} {report[key]:14,.0f}")
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=200000, help="Number of message log entries.")
+    parser.add_argument("--algorithm", default="zlib", choices=("zlib", "zstd"), help="Compression algorithm.")
+    parser.add_argument("--level", type=int, default=None, help="Compression level.")
+    parser.add_argument("--repeat", type=int, default=10000, help="Number of lookups by message ID.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["EFB_DATA_PATH"] = tmp
+        db = make_db({"write_behind_interval_ms": 0})
+        db.stop_worker()
+
+        print(f"Populating {args.rows} rows...")
+        populate(args.rows)
+
+        print("Without compression:")
+        before = measure(args.rows, args.repeat)
+
+        start = time.perf_counter()
+        db = make_db({"compression": {"algorithm": args.algorithm, "level": args.level}})
+        db.task_queue.join()
+        db.stop_worker()
+        print(f"Dictionary trained and rows compressed in {time.perf_counter() - start:.1f} s "
+              f"({db.compression_stats['rows'] / db.compression_stats['seconds']:,.0f} rows/s)")
+
+        print(f"With {args.algorithm} compression:")
+        after = measure(args.rows, args.repeat)
+
+        print("Ratio (after / before):")
+        for key in ("text_bytes", "pickle_bytes", "database_bytes", "scan_rows_per_s", "lookup_us"):
+            print(f"  {key:<20} {after[key] / before[key] if before[key] else float('nan'):14.2f}")
+        database.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+"""Latency of message log lookups before and after migrations 4 and 5.
+
+Populates a temporary ``tgdata.db`` with a synthetic message log, times
+the lookups on the delivery path against the schema without indexes,
+then runs the migrations and times the same lookups again.
+
+Usage::
+
+    python -m tests.benchmarks.bench_msglog_index --rows 3000000
+"""
+
+import argparse
+import datetime
+import random
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, List
+
+from peewee import fn
+
+from efb_telegram_master.db import database, DatabaseManager, MsgLog, ChatAssoc, SlaveChatInfo
+
+INDEXES_SINCE_MIGRATION_4 = (
+    "msglog_slave_origin_uid_slave_message_id_time",
+    "msglog_slave_origin_uid_time",
+    "msglog_master_msg_id_alt",
+    "msglog_master_chat_id_slave_origin_uid_time",
+    "chatassoc_master_uid",
+    "chatassoc_slave_uid",
+)
+COLUMNS_SINCE_MIGRATION_4 = (
+    ("msglog", "master_chat_id"),
+)
+
+
+def populate(rows: int, chats: int, batch: int = 50000):
+    """Insert ``rows`` synthetic message log entries spread over ``chats``
+    slave chats and 20 Telegram chats."""
+    conn = database.connection()
+    # Bulk load only, durability is irrelevant here.
+    conn.execute("PRAGMA synchronous = OFF")
+    conn.execute("PRAGMA journal_mode = OFF")
+    start = datetime.datetime(2019, 1, 1)
+    for offset in range(0, rows, batch):
+        entries = []
+        for i in range(offset, min(offset + batch, rows)):
+            chat = i % chats
+            entries.append((
+                f"-100{i % 20}.{i}", f"msg_{i}", f"Message text #{i}",
+                f"tests.mocks.slave __chat_{chat}__", f"tests.mocks.slave __member_{i % 50}__ __chat_{chat}__",
+                "text", "Text", "tests.mocks.slave",
+                (start + datetime.timedelta(seconds=i)).isoformat(" "),
+            ))
+        conn.executemany(
+            "INSERT INTO msglog (master_msg_id, slave_message_id, text, slave_origin_uid, slave_member_uid, "
+            "media_type, msg_type, sent_to, time) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", entries)
+        conn.commit()
+    conn.executemany("INSERT INTO chatassoc (master_uid, slave_uid) VALUES (?, ?)",
+                     [(f"blueset.telegram -100{i % 20}", f"tests.mocks.slave __chat_{i}__") for i in range(chats)])
+    conn.commit()
+
+
+LOOKUPS = ("get_msg_log(slave_msg_id)", "get_last_message", "master_msg_id_alt lookup",
+           "get_chat_assoc(slave_uid)", "get_recent_slave_chats")
+
+
+def measure(name: str, fn: Callable[[], object], repeat: int) -> float:
+    timings: List[float] = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+    median = timings[len(timings) // 2] * 1000
+    print(f"  {name:<28} median {median:10.3f} ms  (p90 {timings[int(len(timings) * .9)] * 1000:10.3f} ms)")
+    return median
+
+
+def run_lookups(rows: int, chats: int, repeat: int, migrated: bool) -> List[float]:
+    # Columns that exist in the schema being measured
+    fields = [f for f in MsgLog._meta.sorted_fields
+              if migrated or ("msglog", f.column_name) not in COLUMNS_SINCE_MIGRATION_4]
+
+    def by_slave_id():
+        i = random.randrange(rows)
+        return MsgLog.select(*fields).where((MsgLog.slave_message_id == f"msg_{i}") &
+                                     (MsgLog.slave_origin_uid == f"tests.mocks.slave __chat_{i % chats}__")
+                                     ).order_by(MsgLog.time.desc()).first()
+
+    def last_message():
+        chat = random.randrange(chats)
+        return MsgLog.select(*fields).where(
+            MsgLog.slave_origin_uid == f"tests.mocks.slave __chat_{chat}__"
+        ).order_by(MsgLog.time.desc()).limit(1).first()
+
+    def by_alt_id():
+        return MsgLog.select(*fields).where(
+            MsgLog.master_msg_id_alt == f"-1000.{random.randrange(rows)}"
+        ).first()
+
+    def chat_assoc():
+        chat = random.randrange(chats)
+        return list(ChatAssoc.select().where(ChatAssoc.slave_uid == f"tests.mocks.slave __chat_{chat}__"))
+
+    def recent_slave_chats():
+        master_chat_id = f"-100{random.randrange(20)}"
+        if migrated:
+            condition = MsgLog.master_chat_id == int(master_chat_id)
+        else:
+            condition = MsgLog.master_msg_id.startswith(f"{master_chat_id}.")
+        return list(MsgLog.select(MsgLog.slave_origin_uid, fn.MAX(MsgLog.time))
+                    .where(condition)
+                    .group_by(MsgLog.slave_origin_uid)
+                    .order_by(fn.MAX(MsgLog.time).desc())
+                    .limit(5))
+
+    return [
+        measure(LOOKUPS[0], by_slave_id, repeat),
+        measure(LOOKUPS[1], last_message, repeat),
+        measure(LOOKUPS[2], by_alt_id, repeat),
+        measure(LOOKUPS[3], chat_assoc, repeat),
+        measure(LOOKUPS[4], recent_slave_chats, repeat),
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=2000000, help="Number of message log entries.")
+    parser.add_argument("--chats", type=int, default=2000, help="Number of slave chats.")
+    parser.add_argument("--repeat", type=int, default=20, help="Number of lookups per query.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database.init(str(Path(tmp) / "tgdata.db"))
+        database.connect()
+        database.create_tables([ChatAssoc, MsgLog, SlaveChatInfo])
+        for index in INDEXES_SINCE_MIGRATION_4:
+            database.execute_sql(f'DROP INDEX IF EXISTS "{index}"')
+        for table, column in COLUMNS_SINCE_MIGRATION_4:
+            database.execute_sql(f'ALTER TABLE "{table}" DROP COLUMN "{column}"')
+
+        print(f"Populating {args.rows} rows over {args.chats} chats...")
+        start = time.perf_counter()
+        populate(args.rows, args.chats)
+        print(f"  done in {time.perf_counter() - start:.1f} s")
+
+        print("Without indexes:")
+        before = run_lookups(args.rows, args.chats, args.repeat, migrated=False)
+
+        start = time.perf_counter()
+        DatabaseManager._migrate(4)
+        print(f"Migrations finished in {time.perf_counter() - start:.1f} s")
+
+        print("With indexes:")
+        after = run_lookups(args.rows, args.chats, args.repeat, migrated=True)
+        print("Speedup:")
+        for name, b, a in zip(LOOKUPS, before, after):
+            print(f"  {name:<28} {b / a if a else float('inf'):10.1f}x")
+        database.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""Write throughput and lookup latency of storage backends.
+
+Writes a synthetic message log to each backend in batches, as committed by
+the write-behind queue of ``DatabaseManager``, then times the lookups on
+the delivery path. Backends whose packages are not installed are skipped.
+
+Usage::
+
+    python -m tests.benchmarks.bench_storage --rows 500000 --batch 100
+"""
+
+import argparse
+import datetime
+import random
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, List, Dict, Any
+
+from efb_telegram_master.db import DatabaseManager, SQLiteStorage
+from efb_telegram_master.storage import StorageBackend
+
+
+def make_sqlite(path: Path) -> StorageBackend:
+    storage = SQLiteStorage(path / "tgdata.db", DatabaseManager.DEFAULT_PRAGMAS)
+    DatabaseManager._create()
+    return storage
+
+
+def make_lmdb(path: Path) -> StorageBackend:
+    from efb_telegram_master.lmdb_storage import LMDBStorage
+    return LMDBStorage(path / "tgdata.lmdb", {})
+
+
+BACKENDS: Dict[str, Callable[[Path], StorageBackend]] = {
+    "sqlite": make_sqlite,
+    "lmdb": make_lmdb,
+}
+
+
+def make_row(i: int, chats: int, start: datetime.datetime) -> Dict[str, Any]:
+    chat = i % chats
+    return {
+        "master_msg_id": f"-100{i % 20}.{i}",
+        "master_msg_id_alt": None,
+        "master_chat_id": int(f"-100{i % 20}"),
+        "text": f"Message text #{i}",
+        "slave_origin_uid": f"tests.mocks.slave __chat_{chat}__",
+        "slave_member_uid": f"tests.mocks.slave __member_{i % 50}__ __chat_{chat}__",
+        "msg_type": "Text",
+        "sent_to": "tests.mocks.slave",
+        "slave_message_id": f"msg_{i}",
+        "media_type": "Text",
+        "file_id": None,
+        "file_unique_id": None,
+        "mime": None,
+        "pickle": None,
+        "time": start + datetime.timedelta(seconds=i),
+    }
+
+
+def measure(name: str, fn: Callable[[], object], repeat: int):
+    timings: List[float] = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+    median = timings[len(timings) // 2] * 1000
+    print(f"  {name:<28} median {median:10.3f} ms  (p90 {timings[int(len(timings) * .9)] * 1000:10.3f} ms)")
+
+
+def run(storage: StorageBackend, rows: int, chats: int, batch: int, repeat: int):
+    start = datetime.datetime(2019, 1, 1)
+    begin = time.perf_counter()
+    for offset in range(0, rows, batch):
+        storage.upsert_msg_logs([make_row(i, chats, start) for i in range(offset, min(offset + batch, rows))])
+    elapsed = time.perf_counter() - begin
+    print(f"  {'upsert_msg_logs':<28} {rows / elapsed:10.0f} rows/s  ({elapsed:.1f} s)")
+
+    def by_master_id():
+        i = random.randrange(rows)
+        return storage.get_msg_log(master_msg_id=f"-100{i % 20}.{i}")
+
+    def by_slave_id():
+        i = random.randrange(rows)
+        return storage.get_msg_log(slave_msg_id=f"msg_{i}", slave_origin_uid=f"tests.mocks.slave __chat_{i % chats}__")
+
+    def last_message():
+        return storage.get_last_message(f"tests.mocks.slave __chat_{random.randrange(chats)}__")
+
+    def recent_slave_chats():
+        return storage.get_recent_slave_chats(int(f"-100{random.randrange(20)}"), 5)
+
+    measure("get_msg_log(master_msg_id)", by_master_id, repeat)
+    measure("get_msg_log(slave_msg_id)", by_slave_id, repeat)
+    measure("get_last_message", last_message, repeat)
+    measure("get_recent_slave_chats", recent_slave_chats, repeat)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=200000, help="Number of message log entries.")
+    parser.add_argument("--chats", type=int, default=2000, help="Number of slave chats.")
+    parser.add_argument("--batch", type=int, default=DatabaseManager.DEFAULT_WRITE_BEHIND_BATCH_SIZE,
+                        help="Number of message logs per commit.")
+    parser.add_argument("--repeat", type=int, default=200, help="Number of lookups per query.")
+    parser.add_argument("--backend", choices=list(BACKENDS), action="append",
+                        help="Backends to measure, all by default.")
+    args = parser.parse_args()
+
+    for name in args.backend or BACKENDS:
+        with tempfile.TemporaryDirectory() as tmp:
+            try:
+                storage = BACKENDS[name](Path(tmp))
+            except ImportError as e:
+                print(f"{name}: skipped, {e}")
+                continue
+            print(f"{name}:")
+            run(storage, args.rows, args.chats, args.batch, args.repeat)
+            storage.close()
+
+
+if __name__ == "__main__":
+    main()
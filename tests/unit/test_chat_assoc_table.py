@@ -0,0 +1,43 @@
+from pytest import fixture
+
+from efb_telegram_master.chat_assoc_table import ChatAssocTable
+
+
+@fixture(scope="function")
+def table():
+    table = ChatAssocTable()
+    table.load([("tg 1", "slave a"), ("tg 1", "slave b"), ("tg 2", "slave c")])
+    return table
+
+
+def test_chat_assoc_table_lookup(table):
+    assert table.get_slaves("tg 1") == ["slave a", "slave b"]
+    assert table.get_masters("slave c") == ["tg 2"]
+    assert table.get_masters("slave d") == []
+    assert table.get_singly_linked_slave("tg 1") is None
+    assert table.get_singly_linked_slave("tg 2") == "slave c"
+    assert table.get_singly_linked_slave("tg 3") is None
+
+
+def test_chat_assoc_table_link(table):
+    table.link("tg 2", "slave a", multiple_slave=True)
+    assert table.get_slaves("tg 1") == ["slave b"], "slave chat should be moved from its previous link"
+    assert table.get_slaves("tg 2") == ["slave c", "slave a"]
+
+    table.link("tg 2", "slave d")
+    assert table.get_slaves("tg 2") == ["slave d"]
+    assert table.get_masters("slave c") == []
+
+
+def test_chat_assoc_table_unlink_and_migrate(table):
+    table.unlink(slave_uid="slave b")
+    assert table.get_singly_linked_slave("tg 1") == "slave a"
+
+    table.migrate("tg 1", "tg 3")
+    assert table.get_slaves("tg 1") == []
+    assert table.get_slaves("tg 3") == ["slave a"]
+    assert table.get_masters("slave a") == ["tg 3"]
+
+    table.unlink(master_uid="tg 3")
+    assert table.get_masters("slave a") == []
+    assert "tg 3" not in table.slaves
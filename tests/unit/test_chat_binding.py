@@ -30,6 +30,37 @@ def test_source_chat_pagination(channel, slave):
     assert len(buttons) == 2
 
 
+def test_paged_chat_pagination(channel, slave):
+    storage_id = (TelegramChatID(0), TelegramMessageID(4))
+    chat_binding = channel.chat_binding
+    chats_per_page = channel.flag("chats_per_page")
+    pages = []
+    offset = 0
+    while True:
+        _, buttons = chat_binding.slave_chats_pagination(storage_id, offset)
+        chat_list = chat_binding.msg_storage[storage_id]
+        assert chat_list.cursor.keys is channel.chat_manager.all_keys, "Keys of all chats should be shared"
+        assert len(chat_list.chats) == len(buttons) - 1 <= chats_per_page
+        assert [i[0].callback_data for i in buttons[:-1]] == [f"chat {i}" for i in range(len(chat_list.chats))]
+        pages.append(chat_list.chats)
+        offset += chats_per_page
+        if f"offset {offset}" not in (i.callback_data for i in buttons[-1]):
+            break
+
+    chats = [i for page in pages for i in page]
+    keys = [channel.chat_manager.get_cache_key(i) for i in chats]
+    assert len(pages) > 1
+    assert len(set(keys)) == len(keys), "Chats should not be repeated across pages"
+    assert set(keys) == {channel.chat_manager.get_cache_key(i) for i in channel.chat_manager.all_chats}
+    times = [i.last_message_time for i in chats]
+    assert times == sorted(times, reverse=True)
+
+    # Go back to the first page
+    chat_binding.slave_chats_pagination(storage_id, 0)
+    assert chat_binding.msg_storage[storage_id].chats == pages[0]
+    chat_binding.msg_storage.pop(storage_id, None)
+
+
 def test_truncate_ellipsis(channel):
     truncate_ellipsis = channel.chat_binding.truncate_ellipsis
     short_text = "short text"
@@ -1,3 +1,6 @@
+import re
+import time
+from threading import Event
 from unittest.mock import patch
 
 from pytest import fixture
@@ -59,9 +62,153 @@ def test_chat_manager_delete_chat_object(chat_manager, slave):
     assert chat_manager.get_chat(chat.module_id, chat.uid) is None
 
 
+def test_chat_manager_delete_chat_object_pending(chat_manager, slave):
+    chat = chat_manager.compound_enrol(PrivateChat(channel=slave, uid="__deleted_chat_id__", name="Deleted"))
+    chat_manager.db.set_slave_chat_info_bulk([chat])
+    event = Event()
+    # Hold the database worker, so that the row is deleted later
+    chat_manager.db.add_task(event.wait, (), {})
+    try:
+        chat_manager.delete_chat_object(chat.module_id, chat.uid)
+        assert chat_manager.db.get_slave_chat_info(chat.module_id, chat.uid) is not None
+        assert chat_manager.get_chat(chat.module_id, chat.uid) is None
+    finally:
+        event.set()
+    chat_manager.db.task_queue.join()
+    assert chat_manager.db.get_slave_chat_info(chat.module_id, chat.uid) is None
+    assert not chat_manager.deleted
+
+
 def test_chat_manager_all_chats(channel, slave):
     """The chat object cache manager in channel should be initialized with
     only the chats in the slave channel.
     """
     chat_manager = channel.chat_manager
     assert len(tuple(chat_manager.all_chats)) == len(slave.get_chats())
+
+
+def test_chat_manager_load_slave_chats_timeout(channel, slave):
+    """Chats of slow slave channels should be enrolled in the background."""
+    event = Event()
+    chats = slave.get_chats()
+
+    def get_chats():
+        event.wait()
+        return chats
+
+    with patch.dict('ehforwarderbot.coordinator.slaves', {}, clear=True):
+        chat_manager = ChatObjectCacheManager(channel)
+    with patch.object(slave, "get_chats", get_chats), \
+            patch.dict('ehforwarderbot.coordinator.slaves', {slave.channel_id: slave}, clear=True):
+        chat_manager.load_slave_chats(0.1)
+        assert not tuple(chat_manager.all_chats)
+        event.set()
+        for _ in range(100):
+            if len(tuple(chat_manager.all_chats)) == len(chats):
+                break
+            time.sleep(0.05)
+    assert len(tuple(chat_manager.all_chats)) == len(chats)
+
+
+def test_chat_manager_snapshot(chat_manager, slave, tmp_path):
+    chat_manager.snapshot_path = tmp_path / "chat_cache.pickle"
+    kept = chat_manager.compound_enrol(slave.chat_with_alias)
+    removed = chat_manager.compound_enrol(slave.group)
+    chat_manager.save_snapshot()
+
+    with patch.dict('ehforwarderbot.coordinator.slaves', {}, clear=True):
+        restored = ChatObjectCacheManager(chat_manager.channel)
+    restored.snapshot_path = chat_manager.snapshot_path
+    assert restored.load_snapshot()
+    assert restored.stale == {restored.get_cache_key(kept), restored.get_cache_key(removed)}
+    group = restored.get_chat(removed.module_id, removed.uid)
+    assert len(group.members) == len(removed.members)
+    assert group.members[0].chat is group
+
+    # Chats from snapshot are checked against the slave channel
+    restored.db.set_slave_chat_info_bulk([removed])
+    alias = "Updated alias"
+    slave.chat_with_alias.alias, original_alias = alias, slave.chat_with_alias.alias
+    try:
+        with patch.object(slave, "get_chats", lambda: [slave.chat_with_alias]):
+            restored.load_chats_from(slave.channel_id, slave)
+    finally:
+        slave.chat_with_alias.alias = original_alias
+    assert not restored.stale
+    assert restored.get_chat(kept.module_id, kept.uid).alias == alias
+    assert restored.get_cache_key(removed) not in restored.cache
+    restored.db.task_queue.join()
+    assert restored.db.get_slave_chat_info(removed.module_id, removed.uid) is None
+
+
+def test_chat_manager_evict(chat_manager, slave):
+    chats = [chat_manager.compound_enrol(i) for i in slave.get_chats()]
+    chat_manager.db.add_task(chat_manager.db.set_slave_chat_info_bulk, (chats,), {})
+    pinned = chats[0]
+    pinned.link("__channel_id__", "__chat_id__", False)
+    try:
+        chat_manager.max_weight = chat_manager.get_weight(pinned) + 1
+        chat_manager.evict()
+        assert chat_manager.get_cache_key(pinned) in chat_manager.cache
+        assert chat_manager.evicted
+        assert len(tuple(chat_manager.all_chats)) == len(chats)
+
+        # Evicted chats are reloaded from the database on demand
+        chat_manager.db.task_queue.join()
+        key = next(iter(chat_manager.evicted))
+        reloaded = chat_manager.get_chat(*key)
+        assert chat_manager.get_cache_key(reloaded) == key
+        assert key in chat_manager.cache
+        assert key not in chat_manager.evicted
+    finally:
+        pinned.unlink()
+
+
+def test_chat_manager_slave_miss(chat_manager, slave):
+    chat_id = "__unknown_chat_id__"
+    with patch.object(slave, "get_chat", wraps=slave.get_chat) as get_chat, \
+            patch.dict('ehforwarderbot.coordinator.slaves', {slave.channel_id: slave}, clear=True):
+        assert chat_manager.get_chat(slave.channel_id, chat_id) is None
+        assert chat_manager.get_chat(slave.channel_id, chat_id, build_dummy=True).uid == chat_id
+        assert get_chat.call_count == 1
+    assert chat_manager.is_recent_miss((slave.channel_id, chat_id))
+
+
+def test_chat_manager_slave_circuit_open(chat_manager, channel, slave):
+    chat_id = "__circuit_open_chat_id__"
+    assert chat_manager.db.get_slave_chat_info(slave.channel_id, chat_id) is None
+    breaker = chat_manager.get_breaker(slave.channel_id)
+    breaker.opened_at = time.monotonic()
+    with patch.object(slave, "get_chat", wraps=slave.get_chat) as get_chat, \
+            patch.dict('ehforwarderbot.coordinator.slaves', {slave.channel_id: slave}, clear=True):
+        dummy = chat_manager.get_chat(slave.channel_id, chat_id, build_dummy=True)
+        assert not get_chat.called
+    assert dummy.name == chat_id
+    assert chat_manager.get_cache_key(dummy) not in chat_manager.cache
+
+    # Breakers are not shared by other managers
+    with patch.dict('ehforwarderbot.coordinator.slaves', {}, clear=True):
+        other = ChatObjectCacheManager(channel)
+    assert not other.get_breaker(slave.channel_id).is_open
+    assert not channel.chat_manager.get_breaker(slave.channel_id).is_open
+
+
+def test_chat_manager_search_chats(chat_manager, slave):
+    chats = [chat_manager.compound_enrol(i) for i in slave.get_chats()]
+    linked = chats[0]
+    linked.link("__channel_id__", "__chat_id__", False)
+    try:
+        for pattern in ("Type: Group", slave.chat_with_alias.alias, "Mode: Linked", "",
+                        re.compile("Channel: .*Type: Private", re.DOTALL | re.IGNORECASE)):
+            expected = {chat_manager.get_cache_key(i) for i in chats if i.match(pattern)}
+            found = {chat_manager.get_cache_key(i) for i in chat_manager.search_chats(pattern)}
+            assert found == expected, pattern
+    finally:
+        linked.unlink()
+
+    renamed = slave.chat_with_alias.copy()
+    renamed.name = "__renamed_chat__"
+    chat_manager.update_chat_obj(renamed)
+    assert [i.name for i in chat_manager.search_chats("__renamed_chat__")] == [renamed.name]
+    chat_manager.delete_chat_object(renamed.module_id, renamed.uid)
+    assert not tuple(chat_manager.search_chats("__renamed_chat__"))
@@ -0,0 +1,70 @@
+import re
+
+from pytest import fixture
+
+from efb_telegram_master.chat_search_index import ChatSearchIndex, required_literals
+
+ENTRIES = {
+    "a": "Channel: WeChat\nChannel ID: wechat\nName: Alice\nAlias: None\nID: alice_1\nType: Private\nMode: \n"
+         "Description: \nNotification: ALL\nOther: {}",
+    "b": "Channel: WeChat\nChannel ID: wechat\nName: Book club\nAlias: Readers\nID: group_2\nType: Group\nMode: \n"
+         "Description: Johnny and John\nNotification: NONE\nOther: {}",
+    "c": "Channel: Slack\nChannel ID: slack\nName: Bob\nAlias: None\nID: bob_3\nType: Private\nMode: \n"
+         "Description: \nNotification: ALL\nOther: {'team': 'alice'}",
+}
+
+
+@fixture
+def index():
+    index = ChatSearchIndex()
+    for key, text in ENTRIES.items():
+        index.add(key, text)
+    return index
+
+
+def check(index: ChatSearchIndex, query):
+    """Results should be the same as checking every entry."""
+    if isinstance(query, str):
+        expected = {k for k, v in ENTRIES.items() if query.lower() in v.lower()}
+        assert index.search(query) == expected
+    else:
+        expected = {k for k, v in ENTRIES.items() if query.search(v)}
+        assert expected <= index.search(query)
+    return expected
+
+
+def test_chat_search_index_string(index):
+    assert check(index, "alice") == {"a", "c"}
+    assert check(index, "BOOK CLUB") == {"b"}
+    assert check(index, "Type: Group") == {"b"}
+    assert check(index, "Channel") == {"a", "b", "c"}
+    assert check(index, "ob") == {"c"}
+    assert check(index, "nobody") == set()
+
+
+def test_chat_search_index_regex(index):
+    flags = re.DOTALL | re.IGNORECASE
+    assert check(index, re.compile("Channel: WeChat.*Type: Group", flags)) == {"b"}
+    assert check(index, re.compile("(?=.*John)(?=.*Johnny)", flags)) == {"b"}
+    assert check(index, re.compile("alice|bob", flags)) == {"a", "c"}
+    assert index.search(re.compile("(?=.*John)(?=.*Johnny)", flags)) == {"b"}
+
+
+def test_chat_search_index_update(index):
+    index.add("a", ENTRIES["a"].replace("Alice", "Carol").replace("alice", "carol"))
+    assert index.search("alice") == {"c"}
+    assert index.search("carol") == {"a"}
+    index.remove("a")
+    assert index.search("carol") == set()
+    assert len(index) == 2
+    index._compact()
+    assert sum(len(i) for i in index.postings.values()) == index.live_postings
+    assert index.search("alice") == {"c"}
+
+
+def test_required_literals():
+    flags = re.DOTALL | re.IGNORECASE
+    assert required_literals(re.compile("Channel: WeChat.*Type: Group", flags)) == \
+        ["channel: wechat", "type: group"]
+    assert required_literals(re.compile("(?=.*John)(?!.*Jane)", flags)) == ["john"]
+    assert required_literals(re.compile("ab?c|d", flags)) == []
@@ -0,0 +1,54 @@
+import threading
+import time
+
+from pytest import raises
+
+from efb_telegram_master.circuit_breaker import CircuitBreaker, CircuitOpen, CallTimeout
+
+
+def fail():
+    raise ValueError()
+
+
+def test_circuit_breaker_expected_exception():
+    breaker = CircuitBreaker("test", failure_threshold=1, expected=(KeyError,))
+
+    def not_found():
+        raise KeyError()
+
+    for _ in range(3):
+        with raises(KeyError):
+            breaker.call(not_found)
+    assert not breaker.is_open
+    assert breaker.call(lambda x: x + 1, 1) == 2
+
+
+def test_circuit_breaker_open_and_close():
+    breaker = CircuitBreaker("test", failure_threshold=2, reset_timeout=0.1)
+    for _ in range(2):
+        with raises(ValueError):
+            breaker.call(fail)
+    assert breaker.is_open
+    with raises(CircuitOpen):
+        breaker.call(lambda: None)
+
+    # Failed trial call opens the circuit again
+    time.sleep(0.15)
+    with raises(ValueError):
+        breaker.call(fail)
+    assert breaker.is_open
+
+    time.sleep(0.15)
+    assert breaker.call(lambda: "ok") == "ok"
+    assert not breaker.is_open
+
+
+def test_circuit_breaker_timeout():
+    event = threading.Event()
+    breaker = CircuitBreaker("test", failure_threshold=1, call_timeout=0.05)
+    try:
+        with raises(CallTimeout):
+            breaker.call(event.wait)
+        assert breaker.is_open
+    finally:
+        event.set()
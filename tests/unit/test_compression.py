@@ -0,0 +1,46 @@
+import pytest
+from pytest import raises
+
+from efb_telegram_master.compression import ColumnCompression, ZlibCompressor, ZstdCompressor
+
+SAMPLES = [f"Message {i} forwarded from the news channel: https://example.com/articles/{i}".encode()
+           for i in range(200)]
+
+
+@pytest.mark.parametrize("cls", [ZlibCompressor, ZstdCompressor])
+def test_column_compression_round_trip(cls):
+    if cls is ZstdCompressor:
+        pytest.importorskip("zstandard")
+    compression = ColumnCompression()
+    compression.min_size = 16
+    dictionary = cls.train(SAMPLES * 10)
+    assert dictionary, "trained dictionary should not be empty"
+
+    compression.active = cls(dict_id=1, dictionary=dictionary)
+    compression.add(compression.active)
+    data = b"Message 500 forwarded from the news channel: https://example.com/articles/500"
+    compressed = compression.compress(data)
+    assert compression.is_compressed(compressed)
+    assert len(compressed) < len(data)
+    assert compression.decompress(compressed) == data
+
+    # Values compressed without dictionary are always readable
+    compression.active = cls()
+    assert compression.decompress(compression.compress(data * 2)) == data * 2
+
+
+def test_column_compression_skipped():
+    compression = ColumnCompression()
+    assert compression.compress(b"a" * 1000) is None, "compression is disabled"
+
+    compression.active = ZlibCompressor()
+    assert compression.compress(b"a" * 10) is None, "value is shorter than min_size"
+    assert not compression.is_compressed("\xc5 text values are never compressed")
+
+
+def test_column_compression_unknown_dictionary():
+    compression = ColumnCompression()
+    compression.active = ZlibCompressor(dict_id=2, dictionary=ZlibCompressor.train(SAMPLES))
+    compressed = compression.compress(b"Message 1 forwarded from the news channel" * 5)
+    with raises(ValueError):
+        ColumnCompression().decompress(compressed)
@@ -0,0 +1,69 @@
+from types import SimpleNamespace
+
+from pytest import fixture
+
+from efb_telegram_master.chat_binding import ChatListStorage
+from efb_telegram_master.commands import ETMCommandMsgStorage
+from efb_telegram_master.conversation_store import ConversationStore
+from efb_telegram_master.utils import TelegramChatID, TelegramMessageID
+
+
+@fixture(scope="function")
+def store(channel, tmp_path):
+    store = ConversationStore(channel)
+    store.path = tmp_path / "conversations.pickle"
+    yield store
+    store.persist = False
+    store.stop()
+
+
+def key(message_id: int):
+    return TelegramChatID(0), TelegramMessageID(message_id)
+
+
+def test_conversation_store_expiry(store):
+    handler = SimpleNamespace(conversations={})
+    store.add_handler("test", handler)
+    store[key(1)] = "expired"
+    handler.conversations[key(1)] = 1
+    store[key(2)] = "alive"
+    handler.conversations[key(2)] = 1
+    store.entries[key(1)] = (0, "expired")
+    store.sweep()
+    assert key(1) not in store
+    assert key(1) not in handler.conversations, "State of the conversation should expire together"
+    assert store[key(2)] == "alive"
+    assert key(2) in handler.conversations
+
+
+def test_conversation_store_size(store):
+    store.size = 2
+    store[key(1)] = 1
+    store[key(2)] = 2
+    assert store[key(1)] == 1  # Reading makes it recently used
+    store[key(3)] = 3
+    assert set(store) == {key(1), key(3)}
+
+
+def test_conversation_store_persist(store, channel, slave):
+    handler = SimpleNamespace(conversations={})
+    store.add_handler("test", handler)
+    chats = [channel.chat_manager.compound_enrol(i) for i in slave.get_chats()[:3]]
+    store[key(1)] = ChatListStorage(chats)
+    store[key(2)] = ETMCommandMsgStorage([], slave, "prefix", "body")
+    handler.conversations[key(1)] = 1
+    store.persist = True
+    store.save()
+
+    loaded = ConversationStore(channel)
+    loaded.path = store.path
+    loaded.persist = True
+    loaded_handler = SimpleNamespace(conversations={})
+    loaded.add_handler("test", loaded_handler)
+    loaded.load()
+    loaded.sweep_timer.cancel()
+    assert loaded[key(1)].chats == chats
+    assert loaded[key(1)].chats[0] is channel.chat_manager.get_chat(chats[0].module_id, chats[0].uid)
+    assert loaded[key(1)].channels[slave.channel_id] is slave
+    assert loaded[key(2)].module is slave
+    assert loaded_handler.conversations == {key(1): 1}
@@ -0,0 +1,58 @@
+import sqlite3
+import time
+
+from pytest import fixture, raises
+
+from efb_telegram_master.db_backup import DatabaseBackup, BackupCancelled
+
+
+@fixture(scope="function")
+def source(tmp_path):
+    conn = sqlite3.connect(str(tmp_path / "tgdata.db"), isolation_level=None)
+    conn.execute("PRAGMA journal_mode = wal")
+    conn.execute("CREATE TABLE t (x)")
+    conn.executemany("INSERT INTO t VALUES (?)", [(b"x" * 1000,)] * 500)
+    yield conn
+    conn.close()
+
+
+def test_backup_snapshot(tmp_path, source, monkeypatch):
+    backup = DatabaseBackup(tmp_path / "backups", max_rate_kib=1024 * 1024, step_kib=16)
+    writer = sqlite3.connect(str(tmp_path / "tgdata.db"), isolation_level=None)
+    # Write from another connection while the backup is throttled
+    monkeypatch.setattr(time, "sleep", lambda _: writer.execute("INSERT INTO t VALUES (?)", (b"y" * 1000,)))
+    monkeypatch.setattr(time, "monotonic", lambda: 0)
+
+    assert backup.acquire()
+    assert not backup.acquire(), "only one backup should run at a time"
+    path = backup.run(source)
+    copy = sqlite3.connect(str(path))
+    assert copy.execute("SELECT COUNT(*) FROM t").fetchone()[0] == 500, "backup should be a consistent snapshot"
+    assert copy.execute("PRAGMA journal_mode").fetchone()[0] == "delete"
+    assert source.execute("SELECT COUNT(*) FROM t").fetchone()[0] > 500
+    assert backup.status["pages_copied"] == backup.status["pages_total"]
+    assert not backup.status["running"]
+    assert backup.backups() == [path]
+    writer.close()
+    copy.close()
+
+
+def test_backup_cancel(tmp_path, source):
+    backup = DatabaseBackup(tmp_path / "backups", max_rate_kib=0, step_kib=16)
+    assert backup.acquire()
+    backup.cancel()
+    with raises(BackupCancelled):
+        backup.run(source)
+    assert backup.status["error"]
+    assert not backup.backups()
+    assert not list((tmp_path / "backups").iterdir()), "partial backup should be removed"
+    assert backup.acquire(), "a new backup should be allowed after cancellation"
+
+
+def test_backup_prune(tmp_path):
+    backup = DatabaseBackup(tmp_path, keep=2)
+    for name in ("tgdata_20260101_000000.db", "tgdata_20260102_000000.db", "tgdata_20260103_000000.db",
+                 "tgdata.db"):
+        (tmp_path / name).touch()
+    assert [i.name for i in backup.prune()] == ["tgdata_20260101_000000.db"]
+    assert (tmp_path / "tgdata.db").exists()
@@ -0,0 +1,58 @@
+import datetime
+from threading import Event
+
+from telegram import Chat, Message
+
+from ehforwarderbot import coordinator
+from ehforwarderbot.constants import MsgType
+from ehforwarderbot.types import MessageID
+from efb_telegram_master import utils
+from efb_telegram_master.db import MsgLog
+from efb_telegram_master.message import ETMMsg
+
+
+def test_db_worker_survives_task_error(channel):
+    db = channel.db
+    done = Event()
+
+    def fail():
+        raise ValueError("Error in task")
+
+    db.add_task(fail, (), {})
+    db.add_task(done.set, (), {})
+    assert done.wait(5), "Tasks after a failed one should still run"
+    assert db.worker_thread.is_alive()
+
+
+def test_db_edit_keeps_chat_activity(channel, slave):
+    db = channel.db
+    chat = channel.chat_manager.get_chat(slave.channel_id, slave.chat_with_alias.uid)
+    msg = ETMMsg(chat=chat, author=chat, deliver_to=coordinator.master, text="Text",
+                 uid=MessageID("__edit_activity__"), type=MsgType.Text)
+    tg_msg = Message(1, datetime.datetime.now(), Chat(1, Chat.PRIVATE))
+    db.add_or_update_message_log(msg, tg_msg)
+    db.flush_message_log()
+    chat_uid = utils.chat_id_to_str(chat=chat)
+    sent_time = db.get_last_message_time(chat_uid)
+
+    msg.text = "Edited text"
+    edited = Message(1, tg_msg.date, Chat(1, Chat.PRIVATE), edit_date=datetime.datetime.now())
+    db.add_or_update_message_log(msg, edited)
+    db.flush_message_log()
+    assert db.get_last_message_time(chat_uid) == sent_time
+    assert db.get_msg_log(master_msg_id=utils.message_id_to_str(1, 1)).text == "Edited text"
+
+
+def test_db_backfill_master_chat_id(channel, slave, monkeypatch):
+    db = channel.db
+    chat = channel.chat_manager.get_chat(slave.channel_id, slave.chat_with_alias.uid)
+    for i in range(3):
+        msg = ETMMsg(chat=chat, author=chat, deliver_to=coordinator.master, text="Text",
+                     uid=MessageID(f"__backfill_{i}__"), type=MsgType.Text)
+        db.add_or_update_message_log(msg, Message(10 + i, datetime.datetime.now(), Chat(2, Chat.PRIVATE)))
+    db.flush_message_log()
+    MsgLog.update(master_chat_id=None).execute()
+    monkeypatch.setattr(db, "MIGRATION_BATCH_SIZE", 1)
+    db._backfill_master_chat_id()
+    assert not MsgLog.select().where(MsgLog.master_chat_id.is_null()).exists()
+    assert MsgLog.get(MsgLog.master_msg_id == utils.message_id_to_str(2, 10)).master_chat_id == 2
@@ -1,7 +1,8 @@
+import pickle
 import re
-from pytest import fixture
+from pytest import fixture, raises
 from efb_telegram_master.chat import convert_chat, ETMPrivateChat, ETMChatMember, ETMSelfChatMember, ETMSystemChat, \
-    ETMSystemChatMember, ETMGroupChat, unpickle
+    ETMSystemChatMember, ETMGroupChat, unpickle, unpickle_member
 from ehforwarderbot.chat import PrivateChat, SystemChat, GroupChat
 
 
@@ -122,6 +123,20 @@ def test_etm_chat_pickle(db, slave):
     assert chat.db is recovered.db
 
 
+def test_etm_chat_legacy_group_pickle(db, slave):
+    group = convert_chat(db, slave.group)
+    db.delete_chat_members(group.module_id, group.uid)
+    recovered = unpickle(pickle.dumps(group), db)
+    assert len(recovered.members) == len(group.members)
+
+    # Members are moved to the member table, and the chat is rewritten without them
+    db.task_queue.join()
+    assert len(db.get_chat_members(group.module_id, group.uid)) == len(group.members)
+    row = db.get_slave_chat_info(group.module_id, group.uid)
+    assert not pickle.loads(row.pickle).members
+    assert len(unpickle(row.pickle, db).members) == len(group.members)
+
+
 def test_etm_chat_copy(db, slave):
     chat = convert_chat(db, chat=slave.chat_with_alias)
     copied = chat.copy()
@@ -130,3 +145,69 @@ def test_etm_chat_copy(db, slave):
     for i in attributes:
         assert getattr(chat, i) == getattr(copied, i)
     assert chat.db is copied.db
+
+
+def test_etm_chat_member_index(db, slave):
+    group = convert_chat(db, slave.group)
+    for i in group.members:
+        assert group.get_member(i.uid) is i
+
+    added = group.add_member(name="Added member", uid="__added_member__")
+    assert group.get_member(added.uid) is added
+    system = group.add_system_member(name="System member", uid="__system_member__")
+    assert group.get_member(system.uid) is system
+
+    # Replacing the list of members
+    group.members = [i for i in group.members if i is not added]
+    with raises(KeyError):
+        group.get_member(added.uid)
+    assert group.get_member(system.uid) is system
+
+    # Changing ID of a member
+    system.uid = "__renamed_member__"
+    group.rebuild_member_index()
+    assert group.get_member(system.uid) is system
+    with raises(KeyError):
+        group.get_member("__system_member__")
+
+    # Index is rebuilt after unpickling
+    recovered = pickle.loads(pickle.dumps(group))
+    recovered.db = db
+    assert '_member_index' not in group.__getstate__()
+    for i in recovered.members:
+        assert recovered.get_member(i.uid) is i
+
+
+def test_etm_chat_member_compact(db, slave):
+    group = convert_chat(db, slave.group)
+    member = next(i for i in group.members if not i.vendor_specific)
+    assert member.db is db
+    assert 'db' not in member.__dict__
+    assert member.__dict__['vendor_specific'] is None
+    assert member.vendor_specific == {}
+
+    # Pickles are compatible with plain members
+    cls, state = pickle.loads(member.pickle)
+    assert type(state['vendor_specific']) is dict
+    assert 'db' not in state
+    recovered = unpickle_member(member.pickle, group, db)
+    assert recovered.db is db
+    assert recovered.chat is group
+    assert recovered.__dict__['vendor_specific'] is None
+    assert recovered.module_id is member.module_id
+    for i in ('module_id', 'module_name', 'channel_emoji', 'uid', 'name', 'alias', 'description'):
+        assert getattr(recovered, i) == getattr(member, i)
+
+
+def test_etm_chat_member_vendor_specific_write(db, slave):
+    group = convert_chat(db, slave.group)
+    members = [i for i in group.members if not i.vendor_specific]
+    member, other = members[0], members[1]
+    member.vendor_specific['key'] = "value"
+    assert member.vendor_specific == {'key': "value"}
+    assert other.vendor_specific == {}
+    member.vendor_specific.update(other="value")
+    assert member.vendor_specific == {'key': "value", 'other': "value"}
+
+    recovered = unpickle_member(member.pickle, group, db)
+    assert recovered.vendor_specific == member.vendor_specific
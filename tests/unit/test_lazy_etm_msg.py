@@ -0,0 +1,34 @@
+import pickle
+
+from ehforwarderbot import MsgType
+
+from efb_telegram_master.message import LazyETMMsg
+
+
+def test_lazy_etm_msg_resolve_on_access():
+    resolved = []
+
+    def resolve_reactions():
+        resolved.append("reactions")
+        return {"👍": []}
+
+    msg = LazyETMMsg({"reactions": resolve_reactions, "is_system": lambda: True},
+                     uid="__msg_id__", text="text", type=MsgType.Text)
+    assert not resolved
+    assert msg.reactions == {"👍": []}
+    assert msg.reactions is msg.reactions, "resolved value should be kept"
+    assert resolved == ["reactions"]
+    assert msg.is_system is True
+
+    msg = LazyETMMsg({"reactions": resolve_reactions}, uid="__msg_id__")
+    msg.reactions = {}
+    assert msg.reactions == {}, "assigned value should discard the resolver"
+    assert resolved == ["reactions"]
+
+
+def test_lazy_etm_msg_pickle():
+    msg = LazyETMMsg({"substitutions": lambda: None, "is_system": lambda: True}, uid="__msg_id__")
+    restored = pickle.loads(pickle.dumps(msg))
+    assert restored.is_system is True
+    assert restored.substitutions is None
+    assert restored.uid == "__msg_id__"
@@ -0,0 +1,47 @@
+import types
+
+from pytest import fixture
+
+from efb_telegram_master.msg_log_cache import MsgLogCache
+
+
+def make_log(master_msg_id, slave_message_id, slave_origin_uid="slave __chat__"):
+    return types.SimpleNamespace(master_msg_id=master_msg_id, slave_message_id=slave_message_id,
+                                 slave_origin_uid=slave_origin_uid)
+
+
+@fixture(scope="function")
+def cache():
+    return MsgLogCache(2)
+
+
+def test_msg_log_cache_lookup(cache):
+    log = make_log("1.1", "m1")
+    cache.put(log, cache.generation)
+    assert cache.get(master_msg_id="1.1") is log
+    assert cache.get(slave_msg_id="m1", slave_origin_uid="slave __chat__") is log
+    assert cache.get(slave_msg_id="m1", slave_origin_uid="slave __other__") is None
+    assert cache.stats()["hits"] == 2
+    assert cache.stats()["misses"] == 1
+
+
+def test_msg_log_cache_eviction(cache):
+    cache.put(make_log("1.1", "m1"), cache.generation)
+    cache.put(make_log("1.2", "m2"), cache.generation)
+    assert cache.get(master_msg_id="1.1") is not None
+    cache.put(make_log("1.3", "m3"), cache.generation)
+    assert cache.get(master_msg_id="1.2") is None, "least recently used entry should be evicted"
+    assert cache.get(slave_msg_id="m2", slave_origin_uid="slave __chat__") is None
+    assert cache.get(master_msg_id="1.1") is not None
+    assert cache.stats()["size"] == 2
+
+
+def test_msg_log_cache_invalidate(cache):
+    cache.put(make_log("1.1", "m1"), cache.generation)
+    cache.invalidate(slave_msg_id="m1", slave_origin_uid="slave __chat__")
+    assert cache.get(master_msg_id="1.1") is None
+
+    generation = cache.generation
+    cache.invalidate(master_msg_id="1.2")
+    cache.put(make_log("1.2", "m2"), generation)
+    assert cache.get(master_msg_id="1.2") is None, "row read before a write should not be cached"
@@ -0,0 +1,63 @@
+import pickle
+
+from pytest import raises
+
+from ehforwarderbot.message import LinkAttribute, LocationAttribute, StatusAttribute, MessageCommand, \
+    MessageCommands
+from efb_telegram_master.msg_log_codec import encode, decode, is_encoded
+
+
+def test_msg_log_codec_round_trip():
+    data = {
+        "target": "-1001234567890.123",
+        "is_system": True,
+        "commands": MessageCommands([
+            MessageCommand("Accept", "accept", args=(1, "a", None), kwargs={"b": [1.5, b"\x00"]}),
+            MessageCommand("Decline", "decline"),
+        ]),
+        "substitutions": {(0, 5): "__channel_id__ __chat_id__ __group_id__"},
+        "reactions": {"👍": ("__channel_id__ __chat_id__",), "❤️": ()},
+    }
+    encoded = encode(data)
+    assert is_encoded(encoded)
+    decoded = decode(encoded)
+    assert decoded['target'] == data['target']
+    assert decoded['is_system'] is True
+    assert [(i.name, i.callable_name, i.args, i.kwargs) for i in decoded['commands']] == \
+        [("Accept", "accept", (1, "a", None), {"b": [1.5, b"\x00"]}), ("Decline", "decline", (), {})]
+    assert decoded['substitutions'] == data['substitutions']
+    assert decoded['reactions'] == data['reactions']
+    assert len(encoded) < len(pickle.dumps(data)), "encoded data should be smaller than pickle"
+
+
+def test_msg_log_codec_attributes():
+    attributes = [
+        LinkAttribute("title", description=None, image="https://example.com/a.png", url="https://example.com/"),
+        LocationAttribute(latitude=1.5, longitude=-2.25),
+        StatusAttribute(StatusAttribute.Types.TYPING, timeout=3000),
+    ]
+    for attribute in attributes:
+        decoded = decode(encode({"attributes": attribute}))['attributes']
+        assert type(decoded) is type(attribute)
+        assert decoded.__dict__ == attribute.__dict__
+
+
+def test_msg_log_codec_selected_fields():
+    encoded = encode({"target": "1.2", "reactions": {"👍": ("a b",)}})
+    assert decode(encoded, fields=("reactions",)) == {"reactions": {"👍": ("a b",)}}
+
+
+def test_msg_log_codec_legacy_pickle():
+    data = {"target": "1.2", "attributes": LocationAttribute(latitude=1.5, longitude=-2.25)}
+    legacy = pickle.dumps(data)
+    assert not is_encoded(legacy)
+    assert decode(legacy)['target'] == "1.2"
+    assert decode(legacy, fields=("target",)) == {"target": "1.2"}
+
+
+def test_msg_log_codec_malformed():
+    encoded = encode({"target": "1.2"})
+    with raises(pickle.UnpicklingError):
+        decode(encoded[:-1])
+    with raises(pickle.UnpicklingError):
+        decode(encoded + b"\x01")
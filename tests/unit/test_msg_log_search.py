@@ -0,0 +1,18 @@
+from efb_telegram_master.msg_log_search import parse_query, excerpt
+
+
+def test_parse_query():
+    assert parse_query("hello  world hello") == ('"hello" "world"', [])
+    assert parse_query('say "hi" OR NOT') == ('"say" """hi""" "NOT"', ["OR"])
+    assert parse_query("世界 你好世界") == ('"你好世界"', ["世界"])
+    assert parse_query("   ") == (None, [])
+
+
+def test_excerpt():
+    assert excerpt("short\ntext", "text") == "short text"
+    text = "a" * 100 + " needle " + "b" * 100
+    result = excerpt(text, "NEEDLE", width=40)
+    assert len(result) == 40
+    assert "needle" in result
+    assert result.startswith("…") and result.endswith("…")
+    assert excerpt(text, "missing", width=40).startswith("a" * 39)
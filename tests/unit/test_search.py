@@ -0,0 +1,29 @@
+import datetime
+from unittest.mock import MagicMock, patch
+
+from telegram import Bot, CallbackQuery, Chat, Message, Update, User
+
+
+def build_message(bot: Bot, chat: Chat, message_id: int, text: str, **kwargs) -> Message:
+    return Message(message_id, datetime.datetime.now(), chat, text=text, bot=bot, **kwargs)
+
+
+def test_search_page_in_private_chat(channel, bot_admin):
+    bot = MagicMock(spec=Bot, defaults=None)
+    chat = Chat(bot_admin, Chat.PRIVATE)
+    user = User(bot_admin, "Admin", False)
+    command = build_message(bot, chat, 1, "/search hello world")
+    channel.search(Update(1, message=command), MagicMock(args=["hello", "world"]))
+    assert bot.send_message.call_args[1]['reply_to_message_id'] == command.message_id
+
+    # Pages are built from the command the results reply to
+    results = build_message(bot, chat, 2, bot.send_message.call_args[1]['text'], reply_to_message=command)
+    query = CallbackQuery("1", user, "instance", message=results, data="search 10", bot=bot)
+    with patch.object(channel.bot_manager, "edit_message_text") as edit_message_text, \
+            patch.object(channel.bot_manager, "answer_callback_query"), \
+            patch.object(channel.bot_manager, "session_expired") as session_expired, \
+            patch.object(channel, "build_search_results", return_value=("", None)) as build_search_results:
+        channel.search_page(Update(2, callback_query=query), MagicMock())
+    assert not session_expired.called
+    build_search_results.assert_called_once_with(bot_admin, "hello world", 10)
+    assert edit_message_text.call_args[1]['message_id'] == results.message_id
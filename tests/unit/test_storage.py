@@ -0,0 +1,166 @@
+"""Conformance tests of storage backends of ``DatabaseManager``."""
+
+import datetime
+from types import SimpleNamespace
+
+from pytest import fixture, importorskip, raises
+
+from efb_telegram_master.db import DatabaseManager, SQLiteStorage
+
+T0 = datetime.datetime(2026, 1, 1, 12, 0, 0)
+
+
+def make_sqlite(path):
+    storage = SQLiteStorage(path / "tgdata.db", DatabaseManager.DEFAULT_PRAGMAS)
+    DatabaseManager._create()
+    return storage
+
+
+def make_lmdb(path):
+    importorskip("lmdb")
+    from efb_telegram_master.lmdb_storage import LMDBStorage
+    return LMDBStorage(path / "tgdata.lmdb", {"map_size_mib": 64})
+
+
+@fixture(scope="function", params=[make_sqlite, make_lmdb], ids=["sqlite", "lmdb"])
+def storage(request, tmp_path):
+    storage = request.param(tmp_path)
+    yield storage
+    storage.close()
+
+
+def make_log(master_msg_id, slave_message_id, slave_origin_uid="slave __chat__", time=T0, **kwargs):
+    data = {
+        "master_msg_id": master_msg_id,
+        "master_msg_id_alt": None,
+        "master_chat_id": int(master_msg_id.split(".")[0]),
+        "text": f"Text of {slave_message_id}",
+        "slave_origin_uid": slave_origin_uid,
+        "slave_member_uid": "slave __member__",
+        "msg_type": "Text",
+        "sent_to": "slave",
+        "slave_message_id": slave_message_id,
+        "media_type": "Text",
+        "file_id": None,
+        "file_unique_id": None,
+        "mime": None,
+        "pickle": None,
+        "time": time,
+    }
+    data.update(kwargs)
+    return data
+
+
+def make_member(member_uid, pickle=b"member", group_id="group"):
+    return {"module_id": "slave", "group_id": group_id, "member_uid": member_uid, "pickle": pickle}
+
+
+def test_chat_assoc(storage):
+    storage.add_chat_assoc("master 1", "slave a")
+    storage.add_chat_assoc("master 1", "slave b")
+    assert list(storage.get_chat_assocs()) == [("master 1", "slave b")], "master chat should be singly linked"
+    storage.add_chat_assoc("master 1", "slave a", multiple_slave=True)
+    storage.add_chat_assoc("master 2", "slave c", multiple_slave=True)
+    assert list(storage.get_chat_assocs()) == [("master 1", "slave b"), ("master 1", "slave a"),
+                                               ("master 2", "slave c")]
+    storage.add_chat_assoc("master 2", "slave a", multiple_slave=True)
+    assert ("master 1", "slave a") not in list(storage.get_chat_assocs()), "slave chat should be moved"
+
+    assert storage.migrate_chat_assoc("master 2", "master 1") == 2
+    assert sorted(storage.get_chat_assocs()) == [("master 1", "slave a"), ("master 1", "slave b"),
+                                                 ("master 1", "slave c")]
+    assert storage.remove_chat_assoc(slave_uid="slave b") == 1
+    assert storage.remove_chat_assoc(master_uid="master 1") == 2
+    assert list(storage.get_chat_assocs()) == []
+
+
+def test_msg_log_upsert(storage):
+    storage.upsert_msg_logs([make_log("1.1", "m1", pickle=b"misc")])
+    later = T0 + datetime.timedelta(minutes=1)
+    storage.upsert_msg_logs([make_log("1.1", "m1", text="Edited", time=later)])
+    log = storage.get_msg_log(master_msg_id="1.1")
+    assert log.text == "Edited"
+    assert log.time == T0, "time of existing message log should be kept"
+    assert log.pickle == b"misc", "misc data should be kept if not provided"
+    assert log.master_chat_id == 1
+    assert storage.get_msg_log(master_msg_id="1.2") is None
+
+    storage.upsert_msg_logs([make_log("1.1", "m2", text="Edited again")])
+    assert storage.get_msg_log(slave_msg_id="m2", slave_origin_uid="slave __chat__").text == "Edited again"
+    assert storage.get_msg_log(slave_msg_id="m1", slave_origin_uid="slave __chat__") is None, \
+        "lookup by old slave message ID should not find the updated log"
+
+
+def test_msg_log_lookup_latest(storage):
+    storage.upsert_msg_logs([
+        make_log("1.1", "m1", time=T0),
+        make_log("1.3", "m1", time=T0 + datetime.timedelta(seconds=2)),
+        make_log("1.2", "m1", time=T0 + datetime.timedelta(seconds=1)),
+        make_log("1.4", "m1", slave_origin_uid="slave __other__", time=T0 + datetime.timedelta(seconds=3)),
+    ])
+    assert storage.get_msg_log(slave_msg_id="m1", slave_origin_uid="slave __chat__").master_msg_id == "1.3"
+    assert storage.get_last_message("slave __chat__").master_msg_id == "1.3"
+    assert storage.get_last_message("slave __other__").master_msg_id == "1.4"
+    assert storage.get_last_message("slave __none__") is None
+
+    storage.delete_msg_log(slave_msg_id="m1", slave_origin_uid="slave __chat__")
+    assert storage.get_msg_log(slave_msg_id="m1", slave_origin_uid="slave __chat__") is None
+    assert storage.get_msg_log(master_msg_id="1.4") is not None
+    storage.delete_msg_log(master_msg_id="1.4")
+    assert storage.get_msg_log(master_msg_id="1.4") is None
+
+
+def test_recent_chats_and_activity(storage):
+    storage.upsert_msg_logs([
+        make_log("-1001.1", "m1", slave_origin_uid="slave a", time=T0),
+        make_log("-1001.2", "m2", slave_origin_uid="slave b", time=T0 + datetime.timedelta(seconds=1)),
+        make_log("-1001.3", "m3", slave_origin_uid="slave c", time=T0 + datetime.timedelta(seconds=2)),
+        make_log("2.1", "m4", slave_origin_uid="slave d", time=T0 + datetime.timedelta(seconds=3)),
+    ])
+    storage.upsert_msg_logs([make_log("-1001.4", "m5", slave_origin_uid="slave a",
+                                      time=T0 + datetime.timedelta(seconds=4))])
+    assert storage.get_recent_slave_chats(-1001, 2) == ["slave a", "slave c"]
+    assert storage.get_recent_slave_chats(2, 5) == ["slave d"]
+
+    storage.upsert_msg_logs([make_log("-1001.0", "m0", slave_origin_uid="slave a", time=T0)])
+    activity = storage.get_chat_activity()
+    assert activity["slave a"] == T0 + datetime.timedelta(seconds=4), "last message time should not move back"
+    assert activity["slave d"] == T0 + datetime.timedelta(seconds=3)
+
+
+def test_slave_chat_info(storage):
+    row = {
+        "slave_channel_id": "slave", "slave_channel_emoji": "S", "slave_chat_uid": "chat",
+        "slave_chat_group_id": None, "slave_chat_name": "Chat", "slave_chat_alias": None,
+        "slave_chat_type": "Private", "pickle": b"chat",
+    }
+    storage.set_slave_chat_info([row])
+    storage.set_slave_chat_info([dict(row, slave_chat_name="Renamed", pickle=b"renamed")])
+    info = storage.get_slave_chat_info("slave", "chat")
+    assert info.slave_chat_name == "Renamed"
+    assert info.pickle == b"renamed"
+    assert storage.get_slave_chat_info("slave", "chat", "group") is None
+    assert storage.delete_slave_chat_info("slave", "chat") == 1
+    assert storage.get_slave_chat_info("slave", "chat") is None
+
+
+def test_chat_members(storage):
+    storage.set_slave_chat_info([], [make_member("b"), make_member("a"), make_member("c", group_id="other")])
+    storage.set_chat_members([make_member("c"), make_member("a", pickle=b"updated")])
+    members = storage.get_chat_members("slave", "group")
+    assert [i.member_uid for i in members] == ["b", "a", "c"], "members should be in the order they are added"
+    assert bytes(members[1].pickle) == b"updated"
+
+    storage.delete_chat_members("slave", "group", ["a", "x"])
+    assert [i.member_uid for i in storage.get_chat_members("slave", "group")] == ["b", "c"]
+    storage.delete_chat_members("slave", "group")
+    assert storage.get_chat_members("slave", "group") == []
+    assert [i.member_uid for i in storage.get_chat_members("slave", "other")] == ["c"]
+
+
+def test_lmdb_refuses_sqlite_only_config(tmp_path, monkeypatch):
+    monkeypatch.setenv("EFB_DATA_PATH", str(tmp_path))
+    channel = SimpleNamespace(channel_id="blueset.telegram",
+                              config={"database": {"backend": "lmdb", "retention": {"hot_days": 30}}})
+    with raises(ValueError, match="retention"):
+        DatabaseManager(channel)
@@ -4,7 +4,7 @@ from io import BytesIO
 from pytest import raises
 
 from efb_telegram_master.utils import b64de, b64en, message_id_to_str, \
-    message_id_str_to_id, chat_id_str_to_id, chat_id_to_str, convert_tgs_to_gif
+    message_id_str_to_id, chat_id_str_to_id, chat_id_to_str, convert_tgs_to_gif, message_link
 
 
 def test_flag(channel):
@@ -31,6 +31,12 @@ def test_message_id_str_conversion():
         message_id_to_str(chat_id=chat_id, message_id=message_id))
 
 
+def test_message_link():
+    assert message_link("-1001234567890", "42") == "https://t.me/c/1234567890/42"
+    assert message_link("-1234567", "42") is None
+    assert message_link("1234567", "42") is None
+
+
 def test_chat_id_str_conversion():
     channel_id = "__channel_id__"
     chat_id = "__chat_id__"